@@ -7,12 +7,21 @@ Runs once: fetches resources, prompts for comma-separated selection, then delete
 Production-ready: minimal logging, no debug statements.
 """
 
+import argparse
 import boto3
-import time
 from botocore.exceptions import ClientError
 
+from resource_selector import SYNTAX, ResourceIndex
+from resource_waiter import ResourceWaiter
+
+DELETE_TIMEOUT = 150     # seconds to wait for a guardrail, agent or alias to disappear
+KB_DELETE_TIMEOUT = 300  # knowledge bases and their data sources take longer
+MAX_POLL_INTERVAL = 10
+DEFAULT_WORKERS = 10     # delete and status calls in flight at once
+
 class BedrockResourceCleaner:
-    def __init__(self):
+    def __init__(self, max_workers=DEFAULT_WORKERS):
+        self.max_workers = max_workers
         session = boto3.session.Session()
         region = session.region_name or "us-east-1"
         supported = ["us-east-1", "us-west-2", "ap-northeast-1", "ap-southeast-2", "eu-central-1"]
@@ -42,6 +51,7 @@ class BedrockResourceCleaner:
                         "name": g.get("name", ""),
                         "id":   g["id"],
                         "status": g.get("status", ""),
+                        "created": g.get("createdAt"),
                         "delete_fn": self.delete_guardrail
                     })
                     idx += 1
@@ -95,6 +105,7 @@ class BedrockResourceCleaner:
                         "name": job.get("jobName", ""),
                         "id":   job["jobArn"],
                         "status": job.get("status", ""),
+                        "created": job.get("creationTime"),
                         "delete_fn": self.delete_model_customization_job
                     })
                     idx += 1
@@ -141,6 +152,7 @@ class BedrockResourceCleaner:
                         "name": pt.get("provisionedModelName", ""),
                         "id":   pt["provisionedModelArn"],
                         "status": pt.get("status", ""),
+                        "created": pt.get("creationTime"),
                         "delete_fn": self.delete_provisioned_model_throughput
                     })
                     idx += 1
@@ -184,133 +196,138 @@ class BedrockResourceCleaner:
             return False
 
     def delete_resources(self, resources):
-        # delete knowledge bases last
-        resources.sort(key=lambda x: x["type"] == "Knowledge Base")
+        """Tear down every selected resource concurrently.
+
+        Every delete call and status check goes through one waiter, which caps the calls in
+        flight at max_workers. All aliases of an agent and all data sources of a knowledge
+        base are deleted in parallel; the parent goes once they are gone. Knowledge bases
+        are still deleted last, after the selected agents that may use them.
+        """
+        waiter = ResourceWaiter(max_delay=MAX_POLL_INTERVAL, max_concurrent_calls=self.max_workers)
+        agent_keys = [("agent", r["id"]) for r in resources if r["type"] == "Agent"]
         for r in resources:
-            try:
-                r["delete_fn"](r)
-            except ClientError as e:
-                print(f"Error deleting {r['type']} {r['name']}: {e}")
+            if r["type"] == "Knowledge Base":
+                waiter.after(agent_keys, lambda r=r: r["delete_fn"](r, waiter))
+            else:
+                r["delete_fn"](r, waiter)
+        if waiter.run():
+            print(waiter.summary())
 
-    def delete_guardrail(self, r):
+    def delete_guardrail(self, r, waiter):
         print(f"Deleting guardrail {r['name']}...")
-        self.bedrock.delete_guardrail(guardrailIdentifier=r["id"])
-        self._wait_for_guardrail_deletion(r["id"])
+        waiter.watch(("guardrail", r["id"]), lambda: self._guardrail_deleted(r["id"]),
+                     start=lambda: self.bedrock.delete_guardrail(guardrailIdentifier=r["id"]),
+                     timeout=DELETE_TIMEOUT, label=f"Guardrail {r['name']}")
 
-    def delete_knowledge_base(self, r):
+    def delete_knowledge_base(self, r, waiter):
         kb_id = r["id"]
         print(f"Deleting knowledge base {r['name']}...")
+        ds_keys = []
         for ds in r.get("data_sources", []):
-            ds_id = ds["id"]
-            try:
-                resp = self.agent.get_data_source(knowledgeBaseId=kb_id, dataSourceId=ds_id)
-                status = resp.get("dataSource", {}).get("status", "")
-            except ClientError:
-                status = ""
-            if status == "DELETE_UNSUCCESSFUL":
-                self.update_data_source_deletion_policy(kb_id, ds_id, policy="RETAIN")
-            try:
-                self.agent.delete_data_source(knowledgeBaseId=kb_id, dataSourceId=ds_id)
-                self._wait_for_data_source_deletion(kb_id, ds_id)
-            except ClientError as e:
-                print(f"Error deleting data source {ds_id}: {e}")
+            key = ("data source", kb_id, ds["id"])
+            waiter.watch(key, lambda ds_id=ds["id"]: self._data_source_deleted(kb_id, ds_id),
+                         start=lambda ds_id=ds["id"]: self._start_data_source_deletion(kb_id, ds_id),
+                         timeout=KB_DELETE_TIMEOUT, label=f"Data source {ds['name'] or ds['id']}")
+            ds_keys.append(key)
+
+        def start_kb_deletion():
+            waiter.watch(("knowledge base", kb_id), lambda: self._knowledge_base_deleted(kb_id),
+                         start=lambda: self.agent.delete_knowledge_base(knowledgeBaseId=kb_id),
+                         timeout=KB_DELETE_TIMEOUT, label=f"Knowledge base {r['name']}")
+
+        waiter.after(ds_keys, start_kb_deletion)
+
+    def _start_data_source_deletion(self, kb_id, ds_id):
         try:
-            self.agent.delete_knowledge_base(knowledgeBaseId=kb_id)
-            self._wait_for_knowledge_base_deletion(kb_id)
-        except ClientError as e:
-            print(f"Error deleting knowledge base {kb_id}: {e}")
+            resp = self.agent.get_data_source(knowledgeBaseId=kb_id, dataSourceId=ds_id)
+            status = resp.get("dataSource", {}).get("status", "")
+        except ClientError:
+            status = ""
+        if status == "DELETE_UNSUCCESSFUL":
+            self.update_data_source_deletion_policy(kb_id, ds_id, policy="RETAIN")
+        self.agent.delete_data_source(knowledgeBaseId=kb_id, dataSourceId=ds_id)
 
-    def delete_model_customization_job(self, r):
+    def delete_model_customization_job(self, r, waiter):
         print(f"Stopping model customization job {r['name']}...")
-        self.bedrock.stop_model_customization_job(jobIdentifier=r["id"])
+        waiter.watch(("model customization job", r["id"]),
+                     start=lambda: self.bedrock.stop_model_customization_job(jobIdentifier=r["id"]),
+                     label=f"Model customization job {r['name']}")
 
-    def delete_agent(self, r):
+    def delete_agent(self, r, waiter):
         print(f"Deleting agent {r['name']}...")
+        alias_keys = []
         for ali in r.get("aliases", []):
-            try:
-                self.agent.delete_agent_alias(agentId=r["id"], agentAliasId=ali["id"])
-                self._wait_for_agent_alias_deletion(r["id"], ali["id"])
-            except ClientError as e:
-                print(f"Error deleting alias {ali['id']}: {e}")
-        try:
-            self.agent.delete_agent(agentId=r["id"])
-            self._wait_for_agent_deletion(r["id"])
-        except ClientError as e:
-            print(f"Error deleting agent {r['id']}: {e}")
+            key = ("agent alias", r["id"], ali["id"])
+            waiter.watch(key, lambda alias_id=ali["id"]: self._agent_alias_deleted(r["id"], alias_id),
+                         start=lambda alias_id=ali["id"]: self.agent.delete_agent_alias(agentId=r["id"],
+                                                                                       agentAliasId=alias_id),
+                         timeout=DELETE_TIMEOUT, label=f"Agent alias {ali['name'] or ali['id']}")
+            alias_keys.append(key)
+
+        def start_agent_deletion():
+            waiter.watch(("agent", r["id"]), lambda: self._agent_deleted(r["id"]),
+                         start=lambda: self.agent.delete_agent(agentId=r["id"]),
+                         timeout=DELETE_TIMEOUT, label=f"Agent {r['name']}")
 
-    def delete_provisioned_model_throughput(self, r):
+        waiter.after(alias_keys, start_agent_deletion)
+
+    def delete_provisioned_model_throughput(self, r, waiter):
         print(f"Deleting provisioned model throughput {r['name']}...")
+        waiter.watch(("provisioned model throughput", r["id"]),
+                     start=lambda: self.bedrock.delete_provisioned_model_throughput(provisionedModelId=r["id"]),
+                     label=f"Provisioned model throughput {r['name']}")
+
+    def _deleted(self, fetch, status_of):
+        """Probe once: True only once the resource is gone, raise if deletion failed, else False.
+
+        Any other status (DELETING, or a PREPARED/ACTIVE read that lags behind the delete
+        call) means the deletion is not confirmed yet, so keep polling.
+        """
         try:
-            self.bedrock.delete_provisioned_model_throughput(provisionedModelId=r["id"])
+            status = status_of(fetch())
         except ClientError as e:
-            print(f"Error deleting throughput {r['id']}: {e}")
-
-    def _wait_for_guardrail_deletion(self, gid):
-        for _ in range(30):
-            try:
-                if self.bedrock.get_guardrail(guardrailIdentifier=gid)["status"] != "DELETING":
-                    return
-            except ClientError:
-                return
-            time.sleep(5)
-
-    def _wait_for_data_source_deletion(self, kb, ds, max_attempts=60, sleep_time=5):
-        for _ in range(max_attempts):
-            try:
-                status = self.agent.get_data_source(knowledgeBaseId=kb, dataSourceId=ds)\
-                                     .get("dataSource", {})\
-                                     .get("status", "")
-                if status not in ("DELETING", "DELETE_UNSUCCESSFUL"):
-                    return
-            except ClientError:
-                return
-            time.sleep(sleep_time)
-
-    def _wait_for_knowledge_base_deletion(self, kb, max_attempts=60, sleep_time=5):
-        for _ in range(max_attempts):
-            try:
-                status = self.agent.get_knowledge_base(knowledgeBaseId=kb)\
-                                     .get("dataSource", {})\
-                                     .get("status", "")
-                if status not in ("DELETING", "DELETE_UNSUCCESSFUL"):
-                    return
-            except ClientError:
-                return
-            time.sleep(sleep_time)
-
-    def _wait_for_agent_deletion(self, aid):
-        for _ in range(30):
-            try:
-                if self.agent.get_agent(agentId=aid)["status"] != "DELETING":
-                    return
-            except ClientError:
-                return
-            time.sleep(5)
-
-    def _wait_for_agent_alias_deletion(self, aid, alias_id):
-        for _ in range(30):
-            try:
-                if self.agent.get_agent_alias(agentId=aid, agentAliasId=alias_id)["status"] != "DELETING":
-                    return
-            except ClientError:
-                return
-            time.sleep(5)
-
-    def run(self):
+            if e.response["Error"]["Code"] == "ResourceNotFoundException":
+                return True
+            raise
+        if status in ("DELETE_UNSUCCESSFUL", "FAILED"):
+            raise Exception(f"deletion ended in status {status}")
+        return False
+
+    def _guardrail_deleted(self, gid):
+        return self._deleted(lambda: self.bedrock.get_guardrail(guardrailIdentifier=gid),
+                             lambda resp: resp.get("status", ""))
+
+    def _data_source_deleted(self, kb, ds):
+        return self._deleted(lambda: self.agent.get_data_source(knowledgeBaseId=kb, dataSourceId=ds),
+                             lambda resp: resp.get("dataSource", {}).get("status", ""))
+
+    def _knowledge_base_deleted(self, kb):
+        return self._deleted(lambda: self.agent.get_knowledge_base(knowledgeBaseId=kb),
+                             lambda resp: resp.get("knowledgeBase", {}).get("status", ""))
+
+    def _agent_deleted(self, aid):
+        return self._deleted(lambda: self.agent.get_agent(agentId=aid),
+                             lambda resp: resp.get("agent", {}).get("agentStatus", ""))
+
+    def _agent_alias_deleted(self, aid, alias_id):
+        return self._deleted(lambda: self.agent.get_agent_alias(agentId=aid, agentAliasId=alias_id),
+                             lambda resp: resp.get("agentAlias", {}).get("agentAliasStatus", ""))
+
+    def run(self, selection=None):
         self.print_header()
         resources = self.fetch_all_resources()
         self.display_resources(resources)
         if not resources:
             return
-        selection = input("\nEnter resource numbers to delete (comma-separated) or 'q' to quit: ")
+        if selection is None:
+            selection = input(f"\nEnter resources to delete ({SYNTAX}; comma-separated) or 'q' to quit: ")
         if selection.lower() == "q":
             return
         try:
-            indices = [int(x.strip()) for x in selection.split(",") if x.strip()]
-        except ValueError:
-            print("Invalid input.")
+            to_delete = ResourceIndex(resources).select(selection)
+        except ValueError as e:
+            print(f"Invalid selection: {e}")
             return
-        to_delete = [r for r in resources if r["index"] in indices]
         if not to_delete:
             print("No valid resources selected.")
             return
@@ -318,4 +335,10 @@ class BedrockResourceCleaner:
         print("\nCompleted.")
 
 if __name__ == "__main__":
-    BedrockResourceCleaner().run()
+    parser = argparse.ArgumentParser(description="List and delete AWS Bedrock resources.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"delete and status calls in flight at once (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--select", metavar="EXPR",
+                        help="select resources without prompting, e.g. 'type=guardrail name=test-*' (see resource_selector.py)")
+    args = parser.parse_args()
+    BedrockResourceCleaner(max_workers=args.workers).run(selection=args.select)
@@ -1,43 +1,119 @@
-# Script intended to delete snapshots and AMIs that are older than certain date
-# You need to replace YOUR_ACCOUNT_ID with your account ID :)
-# You need to change min and max dates in line 20 and 23
-# Make sure the region is correct in line 9
+# Script intended to delete snapshots and AMIs that are older than certain date, in
+# the configured region (or the regions listed below, or every enabled region). Regions
+# are processed concurrently by region_fanout.py and the results are merged into one
+# report. The script asks for confirmation before deleting anything.
+# Snapshots are read page by page and matched against one describe_images sweep,
+# so every AMI that still uses an old snapshot is known up front. Those AMIs are
+# deregistered first, then the snapshots are deleted on a worker pool whose calls
+# are paced by the shared adaptive EC2 rate limiter (ec2_throttle.py).
+# Make sure the regions and age settings below are what you want
 
-import boto3
 import datetime
-import time
-client = boto3.client('ec2',region_name='us-east-1')
-snapshots = client.describe_snapshots(OwnerIds=['YOUR_ACCOUNT_ID'])
-
-if snapshots['Snapshots']:
-
-	for snapshot in snapshots['Snapshots']:
-		a=snapshot['StartTime']
-		b=a.date()
-		c=datetime.datetime.now().date()
-		d=c-b
-		try:
-			snapid = snapshot['SnapshotId']
-			if d.days >= 90:
-				client.delete_snapshot(SnapshotId=snapid)
-				print (snapid + " DELETED")
-			elif d.days < 10:
-				print ("SKIPPED " + str(snapid))
-
-		except Exception as e:
-			if 'InvalidSnapshot.InUse' in str(e):
-				ami_id = str(e)
-				clean_ami_id = ami_id.split()[17]
-				print ("This snapshot: " + snapid + " belogs to an AMI - De-Registering the AMI: " + clean_ami_id + " first..." )
-				try:
-					client.deregister_image(ImageId=clean_ami_id)
-				except Exception as AMI_Deregister_Error:
-					print (AMI_Deregister_Error)
-				time.sleep(1)
-				client.delete_snapshot(SnapshotId=snapid)
-				print (snapid + " DELETED")
-			else:
-				print(e)
-		continue
-else:
-  print ("No snapshot found!")
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+import region_fanout
+
+# None uses the session's configured region; list regions, e.g. ["us-east-1", "eu-west-1"],
+# or set region_fanout.ALL_REGIONS to cover every enabled region
+regions = None
+max_age_days = 90
+workers = 8
+
+
+def iter_snapshots(client):
+    paginator = client.get_paginator('describe_snapshots')
+    for page in paginator.paginate(OwnerIds=['self']):
+        yield from page['Snapshots']
+
+
+def build_snapshot_ami_index(client):
+    """Map each snapshot id to the ids of the AMIs whose block devices use it"""
+    index = {}
+    paginator = client.get_paginator('describe_images')
+    for page in paginator.paginate(Owners=['self']):
+        for image in page['Images']:
+            for mapping in image.get('BlockDeviceMappings', []):
+                snapshot_id = mapping.get('Ebs', {}).get('SnapshotId')
+                if snapshot_id:
+                    index.setdefault(snapshot_id, set()).add(image['ImageId'])
+    return index
+
+
+def run_parallel(func, items, max_workers):
+    """Call func(item) for every item on a thread pool; return {item: error or None}"""
+    def call(item):
+        try:
+            func(item)
+            return None
+        except ClientError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(items, executor.map(call, items)))
+
+
+def sweep(client, max_age_days=max_age_days, max_workers=workers, log=print):
+    """Delete old snapshots and the AMIs using them; return counters for the report"""
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=max_age_days)
+
+    old_snapshots = [s['SnapshotId'] for s in iter_snapshots(client) if s['StartTime'] <= cutoff]
+    if not old_snapshots:
+        log("No snapshot found!")
+        return {'snapshots_deleted': 0, 'amis_deregistered': 0, 'snapshots_skipped': 0, 'failed': 0}
+
+    ami_index = build_snapshot_ami_index(client)
+    images = sorted(set(ami for snapid in old_snapshots for ami in ami_index.get(snapid, ())))
+    log(f"Found {len(old_snapshots)} snapshots older than {max_age_days} days, "
+        f"used by {len(images)} AMIs")
+
+    # Deregister the AMIs first so their snapshots are no longer in use
+    failed_images = set()
+    for image_id, error in run_parallel(
+            lambda image_id: client.deregister_image(ImageId=image_id), images, max_workers).items():
+        if error:
+            failed_images.add(image_id)
+            log(f"Could not de-register AMI {image_id}: {error}")
+        else:
+            log(f"AMI {image_id} DE-REGISTERED")
+
+    deletable = []
+    for snapid in old_snapshots:
+        blocking = ami_index.get(snapid, set()) & failed_images
+        if blocking:
+            log(f"SKIPPED {snapid}: still used by {', '.join(sorted(blocking))}")
+        else:
+            deletable.append(snapid)
+
+    deleted = 0
+    for snapid, error in run_parallel(
+            lambda snapid: client.delete_snapshot(SnapshotId=snapid), deletable, max_workers).items():
+        if error:
+            log(f"Could not delete {snapid}: {error}")
+        else:
+            deleted += 1
+            log(snapid + " DELETED")
+
+    log(f"Deleted {deleted} of {len(old_snapshots)} snapshots and de-registered "
+        f"{len(images) - len(failed_images)} AMIs")
+    return {
+        'snapshots_deleted': deleted,
+        'amis_deregistered': len(images) - len(failed_images),
+        'snapshots_skipped': len(old_snapshots) - len(deletable),
+        'failed': len(failed_images) + len(deletable) - deleted,
+    }
+
+
+def sweep_region(client, region, log):
+    return sweep(client, log=log)
+
+
+if __name__ == "__main__":
+    target_regions = region_fanout.resolve_regions(regions)
+    confirm = input(f"Delete snapshots older than {max_age_days} days, and the AMIs using them, in "
+                    f"{len(target_regions)} region(s) ({', '.join(target_regions)})? (yes/no): ")
+    if confirm.strip().lower() in ['yes', 'y']:
+        region_fanout.fan_out(sweep_region, target_regions,
+                              clients=region_fanout.RegionClients(max_pool_connections=workers))
+    else:
+        print("Deletion cancelled.")
@@ -1,69 +1,411 @@
 # Script intended to list all buckets and let you select a number.
 # Issues a delete for all objects and all versions.
-# Displays a horizontal bar for everfile it's deleting.
+# Displays a progress bar while it's deleting.
+#
+# Listing and deleting are pipelined: versions are listed in parallel per prefix
+# (see s3_parallel_lister.py) while a bounded thread pool sends 1000-key
+# delete_objects batches. Tune with --workers, --list-workers, --batch-size and
+# --max-retries.
+#
+# For very large buckets, --inventory-manifest takes an S3 Inventory manifest.json
+# (local path or s3://bucket/key) and feeds its rows straight into the delete
+# pipeline without listing the bucket at all.
+#
+# --strategy lifecycle hands the work to S3 instead: it installs a lifecycle rule
+# that expires every version and delete marker, then checks back (once, or every
+# --poll-interval seconds with --wait) and deletes the bucket when it is empty.
+# Progress is kept in --state-file so a later run with --resume picks up from there.
 
 
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from tqdm import tqdm
 
-s3 = boto3.client('s3')
-
-# List buckets
-response = s3.list_buckets()
-
-print("Existing S3 Buckets:")
-for i, bucket in enumerate(response['Buckets']):
-    print(f"{i}. {bucket['Name']}")
-
-# Get bucket(s) to delete (allows multiple numbers)
-bucket_numbers_to_delete = input("Enter the number(s) of the bucket(s) to delete (comma-separated): ").split(',')
-
-# Validate and convert input to bucket names
-buckets_to_delete = []
-for num in bucket_numbers_to_delete:
-    try:
-        bucket_name = response['Buckets'][int(num.strip())]['Name']
-        buckets_to_delete.append(bucket_name)
-    except (ValueError, IndexError):
-        print(f"Invalid bucket number: {num}. Skipping.")
-
-if not buckets_to_delete:
-    print("No valid buckets selected. Exiting.")
-    exit()
-
-for bucket_to_delete in buckets_to_delete:
-    try:
-        print(f"\nDeleting bucket: {bucket_to_delete}")
-
-        # Delete all object versions (including delete markers) from the bucket
-        deleting = True
-        while deleting:
-            version_objs = s3.list_object_versions(Bucket=bucket_to_delete)
-            if 'Versions' in version_objs or 'DeleteMarkers' in version_objs:
-                objects_to_delete = []
-
-                if 'Versions' in version_objs:
-                    objects_to_delete.extend(
-                        [{'Key': obj['Key'], 'VersionId': obj['VersionId']} for obj in version_objs['Versions']]
-                    )
-
-                if 'DeleteMarkers' in version_objs:
-                    objects_to_delete.extend(
-                        [{'Key': obj['Key'], 'VersionId': obj['VersionId']} for obj in version_objs['DeleteMarkers']]
-                    )
-
-                if objects_to_delete:
-                    delete_keys = {'Objects': objects_to_delete}
-                    s3.delete_objects(Bucket=bucket_to_delete, Delete=delete_keys)
-                    print(f"Deleted {len(objects_to_delete)} object versions and delete markers from {bucket_to_delete}")
+import s3_inventory
+import s3_parallel_lister
+
+DELETE_BATCH_SIZE = 1000  # delete_objects hard limit
+DEFAULT_WORKERS = 8
+DEFAULT_MAX_RETRIES = 5
+
+# Per-key error codes from delete_objects that are worth another attempt
+RETRYABLE_DELETE_ERRORS = {'InternalError', 'SlowDown', 'ServiceUnavailable', 'OperationAborted'}
+
+DEFAULT_STATE_FILE = "bucket-lifecycle-state.json"
+DEFAULT_POLL_INTERVAL = 3600  # lifecycle runs roughly once a day, no point polling faster
+
+# Expire current versions, then noncurrent versions, then the delete markers left behind.
+# ExpiredObjectDeleteMarker cannot share a rule with Expiration.Days, hence two rules.
+LIFECYCLE_RULES = [
+    {
+        'ID': 'aws-script-toolkit-expire-all',
+        'Filter': {'Prefix': ''},
+        'Status': 'Enabled',
+        'Expiration': {'Days': 1},
+        'NoncurrentVersionExpiration': {'NoncurrentDays': 1},
+        'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': 1},
+    },
+    {
+        'ID': 'aws-script-toolkit-expire-delete-markers',
+        'Filter': {'Prefix': ''},
+        'Status': 'Enabled',
+        'Expiration': {'ExpiredObjectDeleteMarker': True},
+    },
+]
+
+
+def iter_object_versions(s3, bucket, list_workers=s3_parallel_lister.DEFAULT_WORKERS):
+    """Stream every object version and delete marker in a bucket as delete_objects entries"""
+    for obj in s3_parallel_lister.list_object_versions(s3, bucket, workers=list_workers):
+        yield {'Key': obj['Key'], 'VersionId': obj['VersionId']}
+
+
+def iter_batches(objects, batch_size):
+    """Group a stream of objects into lists of at most batch_size"""
+    batch = []
+    for obj in objects:
+        batch.append(obj)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def delete_batch(s3, bucket, objects, max_retries=DEFAULT_MAX_RETRIES):
+    """Delete one batch, retrying the entries delete_objects reports as failed.
+
+    Returns (deleted_count, failed_entries).
+    """
+    deleted = 0
+    pending = objects
+    for attempt in range(max_retries + 1):
+        response = s3.delete_objects(Bucket=bucket, Delete={'Objects': pending, 'Quiet': True})
+        errors = response.get('Errors', [])
+        deleted += len(pending) - len(errors)
+        if not errors:
+            return deleted, []
+
+        retry = [_delete_entry(e) for e in errors if e.get('Code') in RETRYABLE_DELETE_ERRORS]
+        failed = [e for e in errors if e.get('Code') not in RETRYABLE_DELETE_ERRORS]
+        if failed or not retry or attempt == max_retries:
+            return deleted, errors
+
+        pending = retry
+        time.sleep(min(2 ** attempt * 0.1, 5))
+
+
+def _delete_entry(obj):
+    entry = {'Key': obj['Key']}
+    if obj.get('VersionId'):
+        entry['VersionId'] = obj['VersionId']
+    return entry
+
+
+def purge_objects(s3, bucket, objects, workers=DEFAULT_WORKERS, batch_size=DELETE_BATCH_SIZE,
+                  max_retries=DEFAULT_MAX_RETRIES):
+    """Delete a stream of {'Key', 'VersionId'} entries with a bounded pool of delete_objects calls.
+
+    The caller's iterator is consumed on this thread while up to `workers` batches
+    are in flight, so listing never waits on a delete round trip and never runs
+    more than a couple of batches ahead. Returns (deleted_count, failed_entries).
+    """
+    in_flight = threading.BoundedSemaphore(workers * 2)
+    failed = []
+    lock = threading.Lock()
+    totals = {'deleted': 0}
+
+    with tqdm(desc=bucket, unit='obj') as progress:
+        def run_batch(batch):
+            try:
+                deleted, errors = delete_batch(s3, bucket, batch, max_retries)
+            except ClientError as e:
+                deleted, errors = 0, [dict(o, Code=e.response['Error']['Code'], Message=str(e))
+                                      for o in batch]
+            except Exception as e:
+                # Connection errors and the like: the whole batch is unaccounted for, so count it failed
+                deleted, errors = 0, [dict(o, Code=type(e).__name__, Message=str(e)) for o in batch]
+            finally:
+                in_flight.release()
+            with lock:
+                totals['deleted'] += deleted
+                failed.extend(errors)
+            progress.update(deleted)
+
+        futures = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch in iter_batches(objects, batch_size):
+                in_flight.acquire()
+                # Collect finished batches as the window drains so nothing fails unnoticed
+                for future in [future for future in futures if future.done()]:
+                    future.result()
+                    futures.remove(future)
+                futures.append(executor.submit(run_batch, batch))
+        for future in futures:
+            future.result()
+
+    return totals['deleted'], failed
+
+
+def empty_bucket(s3, bucket, workers=DEFAULT_WORKERS, batch_size=DELETE_BATCH_SIZE,
+                 max_retries=DEFAULT_MAX_RETRIES, list_workers=s3_parallel_lister.DEFAULT_WORKERS):
+    """Delete all object versions (including delete markers) from the bucket"""
+    return purge_objects(s3, bucket, iter_object_versions(s3, bucket, list_workers),
+                         workers=workers, batch_size=batch_size, max_retries=max_retries)
+
+
+def empty_bucket_from_inventory(s3, manifest_location, workers=DEFAULT_WORKERS, batch_size=DELETE_BATCH_SIZE,
+                                max_retries=DEFAULT_MAX_RETRIES, manifest=None):
+    """Delete every object version listed in an S3 Inventory report of the bucket"""
+    if manifest is None:
+        manifest = s3_inventory.load_manifest(manifest_location, s3)
+    objects = s3_inventory.iter_inventory_objects(manifest_location, s3, manifest=manifest)
+    return purge_objects(s3, manifest['sourceBucket'], objects,
+                         workers=workers, batch_size=batch_size, max_retries=max_retries)
+
+
+def load_lifecycle_state(path):
+    """Read the per-bucket lifecycle progress file, or start an empty one"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as state_file:
+        return json.load(state_file)
+
+
+def save_lifecycle_state(path, state):
+    # Write to a temp file first so an interrupted run never leaves a truncated state file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as state_file:
+        json.dump(state, state_file, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def install_expiry_rules(s3, bucket):
+    """Replace the bucket's lifecycle configuration with the expire-everything rules"""
+    s3.put_bucket_lifecycle_configuration(
+        Bucket=bucket,
+        LifecycleConfiguration={'Rules': LIFECYCLE_RULES}
+    )
+
+
+def bucket_is_empty(s3, bucket):
+    """Sample a single entry: one list request answers whether anything is left"""
+    response = s3.list_object_versions(Bucket=bucket, MaxKeys=1)
+    return not (response.get('Versions') or response.get('DeleteMarkers'))
+
+
+def get_object_count(bucket, region):
+    """Latest daily NumberOfObjects metric for the bucket, or None if not published yet"""
+    cloudwatch = boto3.client('cloudwatch', region_name=region)
+    now = datetime.now(timezone.utc)
+    response = cloudwatch.get_metric_statistics(
+        Namespace='AWS/S3',
+        MetricName='NumberOfObjects',
+        Dimensions=[
+            {'Name': 'BucketName', 'Value': bucket},
+            {'Name': 'StorageType', 'Value': 'AllStorageTypes'},
+        ],
+        StartTime=now - timedelta(days=3),
+        EndTime=now,
+        Period=86400,
+        Statistics=['Average']
+    )
+    datapoints = sorted(response.get('Datapoints', []), key=lambda d: d['Timestamp'])
+    return int(datapoints[-1]['Average']) if datapoints else None
+
+
+def expire_bucket_via_lifecycle(s3, bucket, state):
+    """Advance one bucket through install -> expiring -> deleted, updating state in place.
+
+    Returns True once the bucket has been deleted.
+    """
+    entry = state.setdefault(bucket, {})
+    if entry.get('status') == 'deleted':
+        return True
+
+    if entry.get('status') != 'expiring':
+        install_expiry_rules(s3, bucket)
+        entry['status'] = 'expiring'
+        entry['rules_installed_at'] = datetime.now(timezone.utc).isoformat()
+        print(f"Installed expiry lifecycle rules on {bucket}. S3 will expire its contents over the next few days.")
+
+    entry['last_checked_at'] = datetime.now(timezone.utc).isoformat()
+    if not bucket_is_empty(s3, bucket):
+        region = s3.get_bucket_location(Bucket=bucket).get('LocationConstraint') or 'us-east-1'
+        try:
+            entry['object_count'] = get_object_count(bucket, region)
+        except ClientError as e:
+            print(f"Could not read NumberOfObjects for {bucket}: {e}")
+        count = entry.get('object_count')
+        count_text = f"about {count} objects" if count is not None else "object count not published yet"
+        print(f"{bucket} is still expiring ({count_text}, rules installed {entry['rules_installed_at']})")
+        return False
+
+    s3.delete_bucket(Bucket=bucket)
+    entry['status'] = 'deleted'
+    entry['deleted_at'] = datetime.now(timezone.utc).isoformat()
+    print(f"Deleted bucket {bucket}")
+    return True
+
+
+def run_lifecycle_strategy(s3, buckets, state_file, wait=False, poll_interval=DEFAULT_POLL_INTERVAL):
+    """Expire and delete buckets through lifecycle rules, persisting progress after each step"""
+    state = load_lifecycle_state(state_file)
+    remaining = list(buckets)
+    while remaining:
+        still_expiring = []
+        for bucket in remaining:
+            try:
+                if not expire_bucket_via_lifecycle(s3, bucket, state):
+                    still_expiring.append(bucket)
+            except ClientError as e:
+                print(f"Error expiring bucket {bucket}: {e}")
+            finally:
+                save_lifecycle_state(state_file, state)
+
+        remaining = still_expiring
+        if not remaining or not wait:
+            break
+        print(f"\n{len(remaining)} bucket(s) still expiring. Checking again in {poll_interval} seconds...")
+        time.sleep(poll_interval)
+
+    if remaining:
+        print(f"\n{len(remaining)} bucket(s) still expiring. Re-run with --strategy lifecycle --resume to continue.")
+
+
+def select_buckets(s3):
+    """List buckets and let the user pick one or more by number"""
+    # List buckets
+    response = s3.list_buckets()
+
+    print("Existing S3 Buckets:")
+    for i, bucket in enumerate(response['Buckets']):
+        print(f"{i}. {bucket['Name']}")
+
+    # Get bucket(s) to delete (allows multiple numbers)
+    bucket_numbers_to_delete = input("Enter the number(s) of the bucket(s) to delete (comma-separated): ").split(',')
+
+    # Validate and convert input to bucket names
+    buckets_to_delete = []
+    for num in bucket_numbers_to_delete:
+        try:
+            bucket_name = response['Buckets'][int(num.strip())]['Name']
+            buckets_to_delete.append(bucket_name)
+        except (ValueError, IndexError):
+            print(f"Invalid bucket number: {num}. Skipping.")
+
+    return buckets_to_delete
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Empty and delete S3 buckets.")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"concurrent delete_objects calls (default {DEFAULT_WORKERS})")
+    parser.add_argument('--list-workers', type=int, default=s3_parallel_lister.DEFAULT_WORKERS,
+                        help=f"concurrent prefix listings (default {s3_parallel_lister.DEFAULT_WORKERS})")
+    parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE,
+                        help=f"keys per delete_objects call, max {DELETE_BATCH_SIZE}")
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help="retries for keys delete_objects reports as failed")
+    parser.add_argument('--inventory-manifest', metavar='LOCATION',
+                        help="purge the inventoried bucket from an S3 Inventory manifest.json "
+                             "(local path or s3://bucket/key) instead of listing it")
+    parser.add_argument('--strategy', choices=['api', 'lifecycle'], default='api',
+                        help="'api' deletes objects with delete_objects; 'lifecycle' lets a lifecycle "
+                             "rule expire them and deletes the bucket once empty")
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE,
+                        help=f"lifecycle strategy progress file (default {DEFAULT_STATE_FILE})")
+    parser.add_argument('--resume', action='store_true',
+                        help="lifecycle strategy: continue with the unfinished buckets in --state-file")
+    parser.add_argument('--wait', action='store_true',
+                        help="lifecycle strategy: keep polling until every bucket is deleted")
+    parser.add_argument('--poll-interval', type=int, default=DEFAULT_POLL_INTERVAL,
+                        help=f"lifecycle strategy: seconds between checks with --wait (default {DEFAULT_POLL_INTERVAL})")
+    args = parser.parse_args()
+    if not 1 <= args.batch_size <= DELETE_BATCH_SIZE:
+        parser.error(f"--batch-size must be between 1 and {DELETE_BATCH_SIZE}")
+    if args.workers < 1 or args.list_workers < 1:
+        parser.error("--workers and --list-workers must be at least 1")
+    if args.strategy == 'lifecycle' and args.inventory_manifest:
+        parser.error("--inventory-manifest only applies to the 'api' strategy")
+    if args.resume and args.strategy != 'lifecycle':
+        parser.error("--resume only applies to --strategy lifecycle")
+    return args
+
+
+def main():
+    args = parse_args()
+    s3 = boto3.client('s3', config=Config(max_pool_connections=args.workers + args.list_workers))
+
+    if args.resume:
+        state = load_lifecycle_state(args.state_file)
+        buckets = [b for b, entry in state.items() if entry.get('status') != 'deleted']
+        if not buckets:
+            print(f"No unfinished buckets in {args.state_file}. Exiting.")
+            return
+        run_lifecycle_strategy(s3, buckets, args.state_file, wait=args.wait, poll_interval=args.poll_interval)
+        return
+
+    manifest = None
+    if args.inventory_manifest:
+        try:
+            manifest = s3_inventory.load_manifest(args.inventory_manifest, s3)
+        except (ClientError, OSError, ValueError) as e:
+            print(f"Error reading inventory manifest {args.inventory_manifest}: {e}")
+            return
+        bucket_name = manifest['sourceBucket']
+        confirm = input(f"Delete every object version listed in the inventory of {bucket_name}, "
+                        f"then the bucket itself? (yes/no): ")
+        buckets_to_delete = [bucket_name] if confirm.strip().lower() in ['yes', 'y'] else []
+    else:
+        buckets_to_delete = select_buckets(s3)
+
+    if not buckets_to_delete:
+        print("No valid buckets selected. Exiting.")
+        return
+
+    if args.strategy == 'lifecycle':
+        print("Existing lifecycle rules on the selected buckets will be replaced.")
+        run_lifecycle_strategy(s3, buckets_to_delete, args.state_file, wait=args.wait,
+                               poll_interval=args.poll_interval)
+        return
+
+    for bucket_to_delete in buckets_to_delete:
+        try:
+            print(f"\nDeleting bucket: {bucket_to_delete}")
+
+            if manifest is not None:
+                deleted, failed = empty_bucket_from_inventory(s3, args.inventory_manifest, workers=args.workers,
+                                                              batch_size=args.batch_size,
+                                                              max_retries=args.max_retries, manifest=manifest)
             else:
-                deleting = False
-                print(f"No more object versions or delete markers in {bucket_to_delete}")
+                deleted, failed = empty_bucket(s3, bucket_to_delete, workers=args.workers,
+                                               batch_size=args.batch_size, max_retries=args.max_retries,
+                                               list_workers=args.list_workers)
+            print(f"Deleted {deleted} object versions and delete markers from {bucket_to_delete}")
+            if failed:
+                print(f"Failed to delete {len(failed)} object versions from {bucket_to_delete}, e.g.:")
+                for error in failed[:10]:
+                    print(f"  {error['Key']} ({error.get('VersionId')}): {error.get('Code')} {error.get('Message', '')}")
+                print(f"Skipping bucket deletion for {bucket_to_delete}")
+                continue
+
+            # Now delete the bucket
+            s3.delete_bucket(Bucket=bucket_to_delete)
+            print(f"Deleted bucket {bucket_to_delete}")
+
+        except (ClientError, OSError, RuntimeError) as e:
+            print(f"Error deleting bucket {bucket_to_delete}: {e}")
 
-        # Now delete the bucket
-        s3.delete_bucket(Bucket=bucket_to_delete)
-        print(f"Deleted bucket {bucket_to_delete}")
 
-    except ClientError as e:
-        print(f"Error deleting bucket {bucket_to_delete}: {e}")
+if __name__ == "__main__":
+    main()
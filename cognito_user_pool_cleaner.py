@@ -2,19 +2,34 @@
 # Cognito User Pool and Identity Pool Cleaner
 # This script lists and deletes AWS Cognito User Pools and Identity Pools without confirmation prompts
 
+import argparse
 import boto3
 import sys
+import threading
 import time
-from botocore.exceptions import ClientError
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from botocore.exceptions import BotoCoreError, ClientError
 from datetime import datetime
 
+from resource_selector import SYNTAX, ResourceIndex
+from resource_waiter import DONE, ResourceWaiter, print_latencies
+
+USER_POOL_DELETE_TIMEOUT = 60  # seconds to wait for a user pool to disappear
+DOMAIN_DELETE_TIMEOUT = 300    # custom domains can take a few minutes to go
+DESCRIBE_WORKERS = 10          # concurrent describe_user_pool calls while listing
+
 class CognitoResourceCleaner:
-    def __init__(self):
+    def __init__(self, max_workers=DESCRIBE_WORKERS):
         # Use the default region from AWS CLI configuration
         session = boto3.session.Session()
         self.region = session.region_name or "us-east-1"
         self.cognito_idp_client = boto3.client('cognito-idp', region_name=self.region)
         self.cognito_identity_client = boto3.client('cognito-identity', region_name=self.region)
+        self.max_workers = max_workers
+        # user pool id -> future of describe_user_pool()['UserPool'], so each pool is described once
+        self.describe_cache = {}
+        self.describe_lock = threading.Lock()
         
     def print_header(self):
         """Print a header for the application"""
@@ -24,39 +39,73 @@ class CognitoResourceCleaner:
         print(f"Region: {self.region}")
         print("=" * 60 + "\n")
 
-    def fetch_user_pools(self):
-        """Fetch all Cognito User Pools and return them in a list"""
+    def describe_user_pool(self, user_pool_id, executor=None):
+        """Return a future for the pool's describe_user_pool()['UserPool'], described once and cached.
+
+        With an executor the call runs in the background; without one it runs right away.
+        A failed describe is not cached, so a later caller tries again.
+        """
+        with self.describe_lock:
+            future = self.describe_cache.get(user_pool_id)
+            if future is not None and not (future.done() and future.exception()):
+                return future
+            if executor:
+                future = executor.submit(self._describe_user_pool, user_pool_id)
+            else:
+                future = Future()
+                try:
+                    future.set_result(self._describe_user_pool(user_pool_id))
+                except ClientError as e:
+                    future.set_exception(e)
+            self.describe_cache[user_pool_id] = future
+            return future
+
+    def _describe_user_pool(self, user_pool_id):
+        return self.cognito_idp_client.describe_user_pool(UserPoolId=user_pool_id)['UserPool']
+
+    def fetch_user_pools(self, executor, on_resource=None):
+        """Fetch all Cognito User Pools and return them in a list.
+
+        Each pool is described in the background as soon as its listing page arrives, to
+        fill in its user count. on_resource, if given, is called for each pool in listing
+        order as soon as its user count is known, so rows appear while listing continues.
+        """
         user_pools = []
-        resource_index = 1  # Start numbering from 1
-        
+        waiting = deque()  # pools whose user count is still being fetched, in listing order
+
+        def settle(block):
+            while waiting and (block or waiting[0][1].done()):
+                resource, details = waiting.popleft()
+                try:
+                    resource['user_count'] = details.result().get('EstimatedNumberOfUsers', 0)
+                except (ClientError, BotoCoreError) as e:
+                    print(f"Error getting details for user pool {resource['id']}: {e}")
+                    resource['user_count'] = "Unknown"
+                if on_resource:
+                    on_resource(resource)
+
         print("Fetching Cognito User Pools...")
         try:
             paginator = self.cognito_idp_client.get_paginator('list_user_pools')
             for page in paginator.paginate(MaxResults=60):
                 for pool in page.get('UserPools', []):
-                    # Get detailed information about the user pool
-                    try:
-                        details = self.cognito_idp_client.describe_user_pool(
-                            UserPoolId=pool['Id']
-                        )
-                        user_count = details['UserPool'].get('EstimatedNumberOfUsers', 0)
-                    except ClientError as e:
-                        print(f"Error getting details for user pool {pool['Id']}: {e}")
-                        user_count = "Unknown"
-                    
-                    user_pools.append({
-                        'index': resource_index,
+                    resource = {
+                        'index': len(user_pools) + 1,  # Start numbering from 1
                         'name': pool['Name'],
                         'id': pool['Id'],
                         'creation_date': pool['CreationDate'].strftime('%Y-%m-%d %H:%M:%S'),
-                        'user_count': user_count,
+                        'created': pool['CreationDate'],
+                        'user_count': None,
                         'type': 'User Pool'
-                    })
-                    resource_index += 1
+                    }
+                    user_pools.append(resource)
+                    waiting.append((resource, self.describe_user_pool(pool['Id'], executor)))
+                settle(block=False)
         except ClientError as e:
             print(f"Error listing user pools: {e}")
+        settle(block=True)
         
-        return user_pools, resource_index
+        return user_pools, len(user_pools) + 1
 
     def fetch_identity_pools(self, start_index):
         """Fetch all Cognito Identity Pools and return them in a list"""
@@ -88,36 +137,33 @@ class CognitoResourceCleaner:
             print("No Cognito resources found.")
             return
         
+        self.print_table_header()
+        for resource in resources:
+            self.print_resource_row(resource)
+
+    def print_table_header(self):
         print("\nAvailable Cognito Resources:")
         print("-" * 110)
         print(f"{'#':<5} {'Type':<15} {'Name':<30} {'ID':<30} {'Creation Date':<20} {'Users':<10}")
         print("-" * 110)
-        
-        for resource in resources:
-            print(f"{resource['index']:<5} {resource['type']:<15} {resource['name']:<30} {resource['id']:<30} {resource['creation_date']:<20} {resource['user_count']:<10}")
+
+    def print_resource_row(self, resource):
+        print(f"{resource['index']:<5} {resource['type']:<15} {resource['name']:<30} {resource['id']:<30} {resource['creation_date']:<20} {resource['user_count']:<10}")
     
-    def select_resources(self, resources):
-        """Let user select resources by number"""
+    def select_resources(self, resources, selection=None):
+        """Let user select resources by number, range or filter (see resource_selector.py)"""
         if not resources:
             return []
         
-        selection = input("\nEnter the number(s) of resources to delete (comma-separated): ")
+        if selection is None:
+            selection = input(f"\nEnter the resources to delete ({SYNTAX}; comma-separated): ")
         
-        selected_indices = []
         try:
-            for num in selection.split(','):
-                num = num.strip()
-                if num:  # Skip empty strings
-                    selected_indices.append(int(num))
-        except ValueError:
-            print(f"Invalid input: {num}. Must be a number.")
+            selected_resources = ResourceIndex(resources).select(selection)
+        except ValueError as e:
+            print(f"Invalid selection: {e}")
             return []
         
-        selected_resources = []
-        for resource in resources:
-            if resource['index'] in selected_indices:
-                selected_resources.append(resource)
-        
         if not selected_resources:
             print("No valid resources selected.")
         else:
@@ -129,109 +175,131 @@ class CognitoResourceCleaner:
         return selected_resources
 
     def delete_resources(self, resources):
-        """Delete selected resources without confirmation"""
+        """Delete selected resources without confirmation, as a pipeline.
+
+        Every domain deletion is issued at once and polled until the domain is gone; each
+        user pool is deleted as soon as its own domain is, and identity pools are deleted in
+        parallel alongside. Per-stage latency percentiles are printed at the end.
+        """
         print("\nDeleting resources...")
-        
+        start = time.monotonic()
+        waiter = ResourceWaiter(timeout=USER_POOL_DELETE_TIMEOUT, max_concurrent_calls=self.max_workers)
+        pipeline = []  # seconds from the start of the teardown until each user pool was gone
+
+        def watch_user_pool(pool):
+            def finished(key, state, detail):
+                if state == DONE:
+                    pipeline.append(time.monotonic() - start)
+
+            waiter.watch(
+                ('user pool', pool['id']),
+                probe=lambda: self._user_pool_deleted(pool['id']),
+                start=lambda: self.delete_user_pool(pool),
+                on_done=finished,
+                label=f"User Pool {pool['name']} ({pool['id']})"
+            )
+
+        def watch_domain(pool, domain):
+            def finished(key, state, detail):
+                if state == DONE:
+                    watch_user_pool(pool)
+                else:
+                    print(f"Skipping User Pool {pool['name']} ({pool['id']}) because its domain was not deleted")
+
+            waiter.watch(
+                ('domain', pool['id']),
+                probe=lambda: self._domain_deleted(domain),
+                start=lambda: self.delete_user_pool_domain(pool, domain),
+                timeout=DOMAIN_DELETE_TIMEOUT,
+                on_done=finished,
+                label=f"Domain {domain}"
+            )
+
+        # Domains come from the listing's cached describe; look up any missing ones concurrently
+        user_pools = [r for r in resources if r['type'] == 'User Pool']
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            lookups = [(pool, self.describe_user_pool(pool['id'], executor)) for pool in user_pools]
+            for pool, lookup in lookups:
+                try:
+                    domain = lookup.result().get('Domain')
+                except (ClientError, BotoCoreError) as e:
+                    print(f"ERROR: Failed to check domain for User Pool {pool['name']} ({pool['id']}): {e}")
+                    continue  # Skip this user pool if we can't check for domains
+                if domain:
+                    watch_domain(pool, domain)
+                else:
+                    watch_user_pool(pool)
+
         for resource in resources:
-            if resource['type'] == 'User Pool':
-                self.delete_user_pool(resource)
-            elif resource['type'] == 'Identity Pool':
-                self.delete_identity_pool(resource)
-    
+            if resource['type'] == 'Identity Pool':
+                waiter.watch(
+                    ('identity pool', resource['id']),
+                    start=lambda pool=resource: self.delete_identity_pool(pool),
+                    label=f"Identity Pool {resource['name']} ({resource['id']})"
+                )
+
+        waiter.run()
+        print(f"\n{waiter.summary()} in {time.monotonic() - start:.0f}s")
+        latencies = waiter.latencies()
+        latencies['user pool (end to end)'] = pipeline
+        print_latencies(latencies)
+
+    def delete_user_pool_domain(self, pool, domain):
+        """Delete a user pool's domain; the pool itself can only be deleted once it is gone"""
+        print(f"User pool {pool['name']} has a domain configured: {domain}. Deleting domain first...")
+        self.cognito_idp_client.delete_user_pool_domain(Domain=domain, UserPoolId=pool['id'])
+
     def delete_user_pool(self, pool):
         """Delete a Cognito User Pool"""
         print(f"\nDeleting User Pool: {pool['name']} ({pool['id']})...")
-        
-        # First check if the user pool has a domain configured
-        try:
-            domain_response = self.cognito_idp_client.describe_user_pool(
-                UserPoolId=pool['id']
-            )
-            
-            # Check if the user pool has a domain
-            if 'Domain' in domain_response['UserPool']:
-                domain = domain_response['UserPool']['Domain']
-                print(f"User pool has a domain configured: {domain}. Deleting domain first...")
-                
-                try:
-                    self.cognito_idp_client.delete_user_pool_domain(
-                        Domain=domain,
-                        UserPoolId=pool['id']
-                    )
-                    print(f"Domain {domain} deleted successfully.")
-                    
-                    # Wait a moment for the domain deletion to propagate
-                    time.sleep(5)
-                except ClientError as domain_error:
-                    print(f"ERROR: Failed to delete domain {domain}: {domain_error}")
-                    return  # Skip this user pool if domain deletion fails
-        except ClientError as e:
-            print(f"ERROR: Failed to check domain for User Pool {pool['name']} ({pool['id']}): {e}")
-            return  # Skip this user pool if we can't check for domains
-        
-        # Now delete the user pool
-        try:
-            # Delete the user pool without confirmation
-            self.cognito_idp_client.delete_user_pool(
-                UserPoolId=pool['id']
-            )
-            print(f"User Pool {pool['name']} ({pool['id']}) deletion initiated.")
-            
-            # Wait for deletion to complete
-            self._wait_for_user_pool_deletion(pool['id'])
-        except ClientError as e:
-            print(f"ERROR: Failed to delete User Pool {pool['name']} ({pool['id']}): {e}")
+        # Delete the user pool without confirmation
+        self.cognito_idp_client.delete_user_pool(UserPoolId=pool['id'])
+        print(f"User Pool {pool['name']} ({pool['id']}) deletion initiated.")
 
     def delete_identity_pool(self, pool):
         """Delete a Cognito Identity Pool"""
         print(f"\nDeleting Identity Pool: {pool['name']} ({pool['id']})...")
+        # Delete the identity pool without confirmation
+        self.cognito_identity_client.delete_identity_pool(IdentityPoolId=pool['id'])
+
+    def _domain_deleted(self, domain):
+        """Probe a domain once: False while it still exists, True once it is gone"""
+        description = self.cognito_idp_client.describe_user_pool_domain(Domain=domain).get('DomainDescription', {})
+        if not description.get('UserPoolId'):
+            return True  # The description comes back empty once the domain is gone
+        if description.get('Status') == 'FAILED':
+            raise Exception(f"Domain {domain} is in FAILED state")
+        return False
+
+    def _user_pool_deleted(self, user_pool_id):
+        """Probe a user pool once: False while it still exists, True once it is gone"""
         try:
-            # Delete the identity pool without confirmation
-            self.cognito_identity_client.delete_identity_pool(
-                IdentityPoolId=pool['id']
-            )
-            print(f"Identity Pool {pool['name']} ({pool['id']}) deleted successfully.")
+            self.cognito_idp_client.describe_user_pool(UserPoolId=user_pool_id)
+            return False
         except ClientError as e:
-            print(f"ERROR: Failed to delete Identity Pool {pool['name']} ({pool['id']}): {e}")
-    
-    def _wait_for_user_pool_deletion(self, user_pool_id):
-        """Wait for a user pool to be deleted"""
-        print(f"Waiting for user pool deletion to complete...")
-        max_attempts = 30
-        attempts = 0
-        
-        while attempts < max_attempts:
-            try:
-                self.cognito_idp_client.describe_user_pool(UserPoolId=user_pool_id)
-                print("Still deleting...")
-                time.sleep(2)  # Check every 2 seconds
-                attempts += 1
-            except ClientError as e:
-                if 'ResourceNotFoundException' in str(e) or 'UserPoolNotFoundException' in str(e):
-                    print(f"User Pool {user_pool_id} successfully deleted.")
-                    return
-                else:
-                    print(f"Error checking user pool status: {str(e)}")
-                    return
-        
-        print(f"Deletion of User Pool {user_pool_id} is taking longer than expected. It may still be in progress.")
+            if 'ResourceNotFoundException' in str(e) or 'UserPoolNotFoundException' in str(e):
+                return True
+            raise
 
-    def run(self):
+    def run(self, selection=None):
         """Main execution flow"""
         self.print_header()
         
-        # Fetch all resources
-        user_pools, next_index = self.fetch_user_pools()
+        # Fetch all resources, printing each row as soon as it is complete
+        self.print_table_header()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            user_pools, next_index = self.fetch_user_pools(executor, on_resource=self.print_resource_row)
         identity_pools = self.fetch_identity_pools(next_index)
+        for pool in identity_pools:
+            self.print_resource_row(pool)
         
         # Combine all resources
         all_resources = user_pools + identity_pools
-        
-        # Display all resources
-        self.display_resources(all_resources)
+        if not all_resources:
+            print("No Cognito resources found.")
         
         # Let user select resources to delete
-        selected_resources = self.select_resources(all_resources)
+        selected_resources = self.select_resources(all_resources, selection)
         
         # Delete selected resources without confirmation
         if selected_resources:
@@ -240,5 +308,12 @@ class CognitoResourceCleaner:
         print("\nOperation completed.")
 
 if __name__ == "__main__":
-    cleaner = CognitoResourceCleaner()
-    cleaner.run()
+    parser = argparse.ArgumentParser(description="List and delete Cognito User Pools and Identity Pools.")
+    parser.add_argument('--workers', type=int, default=DESCRIBE_WORKERS,
+                        help=f"concurrent describe_user_pool calls while listing (default: {DESCRIBE_WORKERS})")
+    parser.add_argument('--select', metavar='EXPR',
+                        help="select resources without prompting, e.g. 'name=ci-* created_before=7d' (see resource_selector.py)")
+    args = parser.parse_args()
+
+    cleaner = CognitoResourceCleaner(max_workers=args.workers)
+    cleaner.run(selection=args.select)
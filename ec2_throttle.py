@@ -0,0 +1,282 @@
+# Adaptive client-side rate limiting for EC2 API calls.
+# Used by tag-ebs-volumes.py and clean-ami-and-snapshots.py.
+#
+# EC2 throttles each account and region with token buckets per action category
+# (https://docs.aws.amazon.com/ec2/latest/devguide/ec2-api-throttling.html). This
+# module keeps a matching bucket per category on our side, shared by every client
+# in the process for the same region, and hooks it into botocore's event system so
+# plain calls and paginators both wait for a token before each request. Each bucket
+# adapts AIMD-style: every throttled response halves its refill rate, every success
+# adds a little back, up to the published rate. Throttled calls are retried by
+# botocore's standard retry mode instead of surfacing RequestLimitExceeded.
+#
+# Run it directly to watch the limiter converge while a real EC2 client talks to a
+# simulated endpoint that answers RequestLimitExceeded above a given rate:
+#
+#   python ec2_throttle.py --server-rate 3 --workers 16 --seconds 20
+
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+# (bucket size, refill rate per second) from the EC2 API throttling documentation
+CATEGORY_LIMITS = {
+    'non_mutating': (100, 20),
+    'unfiltered_non_mutating': (50, 10),
+    'mutating': (50, 5),
+    'resource_intensive': (50, 5),
+}
+
+RESOURCE_INTENSIVE_ACTIONS = {
+    'AttachVolume', 'AuthorizeSecurityGroupEgress', 'AuthorizeSecurityGroupIngress',
+    'CancelSpotInstanceRequests', 'CreateKeyPair', 'CreateVolume', 'DeleteVolume', 'DetachVolume',
+    'ModifyInstanceAttribute', 'RevokeSecurityGroupEgress', 'RevokeSecurityGroupIngress',
+    'RunInstances', 'StartInstances', 'StopInstances', 'TerminateInstances',
+}
+
+THROTTLE_ERROR_CODES = {'RequestLimitExceeded', 'Throttling', 'ThrottlingException'}
+
+MIN_RATE = 0.5            # never back off below one call every two seconds
+DECREASE_FACTOR = 0.5     # multiplicative decrease on throttle
+DECREASE_WINDOW = 1.0     # throttles within this many seconds of a decrease count as one event
+INCREASE_FRACTION = 0.05  # additive increase per success, as a fraction of the published rate
+
+RETRY_CONFIG = {'mode': 'standard', 'max_attempts': 10}
+
+
+class AdaptiveTokenBucket:
+    """Token bucket whose refill rate follows AIMD between MIN_RATE and the published rate"""
+
+    def __init__(self, capacity, max_rate):
+        self.capacity = capacity
+        self.max_rate = max_rate
+        self.rate = float(max_rate)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.last_decrease = float('-inf')
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Take a token, sleeping until one is available"""
+        with self.lock:
+            self._refill(time.monotonic())
+            # Reserve the token now (the balance may go negative) and sleep off the debt
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+    def on_throttle(self):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Drop the burst allowance, or the next calls fire straight into the throttle
+            self.tokens = min(self.tokens, 0.0)
+            # Calls already in flight when the limit was hit come back throttled together;
+            # halve once per window rather than once per response
+            if now - self.last_decrease >= DECREASE_WINDOW:
+                self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+                self.last_decrease = now
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * INCREASE_FRACTION)
+
+
+class RegionLimiter:
+    """One adaptive bucket per EC2 throttling category"""
+
+    def __init__(self, limits=CATEGORY_LIMITS):
+        self.buckets = {category: AdaptiveTokenBucket(*limit) for category, limit in limits.items()}
+
+    def bucket_for(self, operation_name, params):
+        return self.buckets[categorize(operation_name, params)]
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for_region(region):
+    """Return the process-wide limiter for a region (EC2 throttles per account and region)"""
+    with _limiters_lock:
+        if region not in _limiters:
+            _limiters[region] = RegionLimiter()
+        return _limiters[region]
+
+
+def categorize(operation_name, params):
+    if operation_name in RESOURCE_INTENSIVE_ACTIONS:
+        return 'resource_intensive'
+    if operation_name.startswith(('Describe', 'Get', 'List', 'Search')):
+        # An empty Filters=[] or VolumeIds=[] narrows nothing, so look at values, not names
+        narrowed = bool(params.get('Filters')) or params.get('MaxResults') is not None or any(
+            params[name] for name in params if name.endswith(('Ids', 'Id')))
+        return 'non_mutating' if narrowed else 'unfiltered_non_mutating'
+    return 'mutating'
+
+
+def record_response(bucket, error_code):
+    """Feed one response into the AIMD controller"""
+    if error_code in THROTTLE_ERROR_CODES:
+        bucket.on_throttle()
+    elif error_code is None:
+        bucket.on_success()
+
+
+def install(client, limiter=None):
+    """Rate-limit every call the EC2 client makes, including paginator and retry traffic"""
+    limiter = limiter or limiter_for_region(client.meta.region_name)
+
+    def before_parameter_build(params, model, context, **kwargs):
+        # Pick the bucket from the API parameters (Filters, VolumeIds, ...); by before-call
+        # they have already been serialized into the request body
+        context['ec2_throttle_bucket'] = limiter.bucket_for(model.name, params)
+
+    def before_call(model, params, context, **kwargs):
+        bucket = context.get('ec2_throttle_bucket') or limiter.bucket_for(model.name, {})
+        context['ec2_throttle_bucket'] = bucket
+        bucket.acquire()
+
+    def after_attempt(response, request_dict, **kwargs):
+        bucket = request_dict.get('context', {}).get('ec2_throttle_bucket')
+        if bucket is None or response is None:
+            # Connection errors say nothing about the request rate
+            return None
+        error_code = response[1].get('Error', {}).get('Code')
+        record_response(bucket, error_code)
+        if error_code in THROTTLE_ERROR_CODES:
+            # botocore is about to retry this call; make the retry wait for a token too
+            bucket.acquire()
+        # Returning None leaves the retry decision to botocore's retry handler
+
+    client.meta.events.register('before-parameter-build.ec2', before_parameter_build)
+    client.meta.events.register('before-call.ec2', before_call)
+    client.meta.events.register_first('needs-retry.ec2', after_attempt)
+    return client
+
+
+def ec2_client(region_name=None, session=None, max_pool_connections=10):
+    """Create an EC2 client with standard retries and the shared adaptive limiter"""
+    session = session or boto3.session.Session()
+    client = session.client('ec2', region_name=region_name, config=Config(
+        retries=RETRY_CONFIG,
+        max_pool_connections=max_pool_connections
+    ))
+    return install(client)
+
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+def simulated_endpoint(client, answer, latency=(0.01, 0.05)):
+    """Answer the client's requests locally: answer(operation_name) returns an error code or None"""
+    def before_send(request, event_name, **kwargs):
+        operation_name = event_name.rsplit('.', 1)[-1]
+        time.sleep(random.uniform(*latency))  # request latency
+        error_code = answer(operation_name)
+        if error_code is None:
+            status, body = 200, (f'<{operation_name}Response xmlns="http://ec2.amazonaws.com/doc/2016-11-15/">'
+                                 f'<requestId>simulated</requestId></{operation_name}Response>')
+        else:
+            status, body = 503, (f'<Response><Errors><Error><Code>{error_code}</Code><Message>simulated'
+                                 f'</Message></Error></Errors><RequestID>simulated</RequestID></Response>')
+        return AWSResponse(request.url, status, {}, _Body(body.encode()))
+
+    client.meta.events.register('before-send.ec2', before_send)
+    return client
+
+
+def simulated_client(answer, limiter=None, latency=(0.01, 0.05), max_pool_connections=10):
+    """A real EC2 client with the adaptive limiter installed, talking to simulated_endpoint"""
+    session = boto3.session.Session(aws_access_key_id='simulated', aws_secret_access_key='simulated',
+                                    region_name='us-east-1')
+    client = session.client('ec2', config=Config(retries=RETRY_CONFIG, max_pool_connections=max_pool_connections))
+    return simulated_endpoint(install(client, limiter or RegionLimiter()), answer, latency)
+
+
+# One call per category, as the simulation sends it
+SIMULATED_CALLS = {
+    'non_mutating': ('describe_volumes', {'Filters': [{'Name': 'status', 'Values': ['available']}]}),
+    'unfiltered_non_mutating': ('describe_volumes', {}),
+    'mutating': ('create_tags', {'Resources': ['vol-0123456789abcdef0'], 'Tags': [{'Key': 'k', 'Value': 'v'}]}),
+    'resource_intensive': ('delete_volume', {'VolumeId': 'vol-0123456789abcdef0'}),
+}
+
+
+def simulate(server_rate, workers, seconds, category='mutating'):
+    """Drive a real EC2 client against a simulated endpoint that throttles above server_rate calls/s"""
+    capacity, _ = CATEGORY_LIMITS[category]
+    server = AdaptiveTokenBucket(capacity=min(capacity, server_rate * 2), max_rate=server_rate)
+    server_lock = threading.Lock()
+    stats = {'ok': 0, 'throttled': 0, 'failed': 0}
+    stats_lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def answer(operation_name):
+        # The "server" answers RequestLimitExceeded when its own bucket is empty
+        with server_lock:
+            server._refill(time.monotonic())
+            allowed = server.tokens >= 1
+            if allowed:
+                server.tokens -= 1
+        with stats_lock:
+            stats['ok' if allowed else 'throttled'] += 1
+        return None if allowed else 'RequestLimitExceeded'
+
+    limiter = RegionLimiter()
+    client_bucket = limiter.buckets[category]
+    client = simulated_client(answer, limiter, max_pool_connections=workers)
+    method, params = SIMULATED_CALLS[category]
+
+    def worker():
+        while time.monotonic() < deadline:
+            try:
+                getattr(client, method)(**params)
+            except ClientError:
+                # botocore ran out of retry attempts (or retry quota)
+                with stats_lock:
+                    stats['failed'] += 1
+
+    def report():
+        start = time.monotonic()
+        while time.monotonic() < deadline:
+            time.sleep(1)
+            with stats_lock:
+                print(f"t={time.monotonic() - start:4.0f}s  client rate={client_bucket.rate:5.2f}/s  "
+                      f"ok={stats['ok']:5d}  throttled={stats['throttled']:4d}  failed={stats['failed']:4d}")
+
+    with ThreadPoolExecutor(max_workers=workers + 1) as executor:
+        executor.submit(report)
+        for _ in range(workers):
+            executor.submit(worker)
+
+    print(f"Finished: {stats['ok']} successful calls ({stats['ok'] / seconds:.2f}/s against a "
+          f"{server_rate}/s limit), {stats['throttled']} throttled, {stats['failed']} failed after retries")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate EC2 throttling against the adaptive limiter.")
+    parser.add_argument('--server-rate', type=float, default=3, help="simulated account limit, calls/s")
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--seconds', type=int, default=20)
+    parser.add_argument('--category', choices=sorted(CATEGORY_LIMITS), default='mutating')
+    args = parser.parse_args()
+    simulate(args.server_rate, args.workers, args.seconds, args.category)
@@ -1,20 +1,36 @@
-# Script intended to pull idle TA resources for a given account
+# Script intended to pull idle TA resources for a given account, or for every account in an organization
 # Refreshes and displays flagged resources for "Cost Optimization" category here https://aws.amazon.com/premiumsupport/ta-iam/
-# Need to implement multi-account and aggregated list options
+# All checks are refreshed at once; as each refresh finishes, the finished checks are summarized in
+# one describe_trusted_advisor_check_summaries call and only the checks with flagged resources are
+# fetched, in parallel. Every flagged resource is turned into one FlaggedResource record using the
+# check's column schema in CHECK_SCHEMAS and printed as soon as its check is in.
+# With --organization, a role is assumed into each member account (org_fanout.py) and every
+# (account, check) pair is refreshed and fetched concurrently, then merged into one savings table:
+#
+#   python get-underutilized-resources.py --organization --role-name OrganizationAccountAccessRole --sort-by savings
+#
+# --export csv parquet writes the records to files (ta_export.py) and --history appends the run
+# to a SQLite store (ta_history.py), then reports findings new since the last run and the top
+# savings per region.
+
+import argparse
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 import boto3
 
-client = boto3.client('support')
-iam = boto3.resource('iam')
-iam2 = boto3.client('iam')
-account_id = iam.CurrentUser().arn.split(':')[4]
-account_alias = iam2.list_account_aliases()['AccountAliases'][0]
+import org_fanout
+import ta_export
+import ta_history
+
+SUPPORT_REGION = "us-east-1"  # the Support API is only served from us-east-1
 
 language = "en"
 
 # Cost Optimization Checks
 # You can get more check IDs from here https://aws.amazon.com/premiumsupport/ta-iam/
-# and add them to the below array like this ta_checks = ['Qch7DwouX1', 'new_check1', 'new_check2']
+# and add them to the below dict along with a column schema in CHECK_SCHEMAS
 ta_checks = {"Qch7DwouX1" : "Low Utilization Amazon EC2 Instances",
 			 "Ti39halfu8" : "Amazon RDS Idle DB Instances",
 			 "DAvU99Dc4C" : "Underutilized Amazon EBS Volumes",
@@ -24,199 +40,374 @@ ta_checks = {"Qch7DwouX1" : "Low Utilization Amazon EC2 Instances",
 			 "1e93e4c0b5" : "Amazon EC2 Reserved Instance Lease Expiration",
 			 "1MoPEMsKx6" : "Amazon EC2 Reserved Instances Optimization"}
 
-
-# Refresh the checks first
-def refresh_checks():
-	for a_check in ta_checks:
-		try:
-			response = client.refresh_trusted_advisor_check(checkId=a_check)
-			if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-				print("Refreshed TA checks for: " + str(a_check)) 
-			else:
-				print("check: " + a_check + "could not be refreshed")
-		except Exception as e:
-			print(e)
-
-
-def get_ec2_check_results():
-	check_id = "Qch7DwouX1"
-	try:
-		response = client.describe_trusted_advisor_check_result(checkId=check_id, language=language)
-		flagged_resources = response['result']['flaggedResources']
-		estimated_savings = response['result']['categorySpecificSummary']['costOptimizing']['estimatedMonthlySavings']
-		instance = response['result']['flaggedResources'][0]['metadata']
-
-		if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-			if not flagged_resources:
-				print("====> No Low Utilization RDS Instances Found!")
-			else:				
-				for an_instance in flagged_resources:
-					print("=== Low Utilization Amazon EC2 Instances ===")
-					print("Account ID: " + account_id + "| Account Name: " + account_alias)
-					print("Region: " + str(instance[0]) + " | " + "Instance ID: " + str(instance[1]) 
-						+ " | " + "Instance Type: " + str(instance[3] + " | " + "Estimated Savings: " + str(instance[4])))
-		else:
-			print("error")
-	except Exception as e:
-		print(e)
-
-
-def get_rds_check_results():
-	check_id = "Ti39halfu8"
-	try:
-		response = client.describe_trusted_advisor_check_result(checkId=check_id, language=language)
-		flagged_resources = response['result']['flaggedResources']
-		#instance = response['result']['flaggedResources'][0]['metadata']
-
-		if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-			if not flagged_resources:
-				print("====> No Low Utilization RDS Instances Found!")
+# Where each check keeps its fields in a flagged resource's metadata list (the column order
+# describe_trusted_advisor_checks reports for the check); None when the check has no such column
+CheckSchema = namedtuple('CheckSchema', ['resource_label', 'region', 'resource_name', 'resource_type', 'savings'])
+
+CHECK_SCHEMAS = {
+	"Qch7DwouX1": CheckSchema("Instance ID", region=0, resource_name=1, resource_type=3, savings=4),
+	"Ti39halfu8": CheckSchema("DB Instance", region=0, resource_name=1, resource_type=3, savings=6),
+	"DAvU99Dc4C": CheckSchema("Volume ID", region=0, resource_name=1, resource_type=3, savings=5),
+	"G31sQ1E9U": CheckSchema("Cluster", region=1, resource_name=2, resource_type=3, savings=5),
+	"hjLMh88uM8": CheckSchema("Load Balancer", region=0, resource_name=1, resource_type=None, savings=3),
+	"Z4AUBRNSmz": CheckSchema("EIP", region=0, resource_name=1, resource_type=None, savings=None),
+	"1e93e4c0b5": CheckSchema("Reserved Instance ID", region=1, resource_name=8, resource_type=2, savings=6),
+	"1MoPEMsKx6": CheckSchema("Instance Type", region=0, resource_name=1, resource_type=1, savings=5),
+}
+
+FlaggedResource = namedtuple('FlaggedResource', [
+	'account_id', 'account_name', 'check_id', 'check_name', 'status',
+	'region', 'resource_id', 'resource_name', 'resource_type', 'savings', 'metadata'
+])
+
+
+REFRESH_POLL_INTERVAL = 5  # seconds between refresh status polls
+REFRESH_TIMEOUT = 900      # give up waiting on a refresh after this many seconds and use the last result
+STATUS_BATCH_SIZE = 100    # check ids per refresh status / check summary call
+IN_PROGRESS = ('enqueued', 'processing')
+
+
+def iter_batches(items, size):
+	for i in range(0, len(items), size):
+		yield items[i:i + size]
+
+
+def summary_as_result(summary):
+	"""A check result with nothing flagged, built from its summary instead of fetched"""
+	return {'result': {
+		'checkId': summary['checkId'],
+		'timestamp': summary.get('timestamp', ''),
+		'status': summary['status'],
+		'resourcesSummary': summary['resourcesSummary'],
+		'categorySpecificSummary': summary.get('categorySpecificSummary', {}),
+		'flaggedResources': []
+	}}
+
+
+def refresh_and_fetch(targets, get_client, on_result, workers=10, refresh=True,
+					  poll_interval=REFRESH_POLL_INTERVAL, timeout=REFRESH_TIMEOUT):
+	"""Refresh (account, check id) targets concurrently and fetch each result as soon as it is ready.
+
+	Each account's refresh statuses are read first so checks that can't be refreshed yet
+	(millisUntilNextRefreshIsAllowed > 0) are used straight away, the rest are refreshed
+	together and polled in batches. Checks that are ready are summarized in bulk and only
+	those with flagged resources are fetched. on_result(account, check_id, response, error)
+	is called from this thread for every target.
+	"""
+	deadline = time.monotonic() + timeout
+	futures = {}
+	pending = {}  # account -> check ids whose refresh is still running
+	ready = {}    # account -> check ids to summarize in the next batch
+
+	with ThreadPoolExecutor(max_workers=workers) as executor:
+		def submit(kind, account, payload, func, **kwargs):
+			futures[executor.submit(func, **kwargs)] = (kind, account, payload)
+
+		def fetch(account, check_id):
+			submit('fetch', account, check_id, get_client(account).describe_trusted_advisor_check_result,
+				   checkId=check_id, language=language)
+
+		def batched(kind, account, check_ids):
+			func = (get_client(account).describe_trusted_advisor_check_summaries if kind == 'summary'
+					else get_client(account).describe_trusted_advisor_check_refresh_statuses)
+			for batch in iter_batches(check_ids, STATUS_BATCH_SIZE):
+				submit(kind, account, batch, func, checkIds=batch)
+
+		by_account = {}
+		for account, check_id in targets:
+			by_account.setdefault(account, []).append(check_id)
+		for account, check_ids in by_account.items():
+			batched('precheck' if refresh else 'summary', account, check_ids)
+
+		next_poll = time.monotonic() + poll_interval
+		while futures or pending:
+			if futures:
+				done, _ = wait(futures, timeout=max(0, next_poll - time.monotonic()), return_when=FIRST_COMPLETED)
 			else:
-				print(flagged_resources)	
-				for an_instance in flagged_resources:
-					print("=== Low Utilization Amazon RDS Instances ===")
-					print("Account ID: " + account_id + "| Account Name: " + account_alias)
-					print(an_instance)
-		else:
-			print("error")
-
-	except Exception as e:
-		print(e)
-
-
-def get_ebs_check_results():
-	check_id = "DAvU99Dc4C"
-	try:
-		response = client.describe_trusted_advisor_check_result(checkId=check_id, language=language)
-		flagged_resources = response['result']['flaggedResources']
-		volume = response['result']['flaggedResources'][0]['metadata']
-
-		if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-			if not flagged_resources:
-				print("====> No Low Utilization EBS Volumes Found!")
-			else:	
-				for a_volume in flagged_resources:
-					print("=== Low Utilization EBS Volumes ===")
-					print("Account ID: " + account_id + "| Account Name: " + account_alias)
-					print("Region: " + str(volume[0]) + " | " + "Volume ID: " + str(volume[1]) 
-						+ " | " + "Volume Type: " + str(volume[3] + " | " + "Estimated Savings: " + str(volume[5])))
-		else:
-			print("error")
-	except Exception as e:
-		print(e)
-
-
-def get_redshift_check_results():
-	check_id = "G31sQ1E9U"
-	try:
-		response = client.describe_trusted_advisor_check_result(checkId=check_id, language=language)
-		flagged_resources = response['result']['flaggedResources']
-		#cluster = response['result']['flaggedResources'][0]['metadata']
-
-		if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-			if not flagged_resources:
-				print("====> No Low Utilization Clusters Found!")
-			else:	
-				for a_cluster in flagged_resources:
-					print("=== Low Utilization Clusters ===")
-					print("Account ID: " + account_id + "| Account Name: " + account_alias)
-					print(a_cluster)	
-		else:
-			print("error")
-	except Exception as e:
-		print(e)
-
-
-def get_elb_check_results():
-	check_id = "hjLMh88uM8"
-	try:
-		response = client.describe_trusted_advisor_check_result(checkId=check_id, language=language)
-		flagged_resources = response['result']['flaggedResources']
-		#elb = response['result']['flaggedResources'][0]['metadata']
-
-		if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-			if not flagged_resources:
-				print("====> No Low Utilization ELB Found!")
-			else:	
-				for an_elb in flagged_resources:
-					print("=== Low Utilization ELBs ===")
-					print("Account ID: " + account_id + "| Account Name: " + account_alias)
-					print(an_elb)	
-		else:
-			print("error")
-	except Exception as e:
-		print(e)
-
-
-def get_eip_check_results():
-	check_id = "Z4AUBRNSmz"
-	try:
-		response = client.describe_trusted_advisor_check_result(checkId=check_id, language=language)
-		flagged_resources = response['result']['flaggedResources']
-		eip = response['result']['flaggedResources'][0]['metadata']
-
-		if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-			if not flagged_resources:
-				print("====> No Unassociated Elastic IP Addresses Found!")
-			else:	
-				for an_elb in flagged_resources:
-					print("=== Unassociated Elastic IP Addresses ===")
-					print("Account ID: " + account_id + "| Account Name: " + account_alias)
-					print("Region: " + str(eip[0]) + " | " + "EIP: " + str(eip[1]))
-		else:
-			print("error")
-	except Exception as e:
-		print(e)
-
-
-def get_ri_expiration_check_results():
-	check_id = "1e93e4c0b5"
+				time.sleep(max(0, next_poll - time.monotonic()))
+				done = []
+
+			for future in done:
+				kind, account, payload = futures.pop(future)
+				try:
+					value = future.result()
+				except Exception as e:
+					if kind == 'fetch':
+						on_result(account, payload, None, e)
+					elif kind == 'precheck':
+						# Fall back to refreshing each check on its own
+						for check_id in payload:
+							submit('refresh', account, check_id, get_client(account).refresh_trusted_advisor_check,
+								   checkId=check_id)
+					elif kind == 'summary':
+						for check_id in payload:
+							fetch(account, check_id)
+					else:
+						# Not refreshable or status unavailable: use the latest result there is
+						ready.setdefault(account, []).extend(payload if kind == 'poll' else [payload])
+					continue
+
+				if kind == 'fetch':
+					on_result(account, payload, value, None)
+				elif kind == 'summary':
+					for summary in value['summaries']:
+						if summary['resourcesSummary']['resourcesFlagged']:
+							fetch(account, summary['checkId'])
+						else:
+							on_result(account, summary['checkId'], summary_as_result(summary), None)
+				elif kind == 'refresh':
+					if value['status']['status'] in IN_PROGRESS:
+						pending.setdefault(account, set()).add(payload)
+					else:
+						ready.setdefault(account, []).append(payload)
+				else:
+					for status in value['statuses']:
+						check_id = status['checkId']
+						if status['status'] in IN_PROGRESS:
+							pending.setdefault(account, set()).add(check_id)
+						elif kind == 'precheck' and status['millisUntilNextRefreshIsAllowed'] == 0:
+							submit('refresh', account, check_id, get_client(account).refresh_trusted_advisor_check,
+								   checkId=check_id)
+						else:
+							# Finished, or refreshed too recently to refresh again: the result is current
+							ready.setdefault(account, []).append(check_id)
+
+			now = time.monotonic()
+			if now >= deadline:
+				for account, check_ids in pending.items():
+					for check_id in check_ids:
+						print("Refresh of " + check_id + " in " + str(account) + " timed out, using the last result")
+					ready.setdefault(account, []).extend(check_ids)
+				pending = {}
+			elif pending and now >= next_poll:
+				for account, check_ids in pending.items():
+					batched('poll', account, sorted(check_ids))
+				pending = {}
+			if now >= next_poll:
+				next_poll = now + poll_interval
+
+			# Everything that finished in this pass shares one summaries call per account
+			for account, check_ids in ready.items():
+				batched('summary', account, check_ids)
+			ready = {}
+
+
+def parse_savings(value):
+	"""'$1,234.56' -> 1234.56; missing or non-numeric values count as 0.0"""
 	try:
-		response = client.describe_trusted_advisor_check_result(checkId=check_id, language=language)
-		flagged_resources = response['result']['flaggedResources']
-		#riexp = response['result']['flaggedResources'][0]['metadata']
-
-		if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-			if not flagged_resources:
-				print("====> No RI Expiration Found!")
-			else:	
-				for an_expiration in flagged_resources:
-					print("=== RI Expirations ===")
-					print("Account ID: " + account_id + "| Account Name: " + account_alias)
-					print(an_expiration)	
-		else:
-			print("error")
-	except Exception as e:
-		print(e)
-
-
-def get_ri_optimization_results():
-	check_id = "1MoPEMsKx6"
+		return float(str(value).replace('$', '').replace(',', '').strip())
+	except (TypeError, ValueError):
+		return 0.0
+
+
+def iter_flagged_resources(account_id, account_name, check_id, result):
+	"""Yield one FlaggedResource per flagged resource in a check result"""
+	schema = CHECK_SCHEMAS[check_id]
+	for resource in result.get('flaggedResources', []):
+		metadata = tuple(resource.get('metadata') or ())
+
+		def column(index):
+			if index is None or index >= len(metadata):
+				return None
+			return metadata[index]
+
+		yield FlaggedResource(
+			account_id=account_id,
+			account_name=account_name,
+			check_id=check_id,
+			check_name=ta_checks[check_id],
+			status=resource.get('status', ''),
+			region=column(schema.region) or resource.get('region', ''),
+			# Trusted Advisor's own id is unique per flagged resource; the display name (an instance
+			# type, or an RDS/ELB name that is only unique within a region) may repeat
+			resource_id=resource.get('resourceId') or column(schema.resource_name) or '',
+			resource_name=column(schema.resource_name) or resource.get('resourceId', ''),
+			resource_type=column(schema.resource_type),
+			savings=parse_savings(column(schema.savings)),
+			metadata=metadata
+		)
+
+
+def print_check_records(check_id, records, account_id, account_alias):
+	schema = CHECK_SCHEMAS[check_id]
+	if not records:
+		print("====> No " + ta_checks[check_id] + " Found!")
+		return
+	print("=== " + ta_checks[check_id] + " ===")
+	print("Account ID: " + account_id + " | Account Name: " + account_alias)
+	for record in records:
+		line = "Region: " + str(record.region) + " | " + schema.resource_label + ": " + str(record.resource_name)
+		if schema.resource_type is not None and schema.resource_type != schema.resource_name:
+			line += " | Type: " + str(record.resource_type)
+		if schema.savings is not None:
+			line += " | Estimated Savings: $%.2f" % record.savings
+		print(line)
+
+
+def report_account(client, account_id, account_alias, refresh=True):
+	"""Refresh and print every check in the current account; return its records"""
+	start = time.monotonic()
+	all_records = []
+
+	def on_result(account, check_id, response, error):
+		if error:
+			print("check: " + check_id + " could not be fetched: " + str(error))
+			return
+		records = list(iter_flagged_resources(account_id, account_alias, check_id, response['result']))
+		print("Results for: " + check_id + " (%.1fs)" % (time.monotonic() - start))
+		print_check_records(check_id, records, account_id, account_alias)
+		all_records.extend(records)
+
+	refresh_and_fetch([(account_id, check_id) for check_id in ta_checks], lambda account: client, on_result,
+					  workers=len(ta_checks), refresh=refresh)
+	return all_records
+
+
+def summarize_check(account, check_id, result, records):
+	"""Aggregated table row for one check in one account"""
+	savings = result.get('categorySpecificSummary', {}).get('costOptimizing', {}).get('estimatedMonthlySavings')
+	return {
+		'account_id': account['Id'],
+		'account_name': account['Name'],
+		'check_id': check_id,
+		'check_name': ta_checks[check_id],
+		'status': result.get('status', ''),
+		'flagged': len(records),
+		'savings': float(savings) if savings is not None else sum(record.savings for record in records)
+	}
+
+
+def sweep_organization(cache, accounts, workers=org_fanout.DEFAULT_WORKERS, refresh=True):
+	"""Refresh and fetch every check in every account.
+
+	Returns (rows, records, [(account, check id or None, error)]).
+	"""
+	failures = []
+	role_errors = org_fanout.assume_all(cache, [account['Id'] for account in accounts], workers)
+	for account in accounts:
+		if account['Id'] in role_errors:
+			failures.append((account, None, role_errors[account['Id']]))
+			print("Could not assume " + cache.role_name + " in " + account['Id'] + ": " + str(role_errors[account['Id']]))
+
+	accounts_by_id = {account['Id']: account for account in accounts if account['Id'] not in role_errors}
+	rows = []
+	all_records = []
+
+	def on_result(account_id, check_id, response, error):
+		account = accounts_by_id[account_id]
+		if error:
+			failures.append((account, check_id, error))
+			print("Could not fetch " + check_id + " in " + account_id + ": " + str(error))
+			return
+		records = list(iter_flagged_resources(account_id, account['Name'], check_id, response['result']))
+		rows.append(summarize_check(account, check_id, response['result'], records))
+		all_records.extend(records)
+
+	targets = [(account_id, check_id) for account_id in accounts_by_id for check_id in ta_checks]
+	refresh_and_fetch(targets, lambda account_id: cache.client(account_id, 'support', SUPPORT_REGION), on_result,
+					  workers=workers, refresh=refresh)
+	return rows, all_records, failures
+
+
+SORT_KEYS = {
+	'savings': lambda row: (-row['savings'], row['account_id'], row['check_name']),
+	'flagged': lambda row: (-row['flagged'], row['account_id'], row['check_name']),
+	'account': lambda row: (row['account_name'].lower(), row['account_id'], row['check_name']),
+	'check': lambda row: (row['check_name'], -row['savings'])
+}
+
+
+def print_savings_table(rows, sort_by='savings'):
+	rows = sorted(rows, key=SORT_KEYS[sort_by])
+	name_width = max([len("Account Name")] + [len(row['account_name']) for row in rows])
+	check_width = max([len("Check")] + [len(row['check_name']) for row in rows])
+	print("Account ID    | " + "Account Name".ljust(name_width) + " | " + "Check".ljust(check_width)
+		+ " | Flagged | Est. Monthly Savings")
+	for row in rows:
+		print(row['account_id'].ljust(13) + " | " + row['account_name'].ljust(name_width) + " | "
+			+ row['check_name'].ljust(check_width) + " | " + str(row['flagged']).rjust(7) + " | "
+			+ ("$%.2f" % row['savings']).rjust(20))
+	total_savings = sum(row['savings'] for row in rows)
+	total_flagged = sum(row['flagged'] for row in rows)
+	accounts = len(set(row['account_id'] for row in rows))
+	print("TOTAL: " + str(total_flagged) + " flagged resources across " + str(accounts)
+		+ " accounts, estimated monthly savings $%.2f" % total_savings)
+
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Pull Trusted Advisor cost optimization results.")
+	parser.add_argument('--organization', action='store_true',
+						help="sweep every active account in the organization (run from the management account)")
+	parser.add_argument('--role-name', default=org_fanout.DEFAULT_ROLE_NAME,
+						help="role to assume in each member account (default: %(default)s)")
+	parser.add_argument('--workers', type=int, default=org_fanout.DEFAULT_WORKERS,
+						help="concurrent accounts/checks (default: %(default)s)")
+	parser.add_argument('--sort-by', choices=sorted(SORT_KEYS), default='savings',
+						help="order of the aggregated table (default: %(default)s)")
+	parser.add_argument('--no-refresh', action='store_true', help="fetch results without refreshing checks first")
+	parser.add_argument('--export', nargs='+', choices=ta_export.FORMATS, default=[],
+						help="also write the flagged resources to files in these formats")
+	parser.add_argument('--output', default="underutilized-resources",
+						help="base path for --export files (default: %(default)s)")
+	parser.add_argument('--history', nargs='?', const=ta_history.DEFAULT_HISTORY_FILE,
+						help="append this run to a SQLite history (default file: " + ta_history.DEFAULT_HISTORY_FILE
+						+ ") and report new findings and top savings by region")
+	parser.add_argument('--top', type=int, default=5, help="findings per region in the --history report (default: %(default)s)")
+	return parser.parse_args()
+
+
+def save_results(records, args):
+	"""Write the requested exports and history entry for a run's records"""
+	if args.export:
+		for path in ta_export.export(records, args.output, args.export):
+			print("Exported " + str(len(records)) + " flagged resources to " + path)
+	if not args.history:
+		return
+
+	store = ta_history.HistoryStore(args.history)
 	try:
-		response = client.describe_trusted_advisor_check_result(checkId=check_id, language=language)
-		flagged_resources = response['result']['flaggedResources']
-		#rires = response['result']['flaggedResources'][0]['metadata']
-
-		if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-			if not flagged_resources:
-				print("====> No RI Optimization Result Found!")
-			else:	
-				for optimization in flagged_resources:
-					print("=== RI Optimization Result ===")
-					print("Account ID: " + account_id + "| Account Name: " + account_alias)
-					print(optimization)	
-		else:
-			print("error")
-	except Exception as e:
-		print(e)
-
-
-refresh_checks()
-get_ec2_check_results()
-get_rds_check_results()
-get_ebs_check_results()
-get_redshift_check_results()
-get_elb_check_results()
-get_eip_check_results()
-get_ri_expiration_check_results()
-get_ri_optimization_results()
+		run_id, stored = store.record_run(records)
+		print("Recorded run " + str(run_id) + " in " + args.history + " (" + str(stored) + " unique findings)")
+		new_findings = store.new_since_last_run(run_id)
+		print("=== New since last run: " + str(len(new_findings)) + " ===")
+		for finding in new_findings:
+			print(finding['account_id'] + " | " + finding['check_name'] + " | " + finding['region'] + " | "
+				+ finding['resource_name'] + " | $%.2f" % finding['savings'])
+		print("=== Top " + str(args.top) + " savings by region ===")
+		for region, findings in store.top_savings_by_region(args.top, run_id).items():
+			print("Region: " + region)
+			for finding in findings:
+				print("  $%.2f | " % finding['savings'] + finding['account_id'] + " | " + finding['check_name']
+					+ " | " + finding['resource_name'])
+	finally:
+		store.close()
+
+
+def main_organization(args):
+	session = boto3.session.Session()
+	sts = session.client('sts')
+	home_account = sts.get_caller_identity()['Account']
+	accounts = org_fanout.list_accounts(session.client('organizations'))
+	cache = org_fanout.CredentialCache(sts, args.role_name, home_account=home_account, home_session=session)
+	print("Sweeping " + str(len(accounts)) + " accounts x " + str(len(ta_checks)) + " checks with "
+		+ str(args.workers) + " workers")
+	start = time.monotonic()
+	rows, records, failures = sweep_organization(cache, accounts, args.workers, refresh=not args.no_refresh)
+	print_savings_table(rows, args.sort_by)
+	print("Finished in %.1fs (%d roles assumed, %d failures)" % (time.monotonic() - start, cache.assumed, len(failures)))
+	save_results(records, args)
+
+
+if __name__ == "__main__":
+	args = parse_args()
+	if args.organization:
+		main_organization(args)
+	else:
+		client = boto3.client('support', region_name=SUPPORT_REGION)
+		iam = boto3.resource('iam')
+		iam2 = boto3.client('iam')
+		account_id = iam.CurrentUser().arn.split(':')[4]
+		account_alias = iam2.list_account_aliases()['AccountAliases'][0]
+
+		records = report_account(client, account_id, account_alias, refresh=not args.no_refresh)
+		save_results(records, args)
@@ -2,19 +2,56 @@
 # OpenSearch Resource Cleaner
 # This script lists and deletes various OpenSearch resources with an interactive menu
 
+import argparse
 import boto3
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
-from datetime import datetime
+from datetime import datetime, timezone
+
+from resource_selector import SYNTAX, ResourceIndex
+from resource_waiter import DONE, FAILED, TIMED_OUT, ResourceWaiter
+
+COLLECTION_BATCH_SIZE = 100       # most ids batch_get_collection accepts per call
+DESCRIBE_DOMAINS_BATCH_SIZE = 5   # most names describe_domains accepts per call
+COLLECTION_DELETE_TIMEOUT = 900   # seconds to wait for a collection to disappear
+DOMAIN_DELETE_TIMEOUT = 3600      # domains can take well over ten minutes to go
+STATE_NAMES = {DONE: 'deleted'}
+LIST_WORKERS = 8                  # concurrent list, describe and status calls
+
+def _from_epoch_millis(value):
+    """OpenSearch Serverless reports timestamps as epoch milliseconds"""
+    return datetime.fromtimestamp(value / 1000, timezone.utc) if value else None
+
+def _batches(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _domain_state(status):
+    if status.get('Deleted'):
+        return 'Deleting'
+    if status.get('DomainProcessingStatus'):
+        return status['DomainProcessingStatus']
+    return 'Processing' if status.get('Processing') else 'Active'
+
+def _domain_size(status):
+    """Data nodes and total EBS storage, e.g. '3 x r6g.large, 300 GiB'"""
+    cluster = status.get('ClusterConfig', {})
+    count = cluster.get('InstanceCount', 0)
+    size = f"{count} x {cluster.get('InstanceType', '?')}"
+    ebs = status.get('EBSOptions', {})
+    if ebs.get('EBSEnabled'):
+        size += f", {ebs.get('VolumeSize', 0) * count} GiB"
+    return size
 
 class OpenSearchCleaner:
-    def __init__(self):
+    def __init__(self, max_workers=LIST_WORKERS):
         # Use the default region from AWS CLI configuration
         session = boto3.session.Session()
         self.region = session.region_name or "us-east-1"
         self.client = boto3.client('opensearch', region_name=self.region)
         self.serverless_client = boto3.client('opensearchserverless', region_name=self.region)
+        self.max_workers = max_workers
         
     def print_header(self):
         """Print a header for the application"""
@@ -25,107 +62,95 @@ class OpenSearchCleaner:
         print("=" * 60 + "\n")
 
     def fetch_all_resources(self):
-        """Fetch all OpenSearch resources and return them in a single list"""
-        all_resources = []
-        resource_index = 1  # Start numbering from 1
-        
-        # Fetch domains
-        print("Fetching OpenSearch domains...")
-        try:
-            response = self.client.list_domain_names()
-            for domain in response.get('DomainNames', []):
-                all_resources.append({
-                    'index': resource_index,
-                    'name': domain['DomainName'],
-                    'id': domain['DomainName'],
-                    'type': 'Domain',
-                    'delete_function': self.delete_domain
-                })
-                resource_index += 1
-        except ClientError as e:
-            print(f"Error listing domains: {e}")
-        
-        # Fetch serverless collections
-        print("Fetching OpenSearch serverless collections...")
-        try:
-            response = self.serverless_client.list_collections()
-            for collection in response.get('collectionSummaries', []):
-                all_resources.append({
-                    'index': resource_index,
-                    'name': collection['name'],
-                    'id': collection['id'],
-                    'type': 'Serverless Collection',
-                    'delete_function': self.delete_serverless_collection
-                })
-                resource_index += 1
-        except ClientError as e:
-            print(f"Error listing serverless collections: {e}")
-        
-        # Fetch VPC endpoints
-        print("Fetching OpenSearch VPC endpoints...")
-        try:
-            response = self.serverless_client.list_vpc_endpoints()
-            for endpoint in response.get('vpcEndpointSummaries', []):
-                all_resources.append({
-                    'index': resource_index,
-                    'name': endpoint['id'],
-                    'id': endpoint['id'],
-                    'type': 'VPC Endpoint',
-                    'delete_function': self.delete_vpc_endpoint
-                })
-                resource_index += 1
-        except ClientError as e:
-            print(f"Error listing VPC endpoints: {e}")
-        
-        # Fetch data access policies
-        print("Fetching OpenSearch data access policies...")
+        """Fetch all OpenSearch resources and return them in a single list.
+
+        The six listings run concurrently and each follows nextToken to the end. Domains are
+        then described five at a time (the describe_domains limit) for their state and size,
+        and collections 100 at a time with batch_get_collection for their state. Results are
+        merged in a fixed order, so numbering is the same on every run.
+        """
+        print("Fetching OpenSearch domains, serverless collections, VPC endpoints and policies...")
+        start = time.monotonic()
+        listings = [
+            # (type, description, list call, result key, list arguments, name field, id field, delete function)
+            ('Domain', 'domains', self.client.list_domain_names, 'DomainNames', {},
+             'DomainName', 'DomainName', self.delete_domain),
+            ('Serverless Collection', 'serverless collections', self.serverless_client.list_collections,
+             'collectionSummaries', {}, 'name', 'id', self.delete_serverless_collection),
+            ('VPC Endpoint', 'VPC endpoints', self.serverless_client.list_vpc_endpoints,
+             'vpcEndpointSummaries', {}, 'id', 'id', self.delete_vpc_endpoint),
+            ('Data Access Policy', 'data access policies', self.serverless_client.list_access_policies,
+             'accessPolicySummaries', {'type': 'data'}, 'name', 'name', self.delete_data_access_policy),
+            ('Network Policy', 'network policies', self.serverless_client.list_security_policies,
+             'securityPolicySummaries', {'type': 'network'}, 'name', 'name', self.delete_network_policy),
+            ('Encryption Policy', 'encryption policies', self.serverless_client.list_security_policies,
+             'securityPolicySummaries', {'type': 'encryption'}, 'name', 'name', self.delete_encryption_policy),
+        ]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            tasks = [executor.submit(self._list_resources, *listing) for listing in listings]
+            domains, collections = tasks[0].result(), tasks[1].result()
+
+            # Enrich in bulk as soon as the domain and collection listings are in
+            details = [executor.submit(self._describe_domains, batch)
+                       for batch in _batches([d['id'] for d in domains], DESCRIBE_DOMAINS_BATCH_SIZE)]
+            details += [executor.submit(self._describe_collections, batch)
+                        for batch in _batches([c['id'] for c in collections], COLLECTION_BATCH_SIZE)]
+
+            all_resources = [resource for task in tasks for resource in task.result()]
+            by_id = {(r['type'], r['id']): r for r in all_resources}
+            for task in details:
+                for key, fields in task.result().items():
+                    by_id[key].update(fields)
+
+        for number, resource in enumerate(all_resources, start=1):  # Start numbering from 1
+            resource['index'] = number
+        print(f"Found {len(all_resources)} resources in {time.monotonic() - start:.1f}s")
+        return all_resources
+
+    def _list_resources(self, type_name, description, call, result_key, kwargs, name_field, id_field, delete_function):
+        """List one resource type, following nextToken until the listing is complete"""
+        resources = []
         try:
-            response = self.serverless_client.list_access_policies(type='data')
-            for policy in response.get('accessPolicySummaries', []):
-                all_resources.append({
-                    'index': resource_index,
-                    'name': policy['name'],
-                    'id': policy['name'],
-                    'type': 'Data Access Policy',
-                    'delete_function': self.delete_data_access_policy
-                })
-                resource_index += 1
+            while True:
+                response = call(**kwargs)
+                for item in response.get(result_key, []):
+                    resources.append({
+                        'name': item[name_field],
+                        'id': item[id_field],
+                        'type': type_name,
+                        'state': '',
+                        'size': '',
+                        'created': _from_epoch_millis(item.get('createdDate')),  # only policies list it
+                        'delete_function': delete_function
+                    })
+                if not response.get('nextToken'):
+                    break
+                kwargs = dict(kwargs, nextToken=response['nextToken'])
         except ClientError as e:
-            print(f"Error listing data access policies: {e}")
-        
-        # Fetch network policies
-        print("Fetching OpenSearch network policies...")
+            print(f"Error listing {description}: {e}")
+        return resources
+
+    def _describe_domains(self, names):
+        """State and size for up to five domains in one describe_domains call"""
         try:
-            response = self.serverless_client.list_security_policies(type='network')
-            for policy in response.get('securityPolicySummaries', []):
-                all_resources.append({
-                    'index': resource_index,
-                    'name': policy['name'],
-                    'id': policy['name'],
-                    'type': 'Network Policy',
-                    'delete_function': self.delete_network_policy
-                })
-                resource_index += 1
+            statuses = self.client.describe_domains(DomainNames=names)['DomainStatusList']
         except ClientError as e:
-            print(f"Error listing network policies: {e}")
-        
-        # Fetch encryption policies
-        print("Fetching OpenSearch encryption policies...")
+            print(f"Error describing domains {', '.join(names)}: {e}")
+            return {}
+        return {('Domain', status['DomainName']): {'state': _domain_state(status), 'size': _domain_size(status)}
+                for status in statuses}
+
+    def _describe_collections(self, ids):
+        """State and creation time for up to 100 collections in one batch_get_collection call"""
         try:
-            response = self.serverless_client.list_security_policies(type='encryption')
-            for policy in response.get('securityPolicySummaries', []):
-                all_resources.append({
-                    'index': resource_index,
-                    'name': policy['name'],
-                    'id': policy['name'],
-                    'type': 'Encryption Policy',
-                    'delete_function': self.delete_encryption_policy
-                })
-                resource_index += 1
+            details = self.serverless_client.batch_get_collection(ids=ids)['collectionDetails']
         except ClientError as e:
-            print(f"Error listing encryption policies: {e}")
-        
-        return all_resources
+            print(f"Error describing serverless collections: {e}")
+            return {}
+        return {('Serverless Collection', detail['id']): {'state': detail.get('status', ''),
+                                                           'created': _from_epoch_millis(detail.get('createdDate'))}
+                for detail in details}
 
     def display_resources(self, resources):
         """Display all resources in a single consolidated view"""
@@ -134,33 +159,28 @@ class OpenSearchCleaner:
             return
         
         print("\nAvailable OpenSearch Resources:")
-        print("-" * 80)
-        print(f"{'#':<5} {'Type':<25} {'Name':<30} {'ID':<20}")
-        print("-" * 80)
+        print("-" * 120)
+        print(f"{'#':<5} {'Type':<25} {'Name':<30} {'ID':<20} {'State':<12} {'Size':<25}")
+        print("-" * 120)
         
         for resource in resources:
-            print(f"{resource['index']:<5} {resource['type']:<25} {resource['name']:<30} {resource['id']:<20}")
+            print(f"{resource['index']:<5} {resource['type']:<25} {resource['name']:<30} {resource['id']:<20} "
+                  f"{resource['state']:<12} {resource['size']:<25}")
     
-    def select_resources(self, resources):
-        """Let user select resources by number"""
+    def select_resources(self, resources, selection=None):
+        """Let user select resources by number, range or filter (see resource_selector.py)"""
         if not resources:
             return []
         
-        selection = input("\nEnter the number(s) of resources to delete (comma-separated): ")
+        if selection is None:
+            selection = input(f"\nEnter the resources to delete ({SYNTAX}; comma-separated): ")
         
-        selected_indices = []
         try:
-            for num in selection.split(','):
-                selected_indices.append(int(num.strip()))
-        except ValueError:
-            print(f"Invalid input: {num}. Must be a number.")
+            selected_resources = ResourceIndex(resources).select(selection)
+        except ValueError as e:
+            print(f"Invalid selection: {e}")
             return []
         
-        selected_resources = []
-        for resource in resources:
-            if resource['index'] in selected_indices:
-                selected_resources.append(resource)
-        
         if not selected_resources:
             print("No valid resources selected.")
         else:
@@ -176,86 +196,150 @@ class OpenSearchCleaner:
         return confirm.lower() in ['yes', 'y']
 
     def delete_resources(self, resources):
-        """Delete selected resources one by one"""
+        """Submit every selected deletion at once and track each one to a final state.
+
+        Domains are watched with describe_domains and collections with batch_get_collection,
+        batched across every pending deletion, so the run takes as long as the slowest one.
+        Policies are deleted once the selected collections are gone, since a policy still in
+        use by a collection can't be. A progress table is printed while deletions run and a
+        per-resource table at the end. Returns True if every deletion succeeded.
+        """
         print("\nDeleting resources...")
-        
+        start = time.monotonic()
+        waiter = ResourceWaiter(timeout=COLLECTION_DELETE_TIMEOUT, max_concurrent_calls=self.max_workers,
+                                progress=lambda waiter: self.print_progress(resources, waiter, start))
+        collection_keys = []
+        policies = []
+
+        def watch(resource, **kwargs):
+            waiter.watch((resource['type'], resource['id']), start=lambda: self._start_deletion(resource),
+                         label=f"{resource['type']} {resource['name']} ({resource['id']})", **kwargs)
+
         for resource in resources:
-            print(f"\nDeleting {resource['type']}: {resource['name']} ({resource['id']})...")
-            try:
-                resource['delete_function'](resource['id'])
-            except Exception as e:
-                print(f"ERROR: Failed to delete {resource['type']} {resource['name']}: {e}")
+            key = (resource['type'], resource['id'])
+            label = f"{resource['type']} {resource['name']} ({resource['id']})"
+            if resource['type'] == 'Domain':
+                waiter.watch_batch(key, 'domains', self._domains_deleted, DESCRIBE_DOMAINS_BATCH_SIZE,
+                                   start=lambda r=resource: self._start_deletion(r),
+                                   timeout=DOMAIN_DELETE_TIMEOUT, label=label)
+            elif resource['type'] == 'Serverless Collection':
+                waiter.watch_batch(key, 'collections', self._collections_deleted, COLLECTION_BATCH_SIZE,
+                                   start=lambda r=resource: self._start_deletion(r), label=label)
+                collection_keys.append(key)
+            elif resource['type'].endswith('Policy'):
+                policies.append(resource)
+            else:
+                watch(resource)
+        waiter.after(collection_keys, lambda: [watch(policy) for policy in policies])
+
+        waiter.run()
+        self.print_final_states(resources, waiter, start)
+        return all(state == DONE for state, _, _ in waiter.results.values())
+
+    def _start_deletion(self, resource):
+        print(f"\nDeleting {resource['type']}: {resource['name']} ({resource['id']})...")
+        resource['delete_function'](resource['id'])
+
+    def print_progress(self, resources, waiter, start):
+        """Per-type counts of waiting, deleting and finished deletions"""
+        columns = ['waiting', 'deleting', DONE, FAILED, TIMED_OUT]
+        counts = {}
+        for resource in resources:
+            key = (resource['type'], resource['id'])
+            if key in waiter.results:
+                column = waiter.results[key][0]
+            else:
+                column = 'deleting' if key in waiter.pending else 'waiting'
+            counts.setdefault(resource['type'], dict.fromkeys(columns, 0))[column] += 1
+        print(f"\n[{time.monotonic() - start:5.0f}s] {'Type':<25} "
+              + " ".join(f"{STATE_NAMES.get(c, c):>9}" for c in columns))
+        for type_name, row in counts.items():
+            print(f"{'':8} {type_name:<25} " + " ".join(f"{row[c]:>9}" for c in columns))
+
+    def print_final_states(self, resources, waiter, start):
+        """One row per selected resource with how its deletion ended"""
+        print(f"\nFinal state after {time.monotonic() - start:.0f}s:")
+        print("-" * 120)
+        print(f"{'#':<5} {'Type':<25} {'Name':<30} {'State':<10} {'Seconds':>8}  {'Detail'}")
+        print("-" * 120)
+        for resource in resources:
+            state, detail, seconds = waiter.results.get((resource['type'], resource['id']), ('not started', None, 0))
+            print(f"{resource['index']:<5} {resource['type']:<25} {resource['name']:<30} "
+                  f"{STATE_NAMES.get(state, state):<10} {seconds:>8.0f}  "
+                  f"{detail or ''}")
+        print(waiter.summary())
     
     # Resource deletion functions
     def delete_domain(self, domain_name):
         """Delete an OpenSearch domain"""
-        try:
-            self.client.delete_domain(DomainName=domain_name)
-            print(f"Domain {domain_name} deletion initiated. This may take several minutes to complete.")
-        except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+        self.client.delete_domain(DomainName=domain_name)
+        print(f"Domain {domain_name} deletion initiated. This may take several minutes to complete.")
 
     def delete_serverless_collection(self, collection_id):
         """Delete an OpenSearch serverless collection"""
+        self.serverless_client.delete_collection(id=collection_id)
+        print(f"Serverless collection {collection_id} deletion initiated.")
+
+    def _collections_deleted(self, keys):
+        """Probe up to 100 collections in one call: True once gone, False while still listed"""
+        response = self.serverless_client.batch_get_collection(ids=[collection_id for _, collection_id in keys])
+        statuses = {c['id']: c.get('status') for c in response.get('collectionDetails', [])}
+        states = {}
+        for key in keys:
+            status = statuses.get(key[1])
+            if status is None:
+                states[key] = True  # gone; reported under collectionErrorDetails
+            elif status == 'FAILED':
+                states[key] = Exception("Collection status is FAILED")
+            else:
+                # DELETING, or ACTIVE for a read that lags just behind delete_collection
+                states[key] = False
+        return states
+
+    def _domains_deleted(self, keys):
+        """Probe up to five domains in one call: True once gone, False while still being deleted"""
         try:
-            self.serverless_client.delete_collection(id=collection_id)
-            print(f"Serverless collection {collection_id} deletion initiated.")
-            
-            # Wait for deletion to complete
-            print("Waiting for deletion to complete...")
-            while True:
-                try:
-                    response = self.serverless_client.batch_get_collection(ids=[collection_id])
-                    status = response.get('collectionDetails', [{}])[0].get('status')
-                    if status == 'DELETING':
-                        print("Still deleting...")
-                        time.sleep(10)  # Check every 10 seconds
-                    else:
-                        print(f"Unexpected status: {status}")
-                        break
-                except ClientError as e:
-                    if 'ResourceNotFoundException' in str(e):
-                        print(f"Collection {collection_id} successfully deleted.")
-                        break
-                    else:
-                        raise Exception(f"Error checking collection status: {str(e)}")
+            statuses = self.client.describe_domains(DomainNames=[name for _, name in keys])['DomainStatusList']
         except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            # The call fails as a whole when any one name is gone, so ask about each domain on its own
+            return {key: self._domain_deleted(key) for key in keys}
+        remaining = {status['DomainName'] for status in statuses}
+        return {key: key[1] not in remaining for key in keys}
 
-    def delete_vpc_endpoint(self, endpoint_id):
-        """Delete an OpenSearch VPC endpoint"""
+    def _domain_deleted(self, key):
+        """True once the domain is gone, False while it still exists, or the error for this domain"""
         try:
-            self.serverless_client.delete_vpc_endpoint(id=endpoint_id)
-            print(f"VPC endpoint {endpoint_id} deletion initiated.")
+            self.client.describe_domain(DomainName=key[1])
+            return False
         except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                return True
+            return e
+
+    def delete_vpc_endpoint(self, endpoint_id):
+        """Delete an OpenSearch VPC endpoint"""
+        self.serverless_client.delete_vpc_endpoint(id=endpoint_id)
+        print(f"VPC endpoint {endpoint_id} deletion initiated.")
 
     def delete_data_access_policy(self, policy_name):
         """Delete an OpenSearch data access policy"""
-        try:
-            self.serverless_client.delete_access_policy(name=policy_name, type='data')
-            print(f"Data access policy {policy_name} deleted.")
-        except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+        self.serverless_client.delete_access_policy(name=policy_name, type='data')
+        print(f"Data access policy {policy_name} deleted.")
 
     def delete_network_policy(self, policy_name):
         """Delete an OpenSearch network policy"""
-        try:
-            self.serverless_client.delete_security_policy(name=policy_name, type='network')
-            print(f"Network policy {policy_name} deleted.")
-        except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+        self.serverless_client.delete_security_policy(name=policy_name, type='network')
+        print(f"Network policy {policy_name} deleted.")
 
     def delete_encryption_policy(self, policy_name):
         """Delete an OpenSearch encryption policy"""
-        try:
-            self.serverless_client.delete_security_policy(name=policy_name, type='encryption')
-            print(f"Encryption policy {policy_name} deleted.")
-        except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+        self.serverless_client.delete_security_policy(name=policy_name, type='encryption')
+        print(f"Encryption policy {policy_name} deleted.")
 
-    def run(self):
-        """Main execution flow"""
+    def run(self, selection=None, assume_yes=False):
+        """Main execution flow; returns False if any deletion failed or timed out"""
         self.print_header()
         
         # Fetch all resources at once
@@ -265,14 +349,23 @@ class OpenSearchCleaner:
         self.display_resources(all_resources)
         
         # Let user select resources to delete
-        selected_resources = self.select_resources(all_resources)
+        selected_resources = self.select_resources(all_resources, selection)
         
         # Confirm and delete if resources were selected
-        if selected_resources and self.confirm_deletion(len(selected_resources)):
-            self.delete_resources(selected_resources)
+        succeeded = True
+        if selected_resources and (assume_yes or self.confirm_deletion(len(selected_resources))):
+            succeeded = self.delete_resources(selected_resources)
         
         print("\nOperation completed.")
+        return succeeded
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List and delete OpenSearch resources.")
+    parser.add_argument('--select', metavar='EXPR',
+                        help="select resources without prompting, e.g. 'type=network-policy name=test-*' (see resource_selector.py)")
+    parser.add_argument('--yes', action='store_true', help="delete the selection without asking for confirmation")
+    args = parser.parse_args()
+
     cleaner = OpenSearchCleaner()
-    cleaner.run()
+    if not cleaner.run(selection=args.select, assume_yes=args.yes):
+        sys.exit(1)
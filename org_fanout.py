@@ -0,0 +1,119 @@
+# Run work across the accounts of an AWS Organization.
+# Used by get-underutilized-resources.py.
+#
+# Accounts come from Organizations list_accounts. Each member account is entered by
+# assuming a role in it (OrganizationAccountAccessRole by default); the STS credentials
+# and the clients built from them are cached until shortly before the credentials
+# expire, so a long sweep only re-assumes a role when it has to. Roles are assumed for
+# all accounts in parallel up front; the caller then fans its own (account, task) work
+# out over cache.client(). The STS and Organizations clients are passed in, which lets
+# the engine run against stubbed clients.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+DEFAULT_ROLE_NAME = "OrganizationAccountAccessRole"
+DEFAULT_WORKERS = 20
+SESSION_NAME = "aws-script-toolkit"
+ROLE_DURATION = 3600  # seconds
+REFRESH_MARGIN = 300  # re-assume a role this many seconds before its credentials expire
+
+
+def list_accounts(organizations):
+    """Return [{'Id', 'Name'}] for every active account in the organization"""
+    accounts = []
+    for page in organizations.get_paginator('list_accounts').paginate():
+        accounts.extend({'Id': account['Id'], 'Name': account['Name']}
+                        for account in page['Accounts'] if account['Status'] == 'ACTIVE')
+    return accounts
+
+
+class CredentialCache:
+    """Assumed-role credentials and clients per account, reused until they near expiry.
+
+    The account the caller is already in (home_account) is served from home_session
+    instead, since the organization's access role usually doesn't exist there.
+    """
+
+    def __init__(self, sts, role_name=DEFAULT_ROLE_NAME, home_account=None, home_session=None,
+                 session_factory=boto3.session.Session, clock=time.time):
+        self.sts = sts
+        self.role_name = role_name
+        self.home_account = home_account
+        self.home_session = home_session or boto3.session.Session()
+        self.session_factory = session_factory
+        self.clock = clock
+        self.credentials = {}  # account id -> (credentials dict, expiry timestamp)
+        self.clients = {}      # (account id, service, region) -> (client, expiry timestamp)
+        self.locks = {}
+        self.lock = threading.Lock()
+        self.assumed = 0
+
+    def _account_lock(self, account_id):
+        with self.lock:
+            return self.locks.setdefault(account_id, threading.Lock())
+
+    def _fresh(self, expires_at):
+        return expires_at - self.clock() > REFRESH_MARGIN
+
+    def get_credentials(self, account_id):
+        """Return (credentials, expiry timestamp), assuming the role only when needed"""
+        with self._account_lock(account_id):
+            cached = self.credentials.get(account_id)
+            if cached and self._fresh(cached[1]):
+                return cached
+            response = self.sts.assume_role(
+                RoleArn=f"arn:aws:iam::{account_id}:role/{self.role_name}",
+                RoleSessionName=SESSION_NAME,
+                DurationSeconds=ROLE_DURATION
+            )
+            credentials = response['Credentials']
+            cached = (credentials, credentials['Expiration'].timestamp())
+            self.credentials[account_id] = cached
+            self.assumed += 1
+            return cached
+
+    def client(self, account_id, service, region_name=None, config=None):
+        """Return a client for service in account_id, rebuilt when its credentials are renewed"""
+        if account_id == self.home_account:
+            key = (account_id, service, region_name)
+            with self.lock:
+                if key not in self.clients:
+                    self.clients[key] = (self.home_session.client(service, region_name=region_name,
+                                                                  config=config), float('inf'))
+                return self.clients[key][0]
+
+        credentials, expires_at = self.get_credentials(account_id)
+        key = (account_id, service, region_name)
+        with self._account_lock(account_id):
+            cached = self.clients.get(key)
+            if cached and cached[1] == expires_at:
+                return cached[0]
+            session = self.session_factory(
+                aws_access_key_id=credentials['AccessKeyId'],
+                aws_secret_access_key=credentials['SecretAccessKey'],
+                aws_session_token=credentials['SessionToken']
+            )
+            client = session.client(service, region_name=region_name, config=config)
+            self.clients[key] = (client, expires_at)
+            return client
+
+
+def assume_all(cache, account_ids, workers=DEFAULT_WORKERS):
+    """Assume the role in every account in parallel; return {account id: error} for failures"""
+    def assume(account_id):
+        if account_id == cache.home_account:
+            return None
+        try:
+            cache.get_credentials(account_id)
+            return None
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        errors = dict(zip(account_ids, executor.map(assume, account_ids)))
+    return {account_id: error for account_id, error in errors.items() if error}
+
@@ -1,7 +1,17 @@
 import boto3
 import re
+import time
+from botocore.config import Config
 from datetime import timedelta
 
+import presign_cache
+import presign_sinks
+import s3_parallel_lister
+import s3_presigner
+
+SIGN_BATCH_SIZE = 1000
+
+
 def parse_expiration(input_str):
     match = re.match(r"(\d+)([dh])", input_str)
     if not match:
@@ -22,56 +32,136 @@ def list_buckets():
     return buckets
 
 
-def generate_presigned_urls(bucket_name, expiration, html_filename, txt_filename):
-    s3 = boto3.client('s3')
+def iter_grouped_objects(s3, bucket_name):
+    """Yield (prefix, object) pairs grouped by top-level prefix, one group after another.
 
-    prefixes = set()
-    objects = []
+    A single delimiter listing of the bucket root returns the root-level objects and
+    the top-level prefixes; each prefix is then streamed on its own, so every object is
+    emitted exactly once and nothing but the prefix names is held in memory.
+    """
+    prefixes = []
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Delimiter='/'):
+        for obj in page.get('Contents', []):
+            yield '', obj
+        prefixes.extend(p['Prefix'] for p in page.get('CommonPrefixes', []))
 
-    response = s3.list_objects_v2(Bucket=bucket_name)
-    while response.get('Contents'):
-        for obj in response['Contents']:
-            key = obj['Key']
-            if '/' in key:
-                prefixes.add(key.split('/')[0])
-            objects.append(key)
+    for prefix in prefixes:
+        for obj in s3_parallel_lister.list_objects(s3, bucket_name, prefix=prefix):
+            yield prefix, obj
 
-        if response.get('IsTruncated'):
-            response = s3.list_objects_v2(Bucket=bucket_name, ContinuationToken=response['NextContinuationToken'])
-        else:
-            break
 
-    html_content = "<html><body><h1>Download Links</h1>\n"
-    text_content = ""
+def iter_signing_batches(grouped_objects, batch_size=SIGN_BATCH_SIZE):
+    """Cut the grouped object stream into (prefix, objects) batches that never span two prefixes"""
+    current_prefix = None
+    objects = []
+    for prefix, obj in grouped_objects:
+        if objects and (prefix != current_prefix or len(objects) == batch_size):
+            yield current_prefix, objects
+            objects = []
+        current_prefix = prefix
+        objects.append(obj)
+    if objects:
+        yield current_prefix, objects
+
+
+def sign_with_botocore(s3, bucket_name, keys, expiration):
+    signed = []
+    for key in keys:
+        try:
+            presigned_url = s3.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': bucket_name, 'Key': key},
+                ExpiresIn=expiration
+            )
+        except Exception as e:
+            print(f"Error generating URL for {key}: {e}")
+            continue
+        signed.append((key, presigned_url))
+    return signed
+
+
+def generate_presigned_urls(s3, bucket_name, expiration, sinks, credentials=None, cache=None):
+    """Sign every object in the bucket and stream the links into the report sinks.
+
+    With credentials, keys are signed locally in batches by s3_presigner (same URLs as
+    botocore); otherwise, or if the client isn't producing SigV4 URLs, each key goes
+    through s3.generate_presigned_url. With a presign_cache.PresignCache, unchanged
+    objects reuse their cached URL. Returns the number of URLs written.
+    """
+    presigner = None
+    if credentials is not None:
+        presigner = s3_presigner.BatchPresigner.from_client(s3, bucket_name, expiration, credentials)
+
+    url_count = 0
+    current_prefix = None
+
+    for sink in sinks:
+        sink.start_bucket(bucket_name)
+
+    for prefix, objects in iter_signing_batches(iter_grouped_objects(s3, bucket_name)):
+        if prefix != current_prefix:
+            current_prefix = prefix
+            for sink in sinks:
+                sink.start_prefix(bucket_name, prefix)
+
+        urls = cache.lookup(bucket_name, objects, expiration) if cache is not None else {}
+        to_sign = [obj for obj in objects if obj['Key'] not in urls]
+        if to_sign:
+            signed_at = time.time()
+            if presigner is not None:
+                keys = [obj['Key'] for obj in to_sign]
+                signed = list(zip(keys, presigner.sign(keys)))
+            else:
+                signed = sign_with_botocore(s3, bucket_name, [obj['Key'] for obj in to_sign], expiration)
+            urls.update(signed)
+            if cache is not None:
+                signed_keys = set(key for key, _ in signed)
+                cache.store(bucket_name, [obj for obj in to_sign if obj['Key'] in signed_keys],
+                            [url for _, url in signed], expiration, signed_at)
 
-    for prefix in sorted(prefixes):
-        html_content += f"<h2>Prefix: {prefix}</h2>\n"
         for obj in objects:
-            if obj.startswith(prefix):
-                try:
-                    presigned_url = s3.generate_presigned_url(
-                        'get_object',
-                        Params={'Bucket': bucket_name, 'Key': obj},
-                        ExpiresIn=expiration
-                    )
-                    print(f"Generated URL for {obj}: {presigned_url}")
-                except Exception as e:
-                    print(f"Error generating URL for {obj}: {e}")
-                    continue
-                html_content += f"<a href='{presigned_url}'>{obj}</a><br>\n"
-                text_content += f"{presigned_url}\n"
-
-    html_content += "</body></html>"
-
-    with open(html_filename, "w") as html_file:
-        html_file.write(html_content)
-
-    with open(txt_filename, "w") as text_file:
-        text_file.write(text_content)
+            presigned_url = urls.get(obj['Key'])
+            if presigned_url is None:
+                continue
+            for sink in sinks:
+                sink.write_link(bucket_name, obj['Key'], presigned_url)
+            url_count += 1
+
+    if cache is not None:
+        cache.commit()
+
+    for sink in sinks:
+        sink.end_bucket(bucket_name)
+
+    print(f"Generated {url_count} URLs for bucket {bucket_name}")
+    return url_count
+
+
+def ask_output_options():
+    """Prompt for report formats and optional sharding of the line-based formats"""
+    formats_input = input(f"Output formats ({', '.join(presign_sinks.FORMATS)}) [html,txt]: ").strip().lower()
+    formats = [f.strip() for f in formats_input.split(',') if f.strip()] or ['html', 'txt']
+    for fmt in formats:
+        if fmt not in presign_sinks.FORMATS:
+            raise ValueError(f"Unknown output format '{fmt}'. Choose from: {', '.join(presign_sinks.FORMATS)}")
+
+    max_rows = max_bytes = None
+    if any(fmt in presign_sinks.LINE_FORMATS for fmt in formats):
+        shard_input = input("Split txt/jsonl/csv files? Enter max rows (e.g. '500000') "
+                            "or size (e.g. '100MB'), or leave blank: ").strip().upper()
+        if shard_input.endswith('MB'):
+            max_bytes = int(shard_input[:-2]) * 1024 * 1024
+        elif shard_input:
+            max_rows = int(shard_input)
+    return formats, max_rows, max_bytes
 
 
 def main():
-    s3 = boto3.client('s3')
+    session = boto3.session.Session()
+    s3 = session.client('s3', config=Config(signature_version='s3v4',
+                                            max_pool_connections=s3_parallel_lister.DEFAULT_WORKERS))
+    credentials = session.get_credentials().get_frozen_credentials()
     buckets = list_buckets()
 
     print("Available Buckets:")
@@ -90,34 +180,47 @@ def main():
     expiration_input = input("Enter expiration time (e.g., '1h' for 1 hour, '1d' for 1 day): ").strip()
     try:
         expiration = parse_expiration(expiration_input)
+        formats, max_rows, max_bytes = ask_output_options()
     except ValueError as e:
         print(e)
         return
 
+    cache = None
+    use_cache = input(f"Reuse unexpired URLs cached in '{presign_cache.DEFAULT_CACHE_FILE}'? (yes/no): ")
+    if use_cache.strip().lower() in ['yes', 'y']:
+        cache = presign_cache.PresignCache(presign_cache.DEFAULT_CACHE_FILE, access_key=credentials.access_key)
+
     if combined_report:
-        html_filename = "download-links-combined.html"
-        txt_filename = "download-links-combined.txt"
-        with open(html_filename, "w") as html_file, open(txt_filename, "w") as txt_file:
-            html_file.write("<html><body><h1>Combined Download Links</h1>\n")
+        # One set of sinks for the whole run: every bucket streams into the same files
+        sinks = presign_sinks.open_sinks("download-links-combined", formats, combined=True,
+                                         max_rows=max_rows, max_bytes=max_bytes)
+        try:
             for bucket in chosen_buckets:
-                html_file.write(f"<h2>Bucket: {bucket}</h2>\n")
-                txt_file.write(f"Bucket: {bucket}\n")
-                generate_presigned_urls(bucket, expiration, html_file.name, txt_file.name)
-                html_file.write("<hr>\n")
-            html_file.write("</body></html>")
+                print(f"Generating report for bucket: {bucket}")
+                generate_presigned_urls(s3, bucket, expiration, sinks, credentials, cache)
+        finally:
+            for sink in sinks:
+                sink.close()
     else:
         for bucket in chosen_buckets:
-            html_filename = f"download-links-{bucket}.html"
-            txt_filename = f"download-links-{bucket}.txt"
             print(f"Generating report for bucket: {bucket}")
-            generate_presigned_urls(bucket, expiration, html_filename, txt_filename)
+            sinks = presign_sinks.open_sinks(f"download-links-{bucket}", formats,
+                                             max_rows=max_rows, max_bytes=max_bytes)
+            try:
+                generate_presigned_urls(s3, bucket, expiration, sinks, credentials, cache)
+            finally:
+                for sink in sinks:
+                    sink.close()
+
+    if cache is not None:
+        print(cache.stats_line())
+        cache.close()
 
     print("Pre-signed URLs generated successfully!")
     if combined_report:
-        print(f"- Combined links saved in '{html_filename}' and '{txt_filename}'")
+        print(f"- Combined links saved in: {', '.join(presign_sinks.sink_paths(sinks))}")
     else:
         print("- Separate reports created for each bucket.")
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,100 @@
+# On-disk cache of presigned URLs for preSignedURL-generator.py.
+#
+# URLs are stored in SQLite per (bucket, key) together with the object's ETag, the
+# access key that signed them and their expiry time. A cached URL is reused when the
+# ETag and access key still match, at least min_remaining of the requested expiration
+# is left and it does not outlive the requested expiration, so only new, changed or
+# nearly expired objects (or URLs signed for longer than now asked) are re-signed.
+# Temporary credentials get a new access key id per session, so URLs signed under a
+# session that has since ended are never handed out.
+
+import sqlite3
+import time
+
+DEFAULT_CACHE_FILE = "presign-cache.sqlite3"
+DEFAULT_MIN_REMAINING = 0.75  # reuse a URL while 75% of the requested lifetime is left
+LOOKUP_CHUNK_SIZE = 500       # stay under SQLite's bound-parameter limit
+
+
+class PresignCache:
+    def __init__(self, path=DEFAULT_CACHE_FILE, access_key=None, min_remaining=DEFAULT_MIN_REMAINING):
+        self.path = path
+        self.access_key = access_key
+        self.min_remaining = min_remaining
+        self.hits = 0
+        self.new = 0
+        self.changed = 0
+        self.expiring = 0
+        self.longer = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS presigned_urls ("
+            " bucket TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " etag TEXT NOT NULL,"
+            " access_key TEXT NOT NULL,"
+            " url TEXT NOT NULL,"
+            " expires_at INTEGER NOT NULL,"
+            " PRIMARY KEY (bucket, key))"
+        )
+
+    @property
+    def misses(self):
+        return self.new + self.changed + self.expiring + self.longer
+
+    def lookup(self, bucket, objects, expiration):
+        """Return {key: url} for the objects whose cached URL can be reused"""
+        now = time.time()
+        reusable_until = now + expiration * self.min_remaining
+        # Never hand out a URL that stays valid longer than the caller asked for
+        latest_expiry = now + expiration
+        etags = {obj['Key']: obj.get('ETag', '') for obj in objects}
+        keys = list(etags)
+        cached = {}
+        found = 0
+        for i in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            chunk = keys[i:i + LOOKUP_CHUNK_SIZE]
+            rows = self.connection.execute(
+                "SELECT key, etag, access_key, url, expires_at FROM presigned_urls"
+                f" WHERE bucket = ? AND key IN ({','.join('?' * len(chunk))})",
+                [bucket] + chunk
+            )
+            for key, etag, access_key, url, expires_at in rows:
+                if etag != etags[key]:
+                    self.changed += 1
+                elif access_key != self.access_key or expires_at < reusable_until:
+                    self.expiring += 1
+                elif expires_at > latest_expiry:
+                    self.longer += 1
+                else:
+                    cached[key] = url
+                found += 1
+        self.hits += len(cached)
+        self.new += len(keys) - found
+        return cached
+
+    def store(self, bucket, objects, urls, expiration, signed_at):
+        """Remember freshly signed URLs (objects and urls in matching order)"""
+        expires_at = int(signed_at) + expiration
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO presigned_urls (bucket, key, etag, access_key, url, expires_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            [(bucket, obj['Key'], obj.get('ETag', ''), self.access_key, url, expires_at)
+             for obj, url in zip(objects, urls)]
+        )
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def stats_line(self):
+        total = self.hits + self.misses
+        hit_rate = (100.0 * self.hits / total) if total else 0.0
+        return (f"Presign cache: {self.hits:,} hits, {self.misses:,} misses ({hit_rate:.1f}% hit rate; "
+                f"{self.new:,} new, {self.changed:,} changed, {self.expiring:,} expiring, "
+                f"{self.longer:,} longer-lived than requested)")
@@ -0,0 +1,187 @@
+# Output sinks for preSignedURL-generator.py reports.
+#
+# Each sink is opened once, written to sequentially as links are signed and closed at
+# the end of the report; nothing is ever reopened or rewritten. Line-based formats
+# (txt, txt.gz, jsonl, csv) can be split into numbered shards by row count or size.
+
+import abc
+import csv
+import gzip
+import json
+from html import escape
+
+BUFFER_SIZE = 1 << 20  # write in 1 MiB chunks
+
+FORMATS = ['html', 'txt', 'txt.gz', 'jsonl', 'csv']
+LINE_FORMATS = ['txt', 'txt.gz', 'jsonl', 'csv']
+
+
+class ReportSink(abc.ABC):
+    """Base sink: subclasses implement write_link and override the other hooks they care about"""
+
+    def start_bucket(self, bucket):
+        pass
+
+    def start_prefix(self, bucket, prefix):
+        pass
+
+    @abc.abstractmethod
+    def write_link(self, bucket, key, url):
+        """Write one link and return the number of characters written"""
+
+    def end_bucket(self, bucket):
+        pass
+
+    def close(self):
+        pass
+
+
+class HtmlSink(ReportSink):
+    def __init__(self, path, title="Download Links", combined=False):
+        self.path = path
+        self.combined = combined
+        self.file = open(path, "w", buffering=BUFFER_SIZE)
+        self.file.write(f"<html><body><h1>{escape(title)}</h1>\n")
+
+    def start_bucket(self, bucket):
+        if self.combined:
+            self.file.write(f"<h2>Bucket: {escape(bucket)}</h2>\n")
+
+    def start_prefix(self, bucket, prefix):
+        self.file.write(f"<h2>Prefix: {escape(prefix.rstrip('/') or '/')}</h2>\n")
+
+    def write_link(self, bucket, key, url):
+        return self.file.write(f"<a href='{escape(url)}'>{escape(key)}</a><br>\n")
+
+    def end_bucket(self, bucket):
+        if self.combined:
+            self.file.write("<hr>\n")
+
+    def close(self):
+        self.file.write("</body></html>")
+        self.file.close()
+
+
+class TextSink(ReportSink):
+    """One URL per line; optionally gzip-compressed"""
+
+    def __init__(self, path, combined=False, compress=False):
+        self.path = path
+        self.combined = combined
+        if compress:
+            self.file = gzip.open(path, "wt", compresslevel=6)
+        else:
+            self.file = open(path, "w", buffering=BUFFER_SIZE)
+
+    def start_bucket(self, bucket):
+        if self.combined:
+            self.file.write(f"Bucket: {bucket}\n")
+
+    def write_link(self, bucket, key, url):
+        return self.file.write(f"{url}\n")
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlSink(ReportSink):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w", buffering=BUFFER_SIZE)
+
+    def write_link(self, bucket, key, url):
+        return self.file.write(json.dumps({'bucket': bucket, 'key': key, 'url': url}) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink(ReportSink):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w", newline="", buffering=BUFFER_SIZE)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['bucket', 'key', 'url'])
+
+    def write_link(self, bucket, key, url):
+        # csv.writer returns the length of the line it wrote
+        return self.writer.writerow([bucket, key, url])
+
+    def close(self):
+        self.file.close()
+
+
+class ShardedSink(ReportSink):
+    """Rolls over to a new numbered file once max_rows links or max_bytes characters are written"""
+
+    def __init__(self, make_sink, base_path, extension, max_rows=None, max_bytes=None):
+        self.make_sink = make_sink
+        self.base_path = base_path
+        self.extension = extension
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.shard_number = 0
+        self.current_bucket = None
+        self._open_next_shard()
+
+    def _open_next_shard(self):
+        self.shard_number += 1
+        self.rows = 0
+        self.bytes = 0
+        self.sink = self.make_sink(f"{self.base_path}-{self.shard_number:05d}.{self.extension}")
+
+    def start_bucket(self, bucket):
+        self.current_bucket = bucket
+        self.sink.start_bucket(bucket)
+
+    def start_prefix(self, bucket, prefix):
+        self.sink.start_prefix(bucket, prefix)
+
+    def write_link(self, bucket, key, url):
+        if self.rows and ((self.max_rows and self.rows >= self.max_rows) or
+                          (self.max_bytes and self.bytes >= self.max_bytes)):
+            self.sink.close()
+            self._open_next_shard()
+            if self.current_bucket is not None:
+                self.sink.start_bucket(self.current_bucket)
+        written = self.sink.write_link(bucket, key, url)
+        self.rows += 1
+        self.bytes += written
+        return written
+
+    def end_bucket(self, bucket):
+        self.sink.end_bucket(bucket)
+
+    def close(self):
+        self.sink.close()
+
+
+def open_sinks(base_path, formats, combined=False, max_rows=None, max_bytes=None):
+    """Open one sink per requested format, sharding line formats when a limit is given"""
+    title = "Combined Download Links" if combined else "Download Links"
+    makers = {
+        'html': lambda path: HtmlSink(path, title=title, combined=combined),
+        'txt': lambda path: TextSink(path, combined=combined),
+        'txt.gz': lambda path: TextSink(path, combined=combined, compress=True),
+        'jsonl': JsonlSink,
+        'csv': CsvSink,
+    }
+    sinks = []
+    for fmt in formats:
+        if fmt not in makers:
+            raise ValueError(f"Unknown output format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+        if fmt in LINE_FORMATS and (max_rows or max_bytes):
+            sinks.append(ShardedSink(makers[fmt], base_path, fmt, max_rows=max_rows, max_bytes=max_bytes))
+        else:
+            sinks.append(makers[fmt](f"{base_path}.{fmt}"))
+    return sinks
+
+
+def sink_paths(sinks):
+    paths = []
+    for sink in sinks:
+        if isinstance(sink, ShardedSink):
+            paths.append(f"{sink.base_path}-*.{sink.extension} ({sink.shard_number} shards)")
+        else:
+            paths.append(sink.path)
+    return paths
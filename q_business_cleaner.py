@@ -2,18 +2,41 @@
 # Amazon Q Business Resource Cleaner
 # This script lists and deletes various Amazon Q Business resources with an interactive menu
 
+import argparse
 import boto3
 import sys
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from botocore.exceptions import ClientError
 from datetime import datetime
 
+from resource_selector import SYNTAX, ResourceIndex
+from resource_waiter import ResourceWaiter
+
+# (type, list operation, result key, id field, delete method) for resources that belong to an
+# application, in display order; data sources are listed under each index
+CHILD_RESOURCE_TYPES = [
+    ('Index', 'list_indices', 'indices', 'indexId', 'delete_index'),
+    ('Web Experience', 'list_web_experiences', 'webExperiences', 'webExperienceId', 'delete_web_experience'),
+    ('Plugin', 'list_plugins', 'plugins', 'pluginId', 'delete_plugin'),
+    ('Retriever', 'list_retrievers', 'retrievers', 'retrieverId', 'delete_retriever'),
+]
+
+POLL_INTERVAL = 10   # longest wait between status checks of one pending deletion
+DELETE_TIMEOUT = 300  # give up waiting on a single resource after this many seconds
+
+def _display_name(item, default):
+    """Q Business list calls return displayName; web experiences have no name at all"""
+    return item.get('displayName') or item.get('name') or default
+
+
 class QBusinessCleaner:
-    def __init__(self):
+    def __init__(self, max_workers=10):
         # Use the default region from AWS CLI configuration
         session = boto3.session.Session()
         self.region = session.region_name or "us-east-1"
         self.q_client = boto3.client('qbusiness', region_name=self.region)
+        self.max_workers = max_workers
         
     def print_header(self):
         """Print a header for the application"""
@@ -23,163 +46,141 @@ class QBusinessCleaner:
         print(f"Region: {self.region}")
         print("=" * 60 + "\n")
 
-    def fetch_all_resources(self):
-        """Fetch all Amazon Q Business resources and return them in a single list"""
+    def fetch_all_resources(self, on_resource=None):
+        """Fetch all Amazon Q Business resources and return them in a single list.
+
+        Every (application, resource type) listing runs concurrently, and data sources are
+        listed per index as soon as that application's indexes are known. Results are merged
+        in a fixed order (applications first, then each application's children by type), so
+        numbering is the same on every run. on_resource, if given, is called for each
+        resource as soon as its place in that order is settled.
+        """
         all_resources = []
-        resource_index = 1  # Start numbering from 1
-        
-        # Fetch applications
+        start = time.monotonic()
+
+        def add(resource):
+            resource['index'] = len(all_resources) + 1  # Start numbering from 1
+            all_resources.append(resource)
+            if on_resource:
+                on_resource(resource)
+
         print("Fetching Q Business applications...")
-        applications = []
-        try:
-            paginator = self.q_client.get_paginator('list_applications')
-            for page in paginator.paginate():
-                for app in page.get('applications', []):
-                    applications.append(app)
-                    all_resources.append({
-                        'index': resource_index,
-                        'name': app['name'],
-                        'id': app['applicationId'],
-                        'type': 'Application',
-                        'delete_function': self.delete_application
-                    })
-                    resource_index += 1
-        except ClientError as e:
-            print(f"Error listing applications: {e}")
-        
-        # For each application, fetch its resources
-        for app in applications:
-            app_id = app['applicationId']
-            
-            # Fetch data sources for this application
-            print(f"Fetching data sources for application {app_id}...")
-            try:
-                ds_paginator = self.q_client.get_paginator('list_data_sources')
-                for page in ds_paginator.paginate(applicationId=app_id):
-                    for ds in page.get('dataSources', []):
-                        all_resources.append({
-                            'index': resource_index,
-                            'name': ds['name'],
-                            'id': ds['dataSourceId'],
-                            'application_id': app_id,
-                            'type': 'Data Source',
-                            'delete_function': self.delete_data_source
-                        })
-                        resource_index += 1
-            except ClientError as e:
-                print(f"Error listing data sources for application {app_id}: {e}")
-            
-            # Fetch indexes for this application
-            print(f"Fetching indexes for application {app_id}...")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            app_tasks = []
             try:
-                idx_paginator = self.q_client.get_paginator('list_indices')
-                for page in idx_paginator.paginate(applicationId=app_id):
-                    for idx in page.get('indices', []):
-                        all_resources.append({
-                            'index': resource_index,
-                            'name': idx['name'],
-                            'id': idx['indexId'],
-                            'application_id': app_id,
-                            'type': 'Index',
-                            'delete_function': self.delete_index
+                paginator = self.q_client.get_paginator('list_applications')
+                for page in paginator.paginate():
+                    for app in page.get('applications', []):
+                        app_id = app['applicationId']
+                        add({
+                            'name': _display_name(app, app_id),
+                            'id': app_id,
+                            'type': 'Application',
+                            'created': app.get('createdAt'),
+                            'delete_function': self.delete_application
                         })
-                        resource_index += 1
+                        # Start listing this application's children while later pages load
+                        app_tasks.append([
+                            executor.submit(self._list_children, executor, app_id, child_type)
+                            for child_type in CHILD_RESOURCE_TYPES
+                        ])
             except ClientError as e:
-                print(f"Error listing indexes for application {app_id}: {e}")
-            
-            # Fetch web experiences for this application
-            print(f"Fetching web experiences for application {app_id}...")
-            try:
-                exp_paginator = self.q_client.get_paginator('list_web_experiences')
-                for page in exp_paginator.paginate(applicationId=app_id):
-                    for exp in page.get('webExperiences', []):
-                        all_resources.append({
-                            'index': resource_index,
-                            'name': exp['name'],
-                            'id': exp['webExperienceId'],
-                            'application_id': app_id,
-                            'type': 'Web Experience',
-                            'delete_function': self.delete_web_experience
-                        })
-                        resource_index += 1
-            except ClientError as e:
-                print(f"Error listing web experiences for application {app_id}: {e}")
-            
-            # Fetch plugins for this application
-            print(f"Fetching plugins for application {app_id}...")
-            try:
-                plugin_paginator = self.q_client.get_paginator('list_plugins')
-                for page in plugin_paginator.paginate(applicationId=app_id):
-                    for plugin in page.get('plugins', []):
-                        all_resources.append({
-                            'index': resource_index,
-                            'name': plugin['name'],
-                            'id': plugin['pluginId'],
-                            'application_id': app_id,
-                            'type': 'Plugin',
-                            'delete_function': self.delete_plugin
-                        })
-                        resource_index += 1
-            except ClientError as e:
-                print(f"Error listing plugins for application {app_id}: {e}")
-            
-            # Fetch retrievers for this application
-            print(f"Fetching retrievers for application {app_id}...")
-            try:
-                retriever_paginator = self.q_client.get_paginator('list_retrievers')
-                for page in retriever_paginator.paginate(applicationId=app_id):
-                    for retriever in page.get('retrievers', []):
-                        all_resources.append({
-                            'index': resource_index,
-                            'name': retriever['name'],
-                            'id': retriever['retrieverId'],
-                            'application_id': app_id,
-                            'type': 'Retriever',
-                            'delete_function': self.delete_retriever
-                        })
-                        resource_index += 1
-            except ClientError as e:
-                print(f"Error listing retrievers for application {app_id}: {e}")
-        
+                print(f"Error listing applications: {e}")
+
+            for tasks in app_tasks:
+                for task in tasks:
+                    for item in task.result():
+                        # Data sources arrive as a pending listing right after their index
+                        for resource in (item.result() if isinstance(item, Future) else [item]):
+                            add(resource)
+
+        print(f"Found {len(all_resources)} resources across {len(app_tasks)} applications "
+              f"in {time.monotonic() - start:.1f}s")
         return all_resources
 
+    def _list_children(self, executor, app_id, child_type):
+        """List one resource type of one application.
+
+        Returns its resources in listing order; for indexes, each index is followed by a
+        future for its data sources, so this worker never waits on another task.
+        """
+        type_name, operation, result_key, id_field, delete_method = child_type
+        resources = []
+        try:
+            paginator = self.q_client.get_paginator(operation)
+            for page in paginator.paginate(applicationId=app_id):
+                for item in page.get(result_key, []):
+                    resources.append({
+                        'name': _display_name(item, item[id_field]),
+                        'id': item[id_field],
+                        'application_id': app_id,
+                        'type': type_name,
+                        'created': item.get('createdAt'),  # retrievers don't report one
+                        'delete_function': getattr(self, delete_method)
+                    })
+        except ClientError as e:
+            print(f"Error listing {type_name.lower()}s for application {app_id}: {e}")
+            return resources
+
+        if type_name == 'Index':
+            # Data sources live under an index; list them for every index concurrently
+            return [item for index in resources
+                    for item in (index, executor.submit(self._list_data_sources, app_id, index['id']))]
+        return resources
+
+    def _list_data_sources(self, app_id, index_id):
+        resources = []
+        try:
+            paginator = self.q_client.get_paginator('list_data_sources')
+            for page in paginator.paginate(applicationId=app_id, indexId=index_id):
+                for ds in page.get('dataSources', []):
+                    resources.append({
+                        'name': _display_name(ds, ds['dataSourceId']),
+                        'id': ds['dataSourceId'],
+                        'application_id': app_id,
+                        'index_id': index_id,
+                        'type': 'Data Source',
+                        'created': ds.get('createdAt'),
+                        'delete_function': self.delete_data_source
+                    })
+        except ClientError as e:
+            print(f"Error listing data sources for index {index_id}: {e}")
+        return resources
+
     def display_resources(self, resources):
         """Display all resources in a single consolidated view"""
         if not resources:
             print("No Amazon Q Business resources found.")
             return
         
+        self.print_table_header()
+        for resource in resources:
+            self.print_resource_row(resource)
+
+    def print_table_header(self):
         print("\nAvailable Amazon Q Business Resources:")
         print("-" * 100)
         print(f"{'#':<5} {'Type':<20} {'Name':<30} {'ID':<30} {'Application ID':<15}")
         print("-" * 100)
-        
-        for resource in resources:
-            app_id = resource.get('application_id', 'N/A')
-            print(f"{resource['index']:<5} {resource['type']:<20} {resource['name']:<30} {resource['id']:<30} {app_id:<15}")
+
+    def print_resource_row(self, resource):
+        app_id = resource.get('application_id', 'N/A')
+        print(f"{resource['index']:<5} {resource['type']:<20} {resource['name']:<30} {resource['id']:<30} {app_id:<15}")
     
-    def select_resources(self, resources):
-        """Let user select resources by number"""
+    def select_resources(self, resources, selection=None):
+        """Let user select resources by number, range or filter (see resource_selector.py)"""
         if not resources:
             return []
         
-        selection = input("\nEnter the number(s) of resources to delete (comma-separated): ")
+        if selection is None:
+            selection = input(f"\nEnter the resources to delete ({SYNTAX}; comma-separated): ")
         
-        selected_indices = []
         try:
-            for num in selection.split(','):
-                num = num.strip()
-                if num:  # Skip empty strings
-                    selected_indices.append(int(num))
-        except ValueError:
-            print(f"Invalid input: {num}. Must be a number.")
+            selected_resources = ResourceIndex(resources).select(selection)
+        except ValueError as e:
+            print(f"Invalid selection: {e}")
             return []
         
-        selected_resources = []
-        for resource in resources:
-            if resource['index'] in selected_indices:
-                selected_resources.append(resource)
-        
         if not selected_resources:
             print("No valid resources selected.")
         else:
@@ -195,153 +196,175 @@ class QBusinessCleaner:
         return confirm.lower() in ['yes', 'y']
 
     def delete_resources(self, resources):
-        """Delete selected resources one by one"""
+        """Delete selected resources as a dependency graph.
+
+        Resources without selected children start deleting at once; an index or application
+        starts deleting as soon as its selected children are gone, so independent applications
+        proceed in parallel. Every pending deletion is watched by one shared ResourceWaiter,
+        which backs off per resource instead of blocking on a wait loop for each one.
+        """
         print("\nDeleting resources...")
-        
-        # Sort resources to ensure proper deletion order (applications last)
-        sorted_resources = sorted(resources, key=lambda x: 1 if x['type'] == 'Application' else 0)
-        
-        for resource in sorted_resources:
-            print(f"\nDeleting {resource['type']}: {resource['name']} ({resource['id']})...")
-            try:
-                if resource['type'] == 'Data Source':
-                    resource['delete_function'](resource['id'], resource['application_id'])
-                elif resource['type'] == 'Index':
-                    resource['delete_function'](resource['id'], resource['application_id'])
-                elif resource['type'] == 'Web Experience':
-                    resource['delete_function'](resource['id'], resource['application_id'])
-                elif resource['type'] == 'Plugin':
-                    resource['delete_function'](resource['id'], resource['application_id'])
-                elif resource['type'] == 'Retriever':
-                    resource['delete_function'](resource['id'], resource['application_id'])
-                else:
-                    resource['delete_function'](resource['id'])
-            except Exception as e:
-                print(f"ERROR: Failed to delete {resource['type']} {resource['name']}: {e}")
-    
+        start = time.monotonic()
+
+        by_key = {(r['type'], r['id']): r for r in resources}
+
+        def parent_key(resource):
+            # A data source belongs to its index, everything else to its application
+            if resource['type'] == 'Data Source' and ('Index', resource['index_id']) in by_key:
+                return ('Index', resource['index_id'])
+            if resource['type'] != 'Application' and ('Application', resource['application_id']) in by_key:
+                return ('Application', resource['application_id'])
+            return None
+
+        children_left = {key: 0 for key in by_key}
+        for resource in resources:
+            if parent_key(resource):
+                children_left[parent_key(resource)] += 1
+
+        waiter = ResourceWaiter(max_delay=POLL_INTERVAL, timeout=DELETE_TIMEOUT, max_concurrent_calls=self.max_workers)
+
+        def child_finished(resource):
+            # Failed and timed-out children count as finished so their parent is still attempted
+            parent = parent_key(resource)
+            if parent:
+                children_left[parent] -= 1
+                if children_left[parent] == 0:
+                    print(f"All selected children of {parent[0].lower()} {parent[1]} are gone")
+                    watch(by_key[parent])
+
+        def watch(resource):
+            waiter.watch(
+                (resource['type'], resource['id']),
+                probe=lambda: self._is_deleted(resource),
+                start=lambda: self._start_deletion(resource),
+                on_done=lambda key, state, detail: child_finished(resource),
+                label=f"{resource['type']} {resource['name']} ({resource['id']})"
+            )
+
+        for resource in resources:
+            if children_left[(resource['type'], resource['id'])] == 0:
+                watch(resource)
+        waiter.run()
+
+        print(f"\n{waiter.summary()} in {time.monotonic() - start:.0f}s")
+
+    def _start_deletion(self, resource):
+        """Initiate deletion of one resource"""
+        print(f"\nDeleting {resource['type']}: {resource['name']} ({resource['id']})...")
+        if resource['type'] == 'Application':
+            resource['delete_function'](resource['id'])
+        elif resource['type'] == 'Data Source':
+            resource['delete_function'](resource['id'], resource['application_id'], resource['index_id'])
+        else:
+            resource['delete_function'](resource['id'], resource['application_id'])
+
     # Resource deletion functions
     def delete_application(self, application_id):
         """Delete a Q Business application"""
-        try:
-            self.q_client.delete_application(applicationId=application_id)
-            print(f"Application {application_id} deletion initiated. This may take several minutes to complete.")
-            self._wait_for_deletion('application', application_id)
-        except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+        self.q_client.delete_application(applicationId=application_id)
+        print(f"Application {application_id} deletion initiated. This may take several minutes to complete.")
 
-    def delete_data_source(self, data_source_id, application_id):
+    def delete_data_source(self, data_source_id, application_id, index_id):
         """Delete a Q Business data source"""
-        try:
-            self.q_client.delete_data_source(
-                applicationId=application_id,
-                dataSourceId=data_source_id
-            )
-            print(f"Data source {data_source_id} deletion initiated.")
-            self._wait_for_deletion('data_source', data_source_id, application_id)
-        except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+        self.q_client.delete_data_source(
+            applicationId=application_id,
+            indexId=index_id,
+            dataSourceId=data_source_id
+        )
+        print(f"Data source {data_source_id} deletion initiated.")
 
     def delete_index(self, index_id, application_id):
         """Delete a Q Business index"""
-        try:
-            self.q_client.delete_index(
-                applicationId=application_id,
-                indexId=index_id
-            )
-            print(f"Index {index_id} deletion initiated.")
-            self._wait_for_deletion('index', index_id, application_id)
-        except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+        self.q_client.delete_index(
+            applicationId=application_id,
+            indexId=index_id
+        )
+        print(f"Index {index_id} deletion initiated.")
 
     def delete_web_experience(self, web_experience_id, application_id):
         """Delete a Q Business web experience"""
-        try:
-            self.q_client.delete_web_experience(
-                applicationId=application_id,
-                webExperienceId=web_experience_id
-            )
-            print(f"Web experience {web_experience_id} deletion initiated.")
-            self._wait_for_deletion('web_experience', web_experience_id, application_id)
-        except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+        self.q_client.delete_web_experience(
+            applicationId=application_id,
+            webExperienceId=web_experience_id
+        )
+        print(f"Web experience {web_experience_id} deletion initiated.")
 
     def delete_plugin(self, plugin_id, application_id):
         """Delete a Q Business plugin"""
-        try:
-            self.q_client.delete_plugin(
-                applicationId=application_id,
-                pluginId=plugin_id
-            )
-            print(f"Plugin {plugin_id} deletion initiated.")
-            self._wait_for_deletion('plugin', plugin_id, application_id)
-        except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+        self.q_client.delete_plugin(
+            applicationId=application_id,
+            pluginId=plugin_id
+        )
+        print(f"Plugin {plugin_id} deletion initiated.")
 
     def delete_retriever(self, retriever_id, application_id):
         """Delete a Q Business retriever"""
+        self.q_client.delete_retriever(
+            applicationId=application_id,
+            retrieverId=retriever_id
+        )
+        print(f"Retriever {retriever_id} deletion initiated.")
+
+    def _is_deleted(self, resource):
+        """Probe a resource once: False while it still exists, True once it is gone"""
+        resource_type = resource['type']
+        resource_id = resource['id']
+        application_id = resource.get('application_id')
         try:
-            self.q_client.delete_retriever(
-                applicationId=application_id,
-                retrieverId=retriever_id
-            )
-            print(f"Retriever {retriever_id} deletion initiated.")
-            self._wait_for_deletion('retriever', retriever_id, application_id)
+            if resource_type == 'Application':
+                self.q_client.get_application(applicationId=resource_id)
+            elif resource_type == 'Data Source':
+                self.q_client.get_data_source(applicationId=application_id, indexId=resource['index_id'],
+                                              dataSourceId=resource_id)
+            elif resource_type == 'Index':
+                self.q_client.get_index(applicationId=application_id, indexId=resource_id)
+            elif resource_type == 'Web Experience':
+                self.q_client.get_web_experience(applicationId=application_id, webExperienceId=resource_id)
+            elif resource_type == 'Plugin':
+                self.q_client.get_plugin(applicationId=application_id, pluginId=resource_id)
+            elif resource_type == 'Retriever':
+                self.q_client.get_retriever(applicationId=application_id, retrieverId=resource_id)
+            return False
         except ClientError as e:
-            raise Exception(f"Error: {str(e)}")
+            if 'ResourceNotFoundException' in str(e) or 'NotFound' in str(e):
+                return True
+            raise
 
-    def _wait_for_deletion(self, resource_type, resource_id, application_id=None):
-        """Wait for a resource to be deleted"""
-        print(f"Waiting for {resource_type} deletion to complete...")
-        max_attempts = 30
-        attempts = 0
-        
-        while attempts < max_attempts:
-            try:
-                if resource_type == 'application':
-                    self.q_client.get_application(applicationId=resource_id)
-                elif resource_type == 'data_source':
-                    self.q_client.get_data_source(applicationId=application_id, dataSourceId=resource_id)
-                elif resource_type == 'index':
-                    self.q_client.get_index(applicationId=application_id, indexId=resource_id)
-                elif resource_type == 'web_experience':
-                    self.q_client.get_web_experience(applicationId=application_id, webExperienceId=resource_id)
-                elif resource_type == 'plugin':
-                    self.q_client.get_plugin(applicationId=application_id, pluginId=resource_id)
-                elif resource_type == 'retriever':
-                    self.q_client.get_retriever(applicationId=application_id, retrieverId=resource_id)
-                
-                print("Still deleting...")
-                time.sleep(10)  # Check every 10 seconds
-                attempts += 1
-            except ClientError as e:
-                if 'ResourceNotFoundException' in str(e) or 'NotFound' in str(e):
-                    print(f"{resource_type.capitalize()} {resource_id} successfully deleted.")
-                    return
-                else:
-                    print(f"Error checking {resource_type} status: {str(e)}")
-                    return
-        
-        print(f"Deletion of {resource_type} {resource_id} is taking longer than expected. It may still be in progress.")
-
-    def run(self):
+    def run(self, stream=False, selection=None, assume_yes=False):
         """Main execution flow"""
         self.print_header()
         
-        # Fetch all resources at once
-        all_resources = self.fetch_all_resources()
-        
-        # Display all resources in a consolidated view
-        self.display_resources(all_resources)
+        if stream:
+            # Print each row as soon as its place in the list is known
+            self.print_table_header()
+            all_resources = self.fetch_all_resources(on_resource=self.print_resource_row)
+            if not all_resources:
+                print("No Amazon Q Business resources found.")
+        else:
+            # Fetch all resources at once
+            all_resources = self.fetch_all_resources()
+
+            # Display all resources in a consolidated view
+            self.display_resources(all_resources)
         
         # Let user select resources to delete
-        selected_resources = self.select_resources(all_resources)
+        selected_resources = self.select_resources(all_resources, selection)
         
         # Confirm and delete if resources were selected
-        if selected_resources and self.confirm_deletion(len(selected_resources)):
+        if selected_resources and (assume_yes or self.confirm_deletion(len(selected_resources))):
             self.delete_resources(selected_resources)
         
         print("\nOperation completed.")
 
 if __name__ == "__main__":
-    cleaner = QBusinessCleaner()
-    cleaner.run()
+    parser = argparse.ArgumentParser(description="List and delete Amazon Q Business resources.")
+    parser.add_argument('--stream', action='store_true',
+                        help="print resources as they are discovered instead of after discovery finishes")
+    parser.add_argument('--workers', type=int, default=10, help="concurrent list/delete calls (default: 10)")
+    parser.add_argument('--select', metavar='EXPR',
+                        help="select resources without prompting, e.g. 'type=index name=test-*' (see resource_selector.py)")
+    parser.add_argument('--yes', action='store_true', help="delete the selection without asking for confirmation")
+    args = parser.parse_args()
+
+    cleaner = QBusinessCleaner(max_workers=args.workers)
+    cleaner.run(stream=args.stream, selection=args.select, assume_yes=args.yes)
@@ -0,0 +1,119 @@
+# Run a per-region job across several AWS regions at once.
+# Used by tag-ebs-volumes.py and clean-ami-and-snapshots.py.
+#
+# By default only the session's configured region is processed. A list of regions runs
+# exactly those, and ALL_REGIONS opts in to every enabled region, as reported by
+# describe_regions. Each region gets one client, created
+# once and reused by everything that runs there, and the regions are processed on a
+# thread pool so a full sweep takes about as long as the slowest region. A job is
+# called as job(client, region, log) and returns a dict of counters; log prefixes its
+# output with the region so interleaved lines stay readable. The counters from all
+# regions are merged into one table at the end, and a region that fails is reported
+# there instead of stopping the others.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+import ec2_throttle
+
+DEFAULT_WORKERS = 32  # enough to run every commercial region at once
+ALL_REGIONS = 'all'
+
+
+def enabled_regions(session=None, region_name="us-east-1"):
+    """Return the regions enabled for this account (opted-in or not requiring opt-in)"""
+    session = session or boto3.session.Session()
+    client = session.client('ec2', region_name=region_name)
+    return sorted(region['RegionName'] for region in client.describe_regions()['Regions'])
+
+
+def resolve_regions(regions=None, session=None):
+    """None means the session's configured region, ALL_REGIONS every enabled region, else the given list"""
+    if regions == ALL_REGIONS:
+        return enabled_regions(session)
+    if regions:
+        return list(regions)
+    session = session or boto3.session.Session()
+    if not session.region_name:
+        raise ValueError("No region configured. Set AWS_DEFAULT_REGION, list the regions or use ALL_REGIONS.")
+    return [session.region_name]
+
+
+class RegionClients:
+    """Creates one client per region on first use and hands the same one out afterwards"""
+
+    def __init__(self, factory=ec2_throttle.ec2_client, **client_kwargs):
+        self.factory = factory
+        self.client_kwargs = client_kwargs
+        self.clients = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def get(self, region):
+        # Lock per region so creating one region's client doesn't hold up the others
+        with self.lock:
+            region_lock = self.locks.setdefault(region, threading.Lock())
+        with region_lock:
+            if region not in self.clients:
+                self.clients[region] = self.factory(region, **self.client_kwargs)
+            return self.clients[region]
+
+
+def region_logger(region):
+    def log(message):
+        print(f"[{region}] {message}")
+    return log
+
+
+def run_in_regions(job, regions=None, workers=DEFAULT_WORKERS, clients=None):
+    """Run job in each region concurrently; return {region: (counters, error, seconds)} in region order"""
+    regions = resolve_regions(regions)
+    clients = clients or RegionClients()
+
+    def run(region):
+        start = time.monotonic()
+        try:
+            counters = job(clients.get(region), region, region_logger(region))
+            return counters or {}, None, time.monotonic() - start
+        except Exception as e:
+            region_logger(region)(f"FAILED: {e}")
+            return {}, e, time.monotonic() - start
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(regions)) or 1) as executor:
+        return dict(zip(regions, executor.map(run, regions)))
+
+
+def print_report(results, elapsed):
+    """Print one row per region plus a total row"""
+    columns = []
+    for counters, _, _ in results.values():
+        columns.extend(name for name in counters if name not in columns)
+
+    width = max([len("Region"), len("TOTAL")] + [len(region) for region in results])
+    headers = [name.replace('_', ' ') for name in columns]
+    print(f"{'Region':<{width}}  " + "  ".join(f"{header:>{max(len(header), 6)}}" for header in headers)
+          + "  seconds  status")
+    totals = dict.fromkeys(columns, 0)
+    for region, (counters, error, seconds) in results.items():
+        cells = []
+        for name, header in zip(columns, headers):
+            count = counters.get(name, 0)
+            totals[name] += count
+            cells.append(f"{count:>{max(len(header), 6)}}")
+        status = f"FAILED: {error}" if error else "ok"
+        print(f"{region:<{width}}  " + "  ".join(cells) + f"  {seconds:7.1f}  {status}")
+    failed = sum(1 for _, error, _ in results.values() if error)
+    print(f"{'TOTAL':<{width}}  "
+          + "  ".join(f"{totals[name]:>{max(len(header), 6)}}" for name, header in zip(columns, headers))
+          + f"  {elapsed:7.1f}  {len(results) - failed}/{len(results)} regions ok")
+
+
+def fan_out(job, regions=None, workers=DEFAULT_WORKERS, clients=None):
+    """Run job across regions, print the merged report and return the results"""
+    start = time.monotonic()
+    results = run_in_regions(job, regions, workers, clients)
+    print_report(results, time.monotonic() - start)
+    return results
@@ -0,0 +1,194 @@
+# Shared selection language for the interactive cleaners.
+# Used by q_business_cleaner.py, cognito_user_pool_cleaner.py, opensearch_resource_cleaner.py
+# and bedrock_resource_cleaner.py, at the prompt or non-interactively with --select.
+#
+# An expression is a comma-separated list of terms and selects every resource matched by
+# any of them. A term is one or more space-separated conditions that must all hold:
+#
+#   12                     resource number 12
+#   1-500                  resource numbers 1 to 500
+#   name=ci-*              name glob (* ? [...]), case-sensitive
+#   name~^tmp[0-9]+        name regular expression
+#   type=index             resource type, ignoring case, spaces, '-' and '_' (type=data-source)
+#   created_before=30d     created more than 30 days ago (units m, h, d, w) or before a date
+#   created_after=2024-05-01
+#   all                    every resource
+#
+# e.g. "1-20, 45", "type=index name=test-*" or "name~-ci- created_before=7d, 900-1000".
+# Values with spaces or commas can be quoted: type="Data Source", name~"^a{1,3}$".
+# Resources without a creation time never match created_before/created_after.
+#
+# ResourceIndex builds its lookups once per listing: resources by number, a trie of names,
+# resources by type and a creation-time ordering. Each term starts from its most selective
+# condition, so matching costs about as much as the term selects rather than the whole list.
+
+import bisect
+import fnmatch
+import re
+import shlex
+from datetime import datetime, timedelta, timezone
+
+SYNTAX = "numbers, ranges (1-500) or filters such as name=test-* type=index created_before=30d"
+
+AGE_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+
+
+def _normalize_type(value):
+    return re.sub(r'[\s_-]+', '', value).lower()
+
+
+def _as_utc(moment):
+    return moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)
+
+
+def parse_time(value, now):
+    """An age such as 30d (that long before now) or an ISO date/time, as an aware datetime"""
+    match = re.fullmatch(r'(\d+)([mhdw])', value)
+    if match:
+        return now - timedelta(**{AGE_UNITS[match.group(2)]: int(match.group(1))})
+    try:
+        return _as_utc(datetime.fromisoformat(value))
+    except ValueError:
+        raise ValueError(f"Invalid age or date '{value}'. Use e.g. 30d, 12h, 2w or 2024-05-01")
+
+
+def split_terms(expression):
+    """Split an expression on the commas outside quotes"""
+    terms, current, quote = [], [], None
+    for char in expression:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == ',':
+            terms.append(''.join(current))
+            current = []
+            continue
+        current.append(char)
+    terms.append(''.join(current))
+    return terms
+
+
+class _TrieNode:
+    __slots__ = ('children', 'resources', 'count')
+
+    def __init__(self):
+        self.children = {}
+        self.resources = []  # resources whose name ends at this node
+        self.count = 0       # resources whose name passes through this node
+
+
+class ResourceIndex:
+    """Lookups over one listing of resources (dicts with 'index', 'name', 'type' and optionally 'created')"""
+
+    def __init__(self, resources, now=None):
+        self.now = now or datetime.now(timezone.utc)
+        self.resources = resources
+        self.by_index = {r['index']: r for r in resources}
+        self.by_type = {}
+        self.names = _TrieNode()
+        dated = []
+        for r in resources:
+            self.by_type.setdefault(_normalize_type(r['type']), []).append(r)
+            node = self.names
+            node.count += 1
+            for char in r['name']:
+                node = node.children.setdefault(char, _TrieNode())
+                node.count += 1
+            node.resources.append(r)
+            if r.get('created'):
+                dated.append((_as_utc(r['created']), r['index']))
+        dated.sort()
+        self.created_times = [created for created, _ in dated]
+        self.created_order = [self.by_index[index] for _, index in dated]
+
+    def select(self, expression):
+        """Resources matched by any comma-separated term, in resource-number order"""
+        selected = {}
+        for term in split_terms(expression):
+            if term.strip():
+                for r in self._match_term(term):
+                    selected[r['index']] = r
+        return [selected[index] for index in sorted(selected)]
+
+    def _match_term(self, term):
+        lexer = shlex.shlex(term, posix=True)
+        lexer.whitespace_split = True
+        lexer.escape = ''  # keep backslashes for regular expressions
+        try:
+            tokens = list(lexer)
+        except ValueError as e:
+            raise ValueError(f"Invalid term '{term.strip()}': {e}")
+        conditions = [self._condition(token) for token in tokens]
+        # Start from the condition with the fewest candidates and check the rest against those
+        _, candidates, _ = min(conditions, key=lambda condition: condition[0])
+        predicates = [predicate for _, _, predicate in conditions]
+        return [r for r in candidates() if all(predicate(r) for predicate in predicates)]
+
+    def _condition(self, token):
+        """Parse one token into (candidate count, candidates(), predicate(resource))"""
+        total = len(self.resources)
+        if token.lower() in ('all', '*'):
+            return total, lambda: self.resources, lambda r: True
+
+        match = re.fullmatch(r'(\d+)(?:-(\d+))?', token)
+        if match:
+            low, high = int(match.group(1)), int(match.group(2) or match.group(1))
+            if low > high:
+                raise ValueError(f"Invalid range '{token}'")
+            if high - low < total:
+                candidates = lambda: [self.by_index[i] for i in range(low, high + 1) if i in self.by_index]
+            else:
+                candidates = lambda: self.resources
+            return min(high - low + 1, total), candidates, lambda r: low <= r['index'] <= high
+
+        match = re.fullmatch(r'(name|type|created_before|created_after)([=~])(.*)', token)
+        if not match:
+            raise ValueError(f"Unrecognized selection term '{token}'")
+        field, operator, value = match.groups()
+
+        if field == 'name' and operator == '~':
+            try:
+                pattern = re.compile(value)
+            except re.error as e:
+                raise ValueError(f"Invalid regular expression '{value}': {e}")
+            return total, lambda: self.resources, lambda r: pattern.search(r['name']) is not None
+
+        if operator != '=':
+            raise ValueError(f"'{field}' takes '=', not '~'")
+
+        if field == 'name':
+            prefix = re.split(r'[*?\[]', value, maxsplit=1)[0]
+            node = self.names
+            for char in prefix:
+                node = node.children.get(char)
+                if node is None:
+                    return 0, lambda: [], lambda r: False
+            return node.count, lambda: self._under(node), lambda r: fnmatch.fnmatchcase(r['name'], value)
+
+        if field == 'type':
+            pattern = _normalize_type(value)
+            types = [t for t in self.by_type if fnmatch.fnmatchcase(t, pattern)]
+            return (sum(len(self.by_type[t]) for t in types),
+                    lambda: [r for t in types for r in self.by_type[t]],
+                    lambda r: fnmatch.fnmatchcase(_normalize_type(r['type']), pattern))
+
+        cutoff = parse_time(value, self.now)
+        if field == 'created_before':
+            end = bisect.bisect_left(self.created_times, cutoff)
+            return (end, lambda: self.created_order[:end],
+                    lambda r: bool(r.get('created')) and _as_utc(r['created']) < cutoff)
+        start = bisect.bisect_right(self.created_times, cutoff)
+        return (len(self.created_order) - start, lambda: self.created_order[start:],
+                lambda r: bool(r.get('created')) and _as_utc(r['created']) > cutoff)
+
+    def _under(self, node):
+        """Every resource whose name starts with the prefix leading to node"""
+        found = []
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            found.extend(node.resources)
+            stack.extend(node.children.values())
+        return found
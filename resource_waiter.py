@@ -0,0 +1,315 @@
+# Shared asyncio waiter for resources that take a while to delete.
+# Used by q_business_cleaner.py, cognito_user_pool_cleaner.py, opensearch_resource_cleaner.py
+# and bedrock_resource_cleaner.py.
+#
+# Instead of one fixed-interval polling loop per resource, a ResourceWaiter watches any
+# number of resources at once on a single event loop. Each watch is probed with
+# exponential backoff and jitter until it finishes, fails or passes its own deadline.
+# Resources whose service has a batch status call (batch_get_collection, for example) are
+# watched in groups, so one call covers a whole batch of them. Probes are ordinary
+# blocking boto3 calls run in worker threads. on_done callbacks run on the loop and may
+# add further watches, which is how "delete the parent once its children are gone" is
+# expressed. A start or probe call that hits throttling, a conflict, a 5xx or a
+# connection error is retried with the same backoff until the resource's deadline.
+
+import asyncio
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+BASE_DELAY = 1.0        # seconds before the first probe
+MAX_DELAY = 30.0        # cap on the delay between probes of one resource
+BACKOFF_FACTOR = 2.0
+JITTER = 0.5            # each delay is drawn from [delay * (1 - JITTER), delay]
+DEFAULT_TIMEOUT = 600   # per-resource deadline, in seconds
+MAX_CONCURRENT_CALLS = 10
+PROGRESS_INTERVAL = 10  # seconds between progress callbacks
+
+# Error codes that mean "ask again later" rather than "this resource failed"
+RETRYABLE_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'TooManyRequestsException',
+    'RequestLimitExceeded', 'RequestThrottled', 'RequestThrottledException', 'SlowDown',
+    'ProvisionedThroughputExceededException', 'ServiceUnavailable', 'ServiceUnavailableException',
+    'InternalError', 'InternalFailure', 'InternalServerError', 'InternalServerException',
+    'RequestTimeout', 'RequestTimeoutException', 'ConflictException',
+}
+
+DONE = 'done'
+FAILED = 'failed'
+TIMED_OUT = 'timed out'
+
+
+def is_retryable(error):
+    """True for throttling, conflict, server-side and connection errors: worth another attempt later"""
+    if isinstance(error, ClientError):
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return error.response.get('Error', {}).get('Code') in RETRYABLE_ERROR_CODES or status == 429 or status >= 500
+    return isinstance(error, (ConnectionError, HTTPClientError))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * pct // 100) - 1)]
+
+
+def print_latencies(latencies):
+    """Print count and p50/p90/p99/max seconds for each {stage: [seconds]}"""
+    width = max([len("Stage")] + [len(stage) for stage in latencies])
+    print(f"{'Stage':<{width}}  {'count':>5}  {'p50':>6}  {'p90':>6}  {'p99':>6}  {'max':>6}")
+    for stage, values in latencies.items():
+        if values:
+            print(f"{stage:<{width}}  {len(values):>5}  "
+                  + "  ".join(f"{percentile(values, pct):>6.1f}" for pct in (50, 90, 99, 100)))
+
+
+class _Watch:
+    def __init__(self, key, label, probe, start, timeout, on_done, group=None):
+        self.key = key
+        self.label = label
+        self.probe = probe
+        self.start = start
+        self.timeout = timeout
+        self.on_done = on_done
+        self.group = group
+        self.started = time.monotonic()
+        self.deadline = None
+
+
+class _Group:
+    def __init__(self, probe_batch, batch_size):
+        self.probe_batch = probe_batch
+        self.batch_size = batch_size
+        self.members = {}
+        self.attempt = 0
+
+
+class ResourceWaiter:
+    """Watch many resources at once until each one is done, failed or timed out.
+
+    probe() returns True once the resource is finished (usually: gone) and False while it
+    is still in progress; raising marks it failed, unless the error is_retryable(). A watch
+    without a probe is done as soon as its start() call returns; start() is retried on
+    is_retryable() errors too. probe_batch(keys) does the
+    same for a list of keys and returns {key: True, False or an exception}; missing keys are
+    still in progress. start(), if given, is called before the first probe (usually the delete call).
+    on_done(key, state, detail) is called once per watch with DONE, FAILED or TIMED_OUT.
+    progress(waiter), if given, is called every progress_interval seconds while watches run.
+    """
+
+    def __init__(self, verb="deleted", base_delay=BASE_DELAY, max_delay=MAX_DELAY, factor=BACKOFF_FACTOR,
+                 jitter=JITTER, timeout=DEFAULT_TIMEOUT, max_concurrent_calls=MAX_CONCURRENT_CALLS, log=print,
+                 progress=None, progress_interval=PROGRESS_INTERVAL):
+        self.verb = verb
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.timeout = timeout
+        self.max_concurrent_calls = max_concurrent_calls
+        self.log = log
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.results = {}   # key -> (state, detail, seconds)
+        self.pending = {}   # key -> label of every watch started but not yet finished
+        self.calls = 0      # start and probe calls made
+        self._queued = []
+        self._dependents = []  # [set of keys still unfinished, callback]
+        self._groups = {}
+        self._tasks = set()
+        self._loop = None
+        self._loop_thread = None
+        self._semaphore = None
+
+    def watch(self, key, probe=None, start=None, timeout=None, on_done=None, label=None):
+        """Watch one resource with its own probe"""
+        self._add(_Watch(key, label or str(key), probe, start, timeout or self.timeout, on_done))
+
+    def watch_batch(self, key, group, probe_batch, batch_size, start=None, timeout=None, on_done=None, label=None):
+        """Watch a resource through a batch status call shared by every key in group"""
+        if group not in self._groups:
+            self._groups[group] = _Group(probe_batch, batch_size)
+        self._add(_Watch(key, label or str(key), None, start, timeout or self.timeout, on_done, group))
+
+    def after(self, keys, callback):
+        """Call callback() once every watch in keys has finished, however it finished"""
+        waiting = set(keys) - set(self.results)
+        if waiting:
+            self._dependents.append([waiting, callback])
+        else:
+            callback()
+
+    def run(self):
+        """Block until every watch (including ones added by callbacks) has finished; return results"""
+        if self._queued:
+            asyncio.run(self._main())
+        return self.results
+
+    def summary(self):
+        states = [state for state, _, _ in self.results.values()]
+        return (f"{states.count(DONE)} {self.verb}, {states.count(FAILED)} failed, "
+                f"{states.count(TIMED_OUT)} timed out ({self.calls} API calls)")
+
+    def latencies(self, stage=lambda key: key[0]):
+        """{stage: [seconds]} for every watch that finished successfully, grouped by stage(key)"""
+        grouped = {}
+        for key, (state, _, seconds) in self.results.items():
+            if state == DONE:
+                grouped.setdefault(stage(key), []).append(seconds)
+        return grouped
+
+    def _add(self, watch):
+        if self._loop is None:
+            self._queued.append(watch)
+        elif threading.current_thread() is self._loop_thread:
+            self._spawn(watch)
+        else:
+            self._loop.call_soon_threadsafe(self._spawn, watch)
+
+    def _spawn(self, watch):
+        self.pending[watch.key] = watch.label
+        task = self._loop.create_task(self._run_watch(watch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.current_thread()
+        self._semaphore = asyncio.Semaphore(self.max_concurrent_calls)
+        for watch in self._queued:
+            self._spawn(watch)
+        self._queued = []
+        reporter = self._loop.create_task(self._report_progress()) if self.progress else None
+        try:
+            while self._tasks:
+                await asyncio.wait(set(self._tasks))
+        finally:
+            if reporter:
+                reporter.cancel()
+            self._loop = None
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            try:
+                self.progress(self)
+            except Exception as e:
+                self.log(f"ERROR: progress report failed: {e}")
+
+    def _delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * self.factor ** attempt)
+        return random.uniform(delay * (1 - self.jitter), delay)
+
+    async def _call(self, func, *args):
+        async with self._semaphore:
+            self.calls += 1
+            return await asyncio.to_thread(func, *args)
+
+    def _finish(self, watch, state, detail=None):
+        elapsed = time.monotonic() - watch.started
+        self.results[watch.key] = (state, detail, elapsed)
+        self.pending.pop(watch.key, None)
+        if state == DONE:
+            self.log(f"{watch.label} {self.verb} after {elapsed:.0f}s")
+        elif state == FAILED:
+            self.log(f"ERROR: {watch.label}: {detail}")
+        else:
+            self.log(f"{watch.label} is still not {self.verb} after {elapsed:.0f}s. It may still be in progress."
+                     + (f" Last error: {detail}" if detail else ""))
+        if watch.on_done:
+            try:
+                watch.on_done(watch.key, state, detail)
+            except Exception as e:
+                self.log(f"ERROR: follow-up for {watch.label} failed: {e}")
+        for dependent in list(self._dependents):
+            dependent[0].discard(watch.key)
+            if not dependent[0]:
+                self._dependents.remove(dependent)
+                try:
+                    dependent[1]()
+                except Exception as e:
+                    self.log(f"ERROR: follow-up after {watch.label} failed: {e}")
+
+    async def _run_watch(self, watch):
+        if watch.start and not await self._start(watch):
+            return
+        watch.deadline = time.monotonic() + watch.timeout
+
+        if watch.probe is None and watch.group is None:
+            self._finish(watch, DONE)
+            return
+
+        if watch.group is not None:
+            group = self._groups[watch.group]
+            group.members[watch.key] = watch
+            group.attempt = 0  # a new member is worth an early look
+            if len(group.members) == 1:
+                await self._run_group(watch.group)
+            return
+
+        attempt = 0
+        last_error = None
+        while True:
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+            try:
+                finished = await self._call(watch.probe)
+            except Exception as e:
+                if not is_retryable(e):
+                    self._finish(watch, FAILED, e)
+                    return
+                finished, last_error = False, e
+            if finished:
+                self._finish(watch, DONE)
+                return
+            if time.monotonic() >= watch.deadline:
+                self._finish(watch, TIMED_OUT, last_error)
+                return
+
+    async def _start(self, watch):
+        """Call watch.start, retrying retryable errors until the timeout; False if the watch failed"""
+        deadline = time.monotonic() + watch.timeout
+        attempt = 0
+        while True:
+            try:
+                await self._call(watch.start)
+                return True
+            except Exception as e:
+                if attempt and isinstance(e, ClientError) and \
+                        e.response.get('Error', {}).get('Code') == 'ResourceNotFoundException':
+                    return True  # an earlier attempt went through after all; the probe will confirm
+                if not is_retryable(e) or time.monotonic() >= deadline:
+                    self._finish(watch, FAILED, e)
+                    return False
+            await asyncio.sleep(self._delay(attempt))
+            attempt += 1
+
+    async def _run_group(self, name):
+        """One loop per group probes all of its members together, in batches"""
+        group = self._groups[name]
+        while group.members:
+            await asyncio.sleep(self._delay(group.attempt))
+            group.attempt += 1
+            keys = list(group.members)
+            batches = [keys[i:i + group.batch_size] for i in range(0, len(keys), group.batch_size)]
+            outcomes = await asyncio.gather(*(self._call(group.probe_batch, batch) for batch in batches),
+                                            return_exceptions=True)
+            now = time.monotonic()
+            for batch, outcome in zip(batches, outcomes):
+                for key in batch:
+                    watch = group.members[key]
+                    status = outcome if isinstance(outcome, Exception) else outcome.get(key, False)
+                    last_error = None
+                    if isinstance(status, Exception) and is_retryable(status):
+                        status, last_error = False, status
+                    if isinstance(status, Exception):
+                        del group.members[key]
+                        self._finish(watch, FAILED, status)
+                    elif status:
+                        del group.members[key]
+                        self._finish(watch, DONE)
+                    elif now >= watch.deadline:
+                        del group.members[key]
+                        self._finish(watch, TIMED_OUT, last_error)
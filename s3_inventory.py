@@ -0,0 +1,157 @@
+# Streaming reader for S3 Inventory reports.
+# Used by clean_and_delete_buckets.py --inventory-manifest.
+#
+# Takes the location of an inventory manifest.json (a local path or s3://bucket/key),
+# reads its CSV, ORC or Parquet data files one at a time and yields delete_objects
+# entries ({'Key': ..., 'VersionId': ...}) without ever holding more than one row
+# group / stripe / CSV line in memory. ORC and Parquet need pyarrow installed.
+
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from urllib.parse import unquote_plus, urlparse
+
+
+def is_s3_location(location):
+    return location.startswith('s3://')
+
+
+def split_s3_location(location):
+    parsed = urlparse(location)
+    return parsed.netloc, parsed.path.lstrip('/')
+
+
+def load_manifest(location, s3=None):
+    """Read and validate an inventory manifest.json"""
+    if is_s3_location(location):
+        bucket, key = split_s3_location(location)
+        body = s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        manifest = json.loads(body)
+    else:
+        with open(location) as manifest_file:
+            manifest = json.load(manifest_file)
+
+    for field in ('sourceBucket', 'fileFormat', 'fileSchema', 'files'):
+        if field not in manifest:
+            raise ValueError(f"Inventory manifest {location} is missing '{field}'")
+    if manifest['fileFormat'] not in ('CSV', 'ORC', 'Parquet'):
+        raise ValueError(f"Unsupported inventory format: {manifest['fileFormat']}")
+    return manifest
+
+
+def iter_inventory_objects(manifest_location, s3=None, manifest=None):
+    """Yield a {'Key', 'VersionId'} entry for every row of every inventory data file"""
+    if manifest is None:
+        manifest = load_manifest(manifest_location, s3)
+
+    file_format = manifest['fileFormat']
+    for data_file in manifest['files']:
+        if file_format == 'CSV':
+            rows = _iter_csv_rows(manifest, manifest_location, data_file['key'], s3)
+        else:
+            rows = _iter_columnar_rows(manifest, manifest_location, data_file['key'], s3)
+        for key, version_id in rows:
+            entry = {'Key': key}
+            if version_id is not None:
+                entry['VersionId'] = version_id
+            yield entry
+
+
+def _destination_bucket(manifest):
+    # destinationBucket is an ARN: arn:aws:s3:::bucket-name
+    return manifest['destinationBucket'].split(':::')[-1]
+
+
+def _local_data_path(manifest_location, data_key):
+    """Find a data file next to a local manifest.
+
+    Inventory data keys are relative to the destination bucket root, so walk up from
+    the manifest directory looking for the key; fall back to the file name in the
+    manifest directory or its sibling 'data' directory.
+    """
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_location))
+    directory = manifest_dir
+    while True:
+        candidate = os.path.join(directory, data_key)
+        if os.path.exists(candidate):
+            return candidate
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            break
+        directory = parent
+
+    file_name = os.path.basename(data_key)
+    for candidate in (os.path.join(manifest_dir, file_name),
+                      os.path.join(os.path.dirname(manifest_dir), 'data', file_name)):
+        if os.path.exists(candidate):
+            return candidate
+    raise FileNotFoundError(f"Inventory data file {data_key} not found near {manifest_location}")
+
+
+def _iter_csv_rows(manifest, manifest_location, data_key, s3):
+    columns = [c.strip() for c in manifest['fileSchema'].split(',')]
+    key_index = columns.index('Key')
+    version_index = columns.index('VersionId') if 'VersionId' in columns else None
+
+    if is_s3_location(manifest_location):
+        body = s3.get_object(Bucket=_destination_bucket(manifest), Key=data_key)['Body']
+        text = io.TextIOWrapper(gzip.GzipFile(fileobj=body), encoding='utf-8', newline='')
+    else:
+        text = gzip.open(_local_data_path(manifest_location, data_key), 'rt', encoding='utf-8', newline='')
+
+    with text:
+        for row in csv.reader(text):
+            if not row:
+                continue
+            # CSV inventories URL-encode key names
+            key = unquote_plus(row[key_index])
+            version_id = None
+            if version_index is not None:
+                # Objects written before versioning was enabled have the 'null' version
+                version_id = row[version_index] or 'null'
+            yield key, version_id
+
+
+def _iter_columnar_rows(manifest, manifest_location, data_key, s3):
+    if is_s3_location(manifest_location):
+        # pyarrow needs a seekable file, so stage one data file at a time on disk
+        with tempfile.NamedTemporaryFile(suffix=os.path.basename(data_key)) as staged:
+            body = s3.get_object(Bucket=_destination_bucket(manifest), Key=data_key)['Body']
+            shutil.copyfileobj(body, staged)
+            staged.flush()
+            yield from _read_columnar_file(manifest['fileFormat'], staged.name)
+    else:
+        yield from _read_columnar_file(manifest['fileFormat'], _local_data_path(manifest_location, data_key))
+
+
+def _read_columnar_file(file_format, path):
+    try:
+        if file_format == 'Parquet':
+            import pyarrow.parquet as pq
+        else:
+            import pyarrow.orc as orc
+    except ImportError:
+        raise RuntimeError(f"Reading {file_format} inventories requires pyarrow (pip install pyarrow)")
+
+    if file_format == 'Parquet':
+        data = pq.ParquetFile(path)
+        names = data.schema_arrow.names
+        columns = ['key'] + (['version_id'] if 'version_id' in names else [])
+        batches = data.iter_batches(columns=columns)
+    else:
+        data = orc.ORCFile(path)
+        names = data.schema.names
+        columns = ['key'] + (['version_id'] if 'version_id' in names else [])
+        batches = (data.read_stripe(i, columns=columns) for i in range(data.nstripes))
+
+    for batch in batches:
+        keys = batch.column('key').to_pylist()
+        if 'version_id' in columns:
+            versions = [v or 'null' for v in batch.column('version_id').to_pylist()]
+        else:
+            versions = [None] * len(keys)
+        yield from zip(keys, versions)
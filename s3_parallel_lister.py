@@ -0,0 +1,118 @@
+# Prefix-sharded parallel listing for S3 buckets.
+# Used by clean_and_delete_buckets.py and preSignedURL-generator.py.
+#
+# The top level of a bucket is listed with Delimiter='/' so every CommonPrefix becomes
+# its own shard, and shards are listed on a thread pool. A shard is listed flat unless
+# its first page comes back truncated; such large shards are re-listed with the
+# delimiter so their sub-prefixes split off as further shards, down to max_depth.
+# Results from all shards come back as one merged stream (in no particular order).
+
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = 16
+DEFAULT_MAX_DEPTH = 4
+
+_SHARD_DONE = object()
+
+
+def list_objects(s3, bucket, prefix='', workers=DEFAULT_WORKERS, delimiter='/', max_depth=DEFAULT_MAX_DEPTH):
+    """Yield every list_objects_v2 'Contents' entry under prefix"""
+    def list_shard(shard_prefix, split):
+        paginator = s3.get_paginator('list_objects_v2')
+        kwargs = {'Bucket': bucket, 'Prefix': shard_prefix}
+        if split:
+            kwargs['Delimiter'] = delimiter
+        for page in paginator.paginate(**kwargs):
+            sub_prefixes = [p['Prefix'] for p in page.get('CommonPrefixes', [])]
+            yield page.get('Contents', []), sub_prefixes, page.get('IsTruncated', False)
+
+    return _iter_sharded(list_shard, prefix, workers, max_depth)
+
+
+def list_object_versions(s3, bucket, prefix='', workers=DEFAULT_WORKERS, delimiter='/', max_depth=DEFAULT_MAX_DEPTH):
+    """Yield every list_object_versions 'Versions' and 'DeleteMarkers' entry under prefix.
+
+    Delete markers carry an 'IsDeleteMarker': True flag so callers can tell them apart.
+    """
+    def list_shard(shard_prefix, split):
+        paginator = s3.get_paginator('list_object_versions')
+        kwargs = {'Bucket': bucket, 'Prefix': shard_prefix}
+        if split:
+            kwargs['Delimiter'] = delimiter
+        for page in paginator.paginate(**kwargs):
+            sub_prefixes = [p['Prefix'] for p in page.get('CommonPrefixes', [])]
+            entries = page.get('Versions', [])
+            for marker in page.get('DeleteMarkers', []):
+                entries.append(dict(marker, IsDeleteMarker=True))
+            yield entries, sub_prefixes, page.get('IsTruncated', False)
+
+    return _iter_sharded(list_shard, prefix, workers, max_depth)
+
+
+def _iter_sharded(list_shard, prefix, workers, max_depth):
+    """Run list_shard over a growing set of prefixes and merge the results.
+
+    list_shard(prefix, split) yields (entries, sub_prefixes, truncated) per page; each
+    sub-prefix is scheduled as a new shard. Pages are handed back through a bounded queue so a
+    slow consumer throttles the listing threads instead of buffering the bucket.
+    """
+    results = queue.Queue(maxsize=workers * 4)
+    stop = threading.Event()
+    lock = threading.Lock()
+    pending = [0]
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(shard_prefix, depth):
+        try:
+            split = depth == 0 and max_depth > 0
+            while not stop.is_set():
+                pages = list_shard(shard_prefix, split)
+                for page_number, (entries, sub_prefixes, truncated) in enumerate(pages):
+                    if not split and page_number == 0 and truncated and depth < max_depth:
+                        # More than one page: re-list this shard on its sub-prefixes
+                        split = True
+                        break
+                    for sub_prefix in sub_prefixes:
+                        submit(sub_prefix, depth + 1)
+                    if entries and not put(entries):
+                        return
+                else:
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            put(_SHARD_DONE)
+
+    def submit(shard_prefix, depth):
+        with lock:
+            pending[0] += 1
+        executor.submit(run, shard_prefix, depth)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        submit(prefix, 0)
+        while True:
+            with lock:
+                if pending[0] == 0:
+                    break
+            item = results.get()
+            if item is _SHARD_DONE:
+                with lock:
+                    pending[0] -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield from item
+    finally:
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,45 @@
+# Structured exports of Trusted Advisor findings for get-underutilized-resources.py.
+#
+# Records are the script's FlaggedResource tuples (or anything with the same fields).
+# CSV is always available; Parquet needs pyarrow installed and stores savings as a
+# float64 column so the files can be queried directly by Athena, DuckDB or pandas.
+
+import csv
+
+EXPORT_FIELDS = ['account_id', 'account_name', 'check_id', 'check_name', 'status',
+                 'region', 'resource_id', 'resource_name', 'resource_type', 'savings']
+
+FORMATS = ['csv', 'parquet']
+
+
+def write_csv(records, path):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_FIELDS)
+        for record in records:
+            writer.writerow([getattr(record, field) for field in EXPORT_FIELDS])
+
+
+def write_parquet(records, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Writing Parquet exports requires pyarrow (pip install pyarrow)")
+
+    schema = pa.schema([(field, pa.float64() if field == 'savings' else pa.string()) for field in EXPORT_FIELDS])
+    columns = {field: [getattr(record, field) for record in records] for field in EXPORT_FIELDS}
+    pq.write_table(pa.Table.from_pydict(columns, schema=schema), path)
+
+
+def export(records, base_path, formats):
+    """Write records in every requested format; return the paths written"""
+    writers = {'csv': write_csv, 'parquet': write_parquet}
+    paths = []
+    for fmt in formats:
+        if fmt not in writers:
+            raise ValueError(f"Unknown export format '{fmt}'. Choose from: {', '.join(FORMATS)}")
+        path = f"{base_path}.{fmt}"
+        writers[fmt](records, path)
+        paths.append(path)
+    return paths
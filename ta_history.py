@@ -0,0 +1,110 @@
+# Append-only history of Trusted Advisor findings for get-underutilized-resources.py.
+#
+# Every run is stored in SQLite as a snapshot: one row per (run, account, check,
+# resource id), so duplicate findings within a run collapse into one and earlier runs
+# are never rewritten. The resource id is Trusted Advisor's flagged-resource id, which is
+# unique per finding; the display name (instance type, RDS or ELB name) is kept beside it. The primary key doubles as the index for "new since last run"
+# (an anti-join between the last two runs) and a (run, region, savings) index serves
+# "top N savings by region"; both only touch the rows of the runs involved, so they
+# stay fast after a year of daily snapshots.
+
+import sqlite3
+import time
+
+DEFAULT_HISTORY_FILE = "ta-history.sqlite3"
+
+FINDING_FIELDS = ['account_id', 'check_id', 'resource_id', 'account_name', 'check_name', 'status',
+                  'region', 'resource_name', 'resource_type', 'savings']
+
+
+def _finding_row(run_id, record):
+    values = [getattr(record, field) for field in FINDING_FIELDS]
+    return (run_id,) + tuple('' if value is None else value for value in values)
+
+
+class HistoryStore:
+    def __init__(self, path=DEFAULT_HISTORY_FILE):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " run_id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " recorded_at INTEGER NOT NULL,"
+            " findings INTEGER NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS findings ("
+            " run_id INTEGER NOT NULL REFERENCES runs (run_id),"
+            " account_id TEXT NOT NULL,"
+            " check_id TEXT NOT NULL,"
+            " resource_id TEXT NOT NULL,"
+            " account_name TEXT,"
+            " check_name TEXT,"
+            " status TEXT,"
+            " region TEXT,"
+            " resource_name TEXT,"
+            " resource_type TEXT,"
+            " savings REAL NOT NULL,"
+            " PRIMARY KEY (run_id, account_id, check_id, resource_id)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS findings_by_region_savings"
+            " ON findings (run_id, region, savings DESC);"
+        )
+        columns = [row['name'] for row in self.connection.execute("PRAGMA table_info(findings)")]
+        if 'resource_name' not in columns:
+            # History files written before display names were kept apart from resource ids
+            self.connection.execute("ALTER TABLE findings ADD COLUMN resource_name TEXT")
+
+    def record_run(self, records, recorded_at=None):
+        """Store one run's records; return (run id, findings stored after de-duplication)"""
+        with self.connection:
+            run_id = self.connection.execute(
+                "INSERT INTO runs (recorded_at, findings) VALUES (?, 0)",
+                (int(recorded_at or time.time()),)
+            ).lastrowid
+            self.connection.executemany(
+                f"INSERT OR IGNORE INTO findings (run_id, {', '.join(FINDING_FIELDS)})"
+                f" VALUES (?, {', '.join('?' * len(FINDING_FIELDS))})",
+                (_finding_row(run_id, record) for record in records)
+            )
+            stored = self.connection.execute(
+                "SELECT COUNT(*) FROM findings WHERE run_id = ?", (run_id,)).fetchone()[0]
+            self.connection.execute("UPDATE runs SET findings = ? WHERE run_id = ?", (stored, run_id))
+        return run_id, stored
+
+    def run_ids(self, limit=2):
+        """Most recent run ids, newest first"""
+        return [row[0] for row in self.connection.execute(
+            "SELECT run_id FROM runs ORDER BY run_id DESC LIMIT ?", (limit,))]
+
+    def new_since_last_run(self, run_id=None):
+        """Findings in run_id (default: the latest run) that the run before it didn't have"""
+        runs = self.run_ids(limit=1) if run_id is None else [run_id]
+        if not runs:
+            return []
+        previous = self.connection.execute(
+            "SELECT MAX(run_id) FROM runs WHERE run_id < ?", (runs[0],)).fetchone()[0]
+        return [dict(row) for row in self.connection.execute(
+            "SELECT * FROM findings AS current WHERE current.run_id = ? AND NOT EXISTS ("
+            " SELECT 1 FROM findings AS earlier WHERE earlier.run_id = ?"
+            " AND earlier.account_id = current.account_id AND earlier.check_id = current.check_id"
+            " AND earlier.resource_id = current.resource_id)"
+            " ORDER BY savings DESC",
+            (runs[0], previous if previous is not None else -1)
+        )]
+
+    def top_savings_by_region(self, n=5, run_id=None):
+        """{region: [findings]} with the n biggest savings per region in run_id (default: latest)"""
+        runs = self.run_ids(limit=1) if run_id is None else [run_id]
+        if not runs:
+            return {}
+        top = {}
+        for row in self.connection.execute(
+                "SELECT * FROM (SELECT *, ROW_NUMBER() OVER (PARTITION BY region ORDER BY savings DESC) AS rank"
+                " FROM findings WHERE run_id = ? AND savings > 0) WHERE rank <= ? ORDER BY region, rank",
+                (runs[0], n)):
+            top.setdefault(row['region'], []).append(dict(row))
+        return top
+
+    def close(self):
+        self.connection.close()
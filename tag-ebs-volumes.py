@@ -1,31 +1,119 @@
-# Script intended to add tags to volumes with given region and key/value pair
-# Make sure the region is correct and modify key/value as you wish
+# Script intended to add tags to volumes in the configured region (or the regions
+# listed below, or every enabled region) with given key/value pair. Regions are
+# processed concurrently by region_fanout.py and the results are merged into one report.
+# Volumes are read page by page (narrowed by the server-side filters below), volumes
+# that already carry the tag are skipped, and the rest are tagged with create_tags
+# calls of up to 1000 volume ids each, sent concurrently. Volumes deleted since they
+# were listed are dropped from their batch and the rest of it is retried. Calls are
+# paced by the shared adaptive EC2 rate limiter (ec2_throttle.py).
+# Make sure the regions are correct and modify key/value and filters as you wish
 
-import boto3
-region = "us-east-1"
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from botocore.exceptions import ClientError
+
+import region_fanout
+
+# None uses the session's configured region; list regions, e.g. ["us-east-1", "eu-west-1"],
+# or set region_fanout.ALL_REGIONS to cover every enabled region
+regions = None
 key = "backup"
 value = "yes"
+# Server-side describe_volumes filters, e.g. [{'Name': 'status', 'Values': ['in-use']}]
+volume_filters = []
+workers = 4
+
+CREATE_TAGS_BATCH_SIZE = 1000  # most resource ids CreateTags accepts per call
+VOLUME_ID_PATTERN = re.compile(r'vol-[0-9a-f]+')
+
+
+def find_untagged_volumes(client, key, value, filters):
+    """Return (ids of matching volumes without key=value, number already tagged)"""
+    untagged = []
+    already_tagged = 0
+    paginator = client.get_paginator('describe_volumes')
+    for page in paginator.paginate(Filters=filters):
+        for volume in page['Volumes']:
+            tags = {tag['Key']: tag['Value'] for tag in volume.get('Tags', [])}
+            if tags.get(key) == value:
+                already_tagged += 1
+            else:
+                untagged.append(volume['VolumeId'])
+    return untagged, already_tagged
+
+
+def iter_batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def tag_batch(client, volume_ids, tags):
+    """Tag a batch, dropping volumes deleted since they were listed; return (tagged ids, missing ids)"""
+    missing = []
+    while volume_ids:
+        try:
+            client.create_tags(Resources=volume_ids, Tags=tags)
+            return volume_ids, missing
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'InvalidVolume.NotFound':
+                raise
+            # One missing id fails the whole call; the message names the missing ones
+            gone = set(VOLUME_ID_PATTERN.findall(e.response['Error'].get('Message', ''))) & set(volume_ids)
+            if not gone:
+                raise
+            missing.extend(sorted(gone))
+            volume_ids = [volume_id for volume_id in volume_ids if volume_id not in gone]
+    return volume_ids, missing
+
+
+def tag_volumes(client, key=key, value=value, filters=volume_filters, max_workers=workers, log=print):
+    """Tag every matching volume; return (tagged, skipped, missing ids, failed batches)"""
+    start = time.monotonic()
+    volume_ids, skipped = find_untagged_volumes(client, key, value, filters)
+    log(f"Found {len(volume_ids) + skipped} volumes, {skipped} already tagged {key}={value}, "
+        f"{len(volume_ids)} to tag")
+
+    tagged = 0
+    missing = []
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(tag_batch, client, batch, [{'Key': key, 'Value': value}]): batch
+            for batch in iter_batches(volume_ids, CREATE_TAGS_BATCH_SIZE)
+        }
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                done, gone = future.result()
+                tagged += len(done)
+                missing.extend(gone)
+                if done:
+                    log(f"Tag added on to {len(done)} volumes ({done[0]} .. {done[-1]})")
+                if gone:
+                    log(f"Skipped {len(gone)} volumes that no longer exist: {', '.join(gone)}")
+            except ClientError as e:
+                failed.append((batch, e))
+                log(f"Could not tag {len(batch)} volumes ({batch[0]} .. {batch[-1]}): {e}")
+
+    elapsed = time.monotonic() - start
+    rate = tagged / elapsed if elapsed else 0.0
+    log(f"Tagged {tagged} volumes in {len(futures)} batches, {elapsed:.1f}s "
+        f"({rate:.0f} volumes/s); {len(missing)} volumes no longer exist, {len(failed)} batches failed")
+    return tagged, skipped, missing, failed
+
+
+def tag_region(client, region, log):
+    tagged, skipped, missing, failed = tag_volumes(client, log=log)
+    return {'tagged': tagged, 'already_tagged': skipped, 'missing': len(missing), 'failed_batches': len(failed)}
 
 
-client = boto3.client('ec2',region_name=region)
-response = client.describe_volumes()
-volumes = response['Volumes']
-
-for a_volume in volumes:
-	volume_id = a_volume['VolumeId']
-	try:
-		create_tags = response = client.create_tags(
-	    DryRun=False,
-	    Resources=[
-	        str(volume_id),
-	    ],
-	    Tags=[
-	        {
-	            'Key': key,
-	            'Value': value
-	        },
-	    ]
-	)
-		print("Tag added on to: " + volume_id)
-	except Exception as e:
-		print(e)
+if __name__ == "__main__":
+    region_fanout.fan_out(tag_region, regions,
+                          clients=region_fanout.RegionClients(max_pool_connections=workers))
@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+
+import boto3
+from botocore.exceptions import EndpointConnectionError
+from moto import mock_aws
+
+import clean_and_delete_buckets as cleaner
+
+
+class FakeS3:
+    """delete_objects answers from a list of canned responses (or exceptions), recording each request"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def delete_objects(self, Bucket, Delete):
+        self.requests.append([obj['Key'] for obj in Delete['Objects']])
+        response = self.responses.pop(0) if self.responses else {}
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def entries(count, prefix='key'):
+    return [{'Key': f'{prefix}-{i:03d}', 'VersionId': f'v{i}'} for i in range(count)]
+
+
+@mock.patch('time.sleep', lambda seconds: None)
+class DeleteBatchTest(unittest.TestCase):
+
+    def test_retries_only_retryable_entries(self):
+        objects = entries(3)
+        s3 = FakeS3({'Errors': [{'Key': 'key-001', 'VersionId': 'v1', 'Code': 'SlowDown'}]}, {})
+        self.assertEqual(cleaner.delete_batch(s3, 'bucket', objects), (3, []))
+        self.assertEqual(s3.requests, [['key-000', 'key-001', 'key-002'], ['key-001']])
+
+    def test_gives_up_after_max_retries(self):
+        error = {'Key': 'key-000', 'Code': 'InternalError'}
+        s3 = FakeS3(*[{'Errors': [error]}] * 3)
+        deleted, failed = cleaner.delete_batch(s3, 'bucket', entries(1), max_retries=2)
+        self.assertEqual((deleted, failed), (0, [error]))
+        self.assertEqual(len(s3.requests), 3)
+
+    def test_permanent_errors_are_not_retried(self):
+        error = {'Key': 'key-000', 'Code': 'AccessDenied'}
+        s3 = FakeS3({'Errors': [error]})
+        self.assertEqual(cleaner.delete_batch(s3, 'bucket', entries(2)), (1, [error]))
+        self.assertEqual(len(s3.requests), 1)
+
+
+class PurgeObjectsTest(unittest.TestCase):
+
+    @mock_aws
+    def test_deletes_every_version(self):
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='bucket')
+        s3.put_bucket_versioning(Bucket='bucket', VersioningConfiguration={'Status': 'Enabled'})
+        for i in range(25):
+            s3.put_object(Bucket='bucket', Key=f'key-{i}', Body=b'one')
+            s3.put_object(Bucket='bucket', Key=f'key-{i}', Body=b'two')
+        s3.delete_object(Bucket='bucket', Key='key-0')  # leaves a delete marker
+
+        deleted, failed = cleaner.empty_bucket(s3, 'bucket', workers=3, batch_size=7, list_workers=2)
+
+        self.assertEqual((deleted, failed), (51, []))
+        self.assertTrue(cleaner.bucket_is_empty(s3, 'bucket'))
+
+    def test_batches_that_raise_count_as_failed(self):
+        s3 = FakeS3({}, EndpointConnectionError(endpoint_url='https://s3.amazonaws.com'), {})
+        deleted, failed = cleaner.purge_objects(s3, 'bucket', entries(25), workers=1, batch_size=10)
+        self.assertEqual(deleted, 15)
+        self.assertEqual([obj['Key'] for obj in failed], [f'key-{i:03d}' for i in range(10, 20)])
+        self.assertEqual({obj['Code'] for obj in failed}, {'EndpointConnectionError'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import time
+import unittest
+
+import ec2_throttle
+
+
+class ThrottledClientTest(unittest.TestCase):
+    """A real EC2 client against a simulated endpoint that throttles the first attempts"""
+
+    def setUp(self):
+        self.limiter = ec2_throttle.RegionLimiter()
+        self.throttle_next = 0
+        self.requests = []
+
+        def answer(operation_name):
+            self.requests.append(operation_name)
+            if self.throttle_next:
+                self.throttle_next -= 1
+                return 'RequestLimitExceeded'
+            return None
+
+        self.client = ec2_throttle.simulated_client(answer, self.limiter, latency=(0, 0))
+
+    def test_categorizes_from_api_params(self):
+        used = []
+        for name, bucket in self.limiter.buckets.items():
+            original = bucket.acquire
+            bucket.acquire = lambda name=name, original=original: (used.append(name), original())
+        self.client.describe_volumes(Filters=[{'Name': 'status', 'Values': ['in-use']}])
+        self.client.describe_volumes(VolumeIds=['vol-0123456789abcdef0'])
+        self.client.describe_volumes()
+        self.client.describe_volumes(Filters=[])
+        self.client.create_tags(Resources=['vol-0123456789abcdef0'], Tags=[{'Key': 'k', 'Value': 'v'}])
+        self.client.delete_volume(VolumeId='vol-0123456789abcdef0')
+        self.assertEqual(used, ['non_mutating', 'non_mutating', 'unfiltered_non_mutating',
+                                'unfiltered_non_mutating', 'mutating', 'resource_intensive'])
+
+    def test_throttle_retries_waits_and_decreases_rate(self):
+        bucket = self.limiter.buckets['mutating']
+        self.throttle_next = 1
+        start = time.monotonic()
+        self.client.create_tags(Resources=['vol-0123456789abcdef0'], Tags=[{'Key': 'k', 'Value': 'v'}])
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(self.requests, ['CreateTags', 'CreateTags'])
+        # Halved on the throttle, then one additive step back on the successful retry
+        max_rate = ec2_throttle.CATEGORY_LIMITS['mutating'][1]
+        self.assertAlmostEqual(bucket.rate, max_rate * ec2_throttle.DECREASE_FACTOR
+                               + max_rate * ec2_throttle.INCREASE_FRACTION)
+        # The burst allowance is dropped, so the retry waits for a token at the halved rate
+        self.assertGreaterEqual(elapsed, 1 / (max_rate * ec2_throttle.DECREASE_FACTOR) * 0.9)
+        self.assertEqual(self.limiter.buckets['non_mutating'].rate, ec2_throttle.CATEGORY_LIMITS['non_mutating'][1])
+
+    def test_throttles_in_one_window_halve_once(self):
+        bucket = self.limiter.buckets['non_mutating']
+        self.throttle_next = 2
+        self.client.describe_volumes(Filters=[{'Name': 'status', 'Values': ['in-use']}])
+        self.assertEqual(len(self.requests), 3)
+        max_rate = ec2_throttle.CATEGORY_LIMITS['non_mutating'][1]
+        self.assertLess(bucket.rate, max_rate)
+        self.assertGreaterEqual(bucket.rate, max_rate * ec2_throttle.DECREASE_FACTOR ** 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+import boto3
+from botocore.stub import Stubber
+
+import org_fanout
+
+NOW = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def account(account_id, name, status='ACTIVE'):
+    return {'Id': account_id, 'Name': name, 'Status': status, 'Arn': f'arn:aws:organizations::{account_id}',
+            'Email': f'{name}@example.com'}
+
+
+def assume_role_response(account_id, expires_in=3600):
+    return {'Credentials': {
+        'AccessKeyId': f'AKIA{account_id}',
+        'SecretAccessKey': 'secret',
+        'SessionToken': 'token',
+        'Expiration': NOW + timedelta(seconds=expires_in),
+    }}
+
+
+def assume_role_params(account_id):
+    return {'RoleArn': f'arn:aws:iam::{account_id}:role/{org_fanout.DEFAULT_ROLE_NAME}',
+            'RoleSessionName': org_fanout.SESSION_NAME, 'DurationSeconds': org_fanout.ROLE_DURATION}
+
+
+class StubbedTest(unittest.TestCase):
+
+    def setUp(self):
+        session = boto3.session.Session(aws_access_key_id='home', aws_secret_access_key='home',
+                                        region_name='us-east-1')
+        self.session = session
+        self.sts = session.client('sts')
+        self.organizations = session.client('organizations')
+        self.sts_stub = Stubber(self.sts)
+        self.organizations_stub = Stubber(self.organizations)
+        self.sts_stub.activate()
+        self.organizations_stub.activate()
+        self.now = NOW.timestamp()
+
+    def tearDown(self):
+        self.sts_stub.assert_no_pending_responses()
+        self.organizations_stub.assert_no_pending_responses()
+
+    def cache(self, **kwargs):
+        return org_fanout.CredentialCache(self.sts, home_session=self.session, clock=lambda: self.now, **kwargs)
+
+
+class ListAccountsTest(StubbedTest):
+
+    def test_pages_and_skips_inactive_accounts(self):
+        self.organizations_stub.add_response('list_accounts', {
+            'Accounts': [account('111111111111', 'prod'), account('222222222222', 'old', 'SUSPENDED')],
+            'NextToken': 'page-2'}, {})
+        self.organizations_stub.add_response('list_accounts', {
+            'Accounts': [account('333333333333', 'dev')]}, {'NextToken': 'page-2'})
+        self.assertEqual(org_fanout.list_accounts(self.organizations),
+                         [{'Id': '111111111111', 'Name': 'prod'}, {'Id': '333333333333', 'Name': 'dev'}])
+
+
+class CredentialCacheTest(StubbedTest):
+
+    def test_reuses_credentials_and_clients_until_near_expiry(self):
+        self.sts_stub.add_response('assume_role', assume_role_response('111111111111'),
+                                   assume_role_params('111111111111'))
+        cache = self.cache()
+        client = cache.client('111111111111', 'support', 'us-east-1')
+        self.assertIs(cache.client('111111111111', 'support', 'us-east-1'), client)
+        self.assertEqual(client._request_signer._credentials.access_key, 'AKIA111111111111')
+
+        self.now += 3600 - org_fanout.REFRESH_MARGIN  # inside the refresh margin
+        self.sts_stub.add_response('assume_role', assume_role_response('111111111111', 7200),
+                                   assume_role_params('111111111111'))
+        self.assertIsNot(cache.client('111111111111', 'support', 'us-east-1'), client)
+        self.assertEqual(cache.assumed, 2)
+
+    def test_home_account_uses_home_session(self):
+        cache = self.cache(home_account='999999999999')
+        client = cache.client('999999999999', 'support', 'us-east-1')
+        self.assertEqual(client._request_signer._credentials.access_key, 'home')
+        self.assertEqual(cache.assumed, 0)
+
+    def test_assume_all_reports_failures(self):
+        self.sts_stub.add_response('assume_role', assume_role_response('111111111111'),
+                                   assume_role_params('111111111111'))
+        self.sts_stub.add_client_error('assume_role', 'AccessDenied', 'not authorized',
+                                       expected_params=assume_role_params('222222222222'))
+        cache = self.cache(home_account='999999999999')
+        errors = org_fanout.assume_all(cache, ['111111111111', '222222222222', '999999999999'], workers=1)
+        self.assertEqual(list(errors), ['222222222222'])
+        self.assertEqual(errors['222222222222'].response['Error']['Code'], 'AccessDenied')
+        self.assertIn('111111111111', cache.credentials)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import tempfile
+import time
+import unittest
+
+import presign_cache
+
+OBJECTS = [{'Key': 'a.txt', 'ETag': '"1"'}, {'Key': 'b.txt', 'ETag': '"2"'}]
+HOUR = 3600
+WEEK = 7 * 24 * HOUR
+
+
+class PresignCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = presign_cache.PresignCache(os.path.join(directory.name, 'cache.sqlite3'), access_key='AKIA1')
+        self.addCleanup(self.cache.close)
+
+    def sign(self, expiration):
+        self.cache.store('bucket', OBJECTS, [f"url-{obj['Key']}-{expiration}" for obj in OBJECTS], expiration,
+                         time.time())
+
+    def test_reuses_urls_signed_for_the_same_expiration(self):
+        self.sign(HOUR)
+        self.assertEqual(self.cache.lookup('bucket', OBJECTS, HOUR),
+                         {'a.txt': f'url-a.txt-{HOUR}', 'b.txt': f'url-b.txt-{HOUR}'})
+
+    def test_long_expiry_is_not_reused_for_a_short_one(self):
+        self.sign(WEEK)
+        self.assertEqual(self.cache.lookup('bucket', OBJECTS, HOUR), {})
+        self.assertEqual(self.cache.longer, 2)
+        self.sign(HOUR)
+        self.assertEqual(self.cache.lookup('bucket', OBJECTS, HOUR)['a.txt'], f'url-a.txt-{HOUR}')
+
+    def test_short_expiry_is_not_reused_for_a_long_one(self):
+        self.sign(HOUR)
+        self.assertEqual(self.cache.lookup('bucket', OBJECTS, WEEK), {})
+        self.assertEqual(self.cache.expiring, 2)
+
+    def test_changed_objects_and_other_access_keys_are_re_signed(self):
+        self.sign(HOUR)
+        changed = [{'Key': 'a.txt', 'ETag': '"9"'}, OBJECTS[1]]
+        self.assertEqual(list(self.cache.lookup('bucket', changed, HOUR)), ['b.txt'])
+        self.cache.access_key = 'AKIA2'
+        self.assertEqual(self.cache.lookup('bucket', OBJECTS, HOUR), {})
+        self.assertEqual((self.cache.changed, self.cache.expiring), (1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
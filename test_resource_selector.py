@@ -0,0 +1,46 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from resource_selector import ResourceIndex, split_terms
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+def resources(*specs):
+    return [{'index': i, 'name': name, 'type': resource_type, 'created': NOW - timedelta(days=age)}
+            for i, (name, resource_type, age) in enumerate(specs, 1)]
+
+
+class SelectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ResourceIndex(resources(
+            ('a', 'Index', 40), ('aa', 'Index', 20), ('aaaa', 'Data Source', 10),
+            ('test-1', 'Data Source', 5), ('Smith, J', 'Agent', 1),
+        ), now=NOW)
+
+    def select(self, expression):
+        return [r['index'] for r in self.index.select(expression)]
+
+    def test_numbers_ranges_and_filters(self):
+        self.assertEqual(self.select("1-2, 5"), [1, 2, 5])
+        self.assertEqual(self.select("type=data-source name=test-*"), [4])
+        self.assertEqual(self.select("created_before=15d, 4"), [1, 2, 4])
+
+    def test_commas_inside_quotes_stay_in_the_term(self):
+        self.assertEqual(self.select('name~"^a{1,2}$"'), [1, 2])
+        self.assertEqual(self.select("name='Smith, J', 1"), [1, 5])
+        self.assertEqual(self.select('type="Data Source", name~\'^a{3,}$\''), [3, 4])
+
+    def test_split_terms(self):
+        self.assertEqual(split_terms('1, name~"a{1,3}" type=x, \'b,c\''),
+                         ['1', ' name~"a{1,3}" type=x', " 'b,c'"])
+
+    def test_errors(self):
+        for expression in ('name~"a{1,3}', 'colour=red', '5-2', 'created_before=soon'):
+            with self.assertRaises(ValueError):
+                self.index.select(expression)
+
+
+if __name__ == '__main__':
+    unittest.main()
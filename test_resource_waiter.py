@@ -0,0 +1,83 @@
+import unittest
+
+from botocore.exceptions import ClientError, EndpointConnectionError
+
+import resource_waiter
+from resource_waiter import DONE, FAILED, TIMED_OUT
+
+
+def client_error(code, status=400):
+    return ClientError({'Error': {'Code': code, 'Message': code},
+                        'ResponseMetadata': {'HTTPStatusCode': status}}, 'Describe')
+
+
+def probe_sequence(*outcomes):
+    """A probe returning (or raising) each outcome in turn, then repeating the last one"""
+    outcomes = list(outcomes)
+
+    def probe(*args):
+        outcome = outcomes.pop(0) if len(outcomes) > 1 else outcomes[0]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    return probe
+
+
+class ResourceWaiterTest(unittest.TestCase):
+
+    def waiter(self, timeout=5):
+        return resource_waiter.ResourceWaiter(base_delay=0.001, max_delay=0.01, timeout=timeout, log=lambda message: None)
+
+    def test_retryable_probe_errors_keep_waiting(self):
+        waiter = self.waiter()
+        waiter.watch('throttled', probe_sequence(client_error('ThrottlingException'),
+                                                 client_error('TooManyRequestsException', 429), True))
+        waiter.watch('disconnected', probe_sequence(EndpointConnectionError(endpoint_url='https://example.com'),
+                                                    client_error('InternalFailure', 500), False, True))
+        results = waiter.run()
+        self.assertEqual({key: state for key, (state, _, _) in results.items()},
+                         {'throttled': DONE, 'disconnected': DONE})
+
+    def test_other_probe_errors_fail(self):
+        waiter = self.waiter()
+        error = client_error('AccessDeniedException')
+        waiter.watch('denied', probe_sequence(error))
+        self.assertEqual(waiter.run()['denied'][:2], (FAILED, error))
+
+    def test_throttled_until_the_deadline_times_out(self):
+        waiter = self.waiter(timeout=0.05)
+        error = client_error('Throttling')
+        waiter.watch('throttled', probe_sequence(error))
+        self.assertEqual(waiter.run()['throttled'][:2], (TIMED_OUT, error))
+
+    def test_retryable_start_errors_are_retried(self):
+        waiter = self.waiter()
+        waiter.watch('conflict', start=probe_sequence(client_error('ConflictException'),
+                                                      client_error('ThrottlingException'), None))
+        # The delete went through before the connection dropped; the retry finds it gone
+        waiter.watch('dropped', probe_sequence(True),
+                     start=probe_sequence(EndpointConnectionError(endpoint_url='https://example.com'),
+                                          client_error('ResourceNotFoundException')))
+        waiter.watch('denied', start=probe_sequence(client_error('AccessDeniedException'), None))
+        self.assertEqual({key: state for key, (state, _, _) in waiter.run().items()},
+                         {'conflict': DONE, 'dropped': DONE, 'denied': FAILED})
+
+    def test_retryable_batch_errors_keep_waiting(self):
+        waiter = self.waiter()
+        batch_probe = probe_sequence(client_error('ThrottlingException'),
+                                     {'a': True, 'b': client_error('RequestLimitExceeded')},
+                                     {'b': True})
+        for key in ('a', 'b'):
+            waiter.watch_batch(key, 'group', batch_probe, batch_size=10)
+        self.assertEqual({key: state for key, (state, _, _) in waiter.run().items()}, {'a': DONE, 'b': DONE})
+
+    def test_failed_batch_call_fails_its_members(self):
+        waiter = self.waiter()
+        error = client_error('ValidationException')
+        for key in ('a', 'b'):
+            waiter.watch_batch(key, 'group', probe_sequence(error), batch_size=10)
+        self.assertEqual({key: state for key, (state, _, _) in waiter.run().items()}, {'a': FAILED, 'b': FAILED})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import boto3
+from moto import mock_aws
+
+import s3_inventory
+
+try:
+    import pyarrow
+    import pyarrow.orc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+ROWS = [('logs/a.txt', 'v1'), ('logs/b c+d.txt', 'v2'), ('old.txt', '')]
+EXPECTED = [
+    {'Key': 'logs/a.txt', 'VersionId': 'v1'},
+    {'Key': 'logs/b c+d.txt', 'VersionId': 'v2'},
+    {'Key': 'old.txt', 'VersionId': 'null'},
+]
+DATA_KEY = 'source-bucket/config/data/{}'
+
+
+def manifest(file_format, data_keys, schema='Bucket, Key, VersionId, IsLatest'):
+    return {
+        'sourceBucket': 'source-bucket',
+        'destinationBucket': 'arn:aws:s3:::inventory-bucket',
+        'fileFormat': file_format,
+        'fileSchema': schema,
+        'files': [{'key': key} for key in data_keys],
+    }
+
+
+def csv_data(rows):
+    text = io.StringIO()
+    writer = csv.writer(text)
+    for key, version_id in rows:
+        # CSV inventories URL-encode key names
+        writer.writerow(['source-bucket', key.replace('+', '%2B').replace(' ', '+'), version_id, 'true'])
+    return gzip.compress(text.getvalue().encode())
+
+
+class LocalManifestTest(unittest.TestCase):
+    """Fixture inventories laid out as they are in the destination bucket, under a temp dir"""
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+
+    def write(self, key, data):
+        path = os.path.join(self.root.name, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as out:
+            out.write(data)
+        return path
+
+    def write_manifest(self, body):
+        return self.write('source-bucket/config/2024-05-01T01-00Z/manifest.json', json.dumps(body).encode())
+
+    def test_csv_across_data_files(self):
+        keys = [DATA_KEY.format('part-1.csv.gz'), DATA_KEY.format('part-2.csv.gz')]
+        self.write(keys[0], csv_data(ROWS[:2]))
+        self.write(keys[1], csv_data(ROWS[2:]))
+        location = self.write_manifest(manifest('CSV', keys))
+        self.assertEqual(list(s3_inventory.iter_inventory_objects(location)), EXPECTED)
+
+    def test_csv_without_versions(self):
+        key = DATA_KEY.format('part-1.csv.gz')
+        text = 'source-bucket,logs/a.txt\nsource-bucket,old.txt\n'
+        self.write(key, gzip.compress(text.encode()))
+        location = self.write_manifest(manifest('CSV', [key], schema='Bucket, Key'))
+        self.assertEqual(list(s3_inventory.iter_inventory_objects(location)),
+                         [{'Key': 'logs/a.txt'}, {'Key': 'old.txt'}])
+
+    def test_rejects_incomplete_manifest(self):
+        body = manifest('CSV', [])
+        del body['fileSchema']
+        with self.assertRaises(ValueError):
+            s3_inventory.load_manifest(self.write_manifest(body))
+
+    def table(self):
+        keys, versions = zip(*ROWS)
+        return pyarrow.table({'bucket': ['source-bucket'] * len(ROWS), 'key': list(keys),
+                              'version_id': [v or None for v in versions]})
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        key = DATA_KEY.format('part-1.parquet')
+        path = self.write(key, b'')
+        pyarrow.parquet.write_table(self.table(), path, row_group_size=2)
+        location = self.write_manifest(manifest('Parquet', [key]))
+        self.assertEqual(list(s3_inventory.iter_inventory_objects(location)), EXPECTED)
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_orc(self):
+        key = DATA_KEY.format('part-1.orc')
+        path = self.write(key, b'')
+        pyarrow.orc.write_table(self.table(), path)
+        location = self.write_manifest(manifest('ORC', [key]))
+        self.assertEqual(list(s3_inventory.iter_inventory_objects(location)), EXPECTED)
+
+
+class S3ManifestTest(unittest.TestCase):
+
+    @mock_aws
+    def test_csv_from_s3(self):
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='inventory-bucket')
+        key = DATA_KEY.format('part-1.csv.gz')
+        s3.put_object(Bucket='inventory-bucket', Key=key, Body=csv_data(ROWS))
+        s3.put_object(Bucket='inventory-bucket', Key='source-bucket/config/manifest.json',
+                      Body=json.dumps(manifest('CSV', [key])))
+        location = 's3://inventory-bucket/source-bucket/config/manifest.json'
+        self.assertEqual(list(s3_inventory.iter_inventory_objects(location, s3)), EXPECTED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import csv
+import os
+import tempfile
+import unittest
+from collections import namedtuple
+
+import ta_export
+
+try:
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+Record = namedtuple('Record', ta_export.EXPORT_FIELDS + ['metadata'])
+
+RECORDS = [
+    Record('111111111111', 'prod', '1MoPEMsKx6', 'Amazon EC2 Reserved Instances Optimization', 'warning',
+           'us-east-1', 'ri-1', 'm5.large', 'm5.large', 50.0, ()),
+    Record('111111111111', 'prod', 'DAvU99Dc4C', 'Underutilized Amazon EBS Volumes', 'warning',
+           'eu-west-1', 'vol-1', 'vol-1', 'gp2', 7.5, ()),
+]
+
+
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.base_path = os.path.join(directory.name, 'findings')
+
+    def test_csv(self):
+        self.assertEqual(ta_export.export(RECORDS, self.base_path, ['csv']), [self.base_path + '.csv'])
+        with open(self.base_path + '.csv', newline='') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0], ta_export.EXPORT_FIELDS)
+        self.assertEqual(rows[1][ta_export.EXPORT_FIELDS.index('resource_id')], 'ri-1')
+        self.assertEqual(rows[2][ta_export.EXPORT_FIELDS.index('savings')], '7.5')
+
+    @unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        ta_export.export(RECORDS, self.base_path, ['parquet'])
+        table = pyarrow.parquet.read_table(self.base_path + '.parquet')
+        self.assertEqual(table.column_names, ta_export.EXPORT_FIELDS)
+        self.assertEqual(str(table.schema.field('savings').type), 'double')
+        self.assertEqual(table.column('resource_name').to_pylist(), ['m5.large', 'vol-1'])
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            ta_export.export(RECORDS, self.base_path, ['xlsx'])
+
+
+if __name__ == '__main__':
+    unittest.main()
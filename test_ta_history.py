@@ -0,0 +1,74 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import ta_history
+
+spec = importlib.util.spec_from_file_location(
+    'get_underutilized_resources', os.path.join(os.path.dirname(__file__), 'get-underutilized-resources.py'))
+script = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(script)
+
+RI_CHECK = '1MoPEMsKx6'
+
+
+def ri_result(*rows):
+    """A Reserved Instances Optimization result: (resource id, region, instance type, platform, savings)"""
+    return {'flaggedResources': [
+        {'resourceId': resource_id, 'status': 'warning', 'region': region,
+         'metadata': [region, instance_type, platform, '', '', f'${savings}']}
+        for resource_id, region, instance_type, platform, savings in rows
+    ]}
+
+
+class HistoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ta_history.HistoryStore(os.path.join(directory.name, 'history.sqlite3'))
+        self.addCleanup(self.store.close)
+
+    def records(self, *rows, account_id='111111111111'):
+        return list(script.iter_flagged_resources(account_id, 'prod', RI_CHECK, ri_result(*rows)))
+
+    def test_findings_sharing_a_display_name_stay_apart(self):
+        records = self.records(('ri-1', 'us-east-1', 'm5.large', 'Linux', 50),
+                               ('ri-2', 'eu-west-1', 'm5.large', 'Linux', 70),
+                               ('ri-3', 'us-east-1', 'm5.large', 'Windows', 90))
+        self.assertEqual(self.store.record_run(records, recorded_at=1), (1, 3))
+        top = self.store.top_savings_by_region(run_id=1)
+        self.assertEqual({region: [f['savings'] for f in findings] for region, findings in top.items()},
+                         {'eu-west-1': [70.0], 'us-east-1': [90.0, 50.0]})
+        self.assertEqual(top['eu-west-1'][0]['resource_name'], 'm5.large')
+
+    def test_duplicates_within_a_run_collapse(self):
+        row = ('ri-1', 'us-east-1', 'm5.large', 'Linux', 50)
+        self.assertEqual(self.store.record_run(self.records(row, row)), (1, 1))
+
+    def test_new_since_last_run(self):
+        self.store.record_run(self.records(('ri-1', 'us-east-1', 'm5.large', 'Linux', 50)), recorded_at=1)
+        run_id, _ = self.store.record_run(self.records(('ri-1', 'us-east-1', 'm5.large', 'Linux', 50),
+                                                       ('ri-2', 'us-east-1', 'm5.large', 'Windows', 20)),
+                                          recorded_at=2)
+        self.assertEqual([f['resource_id'] for f in self.store.new_since_last_run()], ['ri-2'])
+        self.assertEqual(self.store.new_since_last_run(run_id), self.store.new_since_last_run())
+        # The first run has nothing before it, so everything in it is new
+        self.assertEqual([f['resource_id'] for f in self.store.new_since_last_run(1)], ['ri-1'])
+
+    def test_top_n_per_region(self):
+        rows = [(f'ri-{i}', 'us-east-1' if i % 2 else 'eu-west-1', 'm5.large', 'Linux', i * 10) for i in range(1, 8)]
+        rows.append(('ri-0', 'eu-west-1', 'm5.large', 'Linux', 0))  # no savings, never listed
+        self.store.record_run(self.records(*rows))
+        top = self.store.top_savings_by_region(n=2)
+        self.assertEqual({region: [f['resource_id'] for f in findings] for region, findings in top.items()},
+                         {'eu-west-1': ['ri-6', 'ri-4'], 'us-east-1': ['ri-7', 'ri-5']})
+
+    def test_empty_store(self):
+        self.assertEqual(self.store.new_since_last_run(), [])
+        self.assertEqual(self.store.top_savings_by_region(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()